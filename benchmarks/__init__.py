@@ -0,0 +1,16 @@
+# 性能测试套件 - 造数、接口压测与控制器微基准
+#
+# 用法（项目根目录）：
+#     python -m benchmarks --dataset 1k --suites client,http,micro --output results/1k.json
+#     python -m benchmarks.compare results/before.json results/after.json
+import os
+import sys
+
+# 后端源码目录，测试时加入导入路径
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# 造好的数据集保存目录（每次运行复制一份，避免写操作影响下一次结果）
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,139 @@
+# 性能测试入口 - python -m benchmarks --help
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import DATASETS, ensure_dataset
+
+# 可选的测试类型
+SUITES = ('client', 'http', 'micro', 'startup', 'compression')
+
+def _git_commit():
+    """当前代码的提交号，不在git仓库中时返回None"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='联系人接口与控制器性能测试')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='1k',
+                        help='数据集规模（默认1k）')
+    parser.add_argument('--suites', default=','.join(SUITES),
+                        help='逗号分隔的测试类型：client、http、micro、startup、compression')
+    parser.add_argument('--cases', default=None,
+                        help='只执行名称包含这些关键字的用例（逗号分隔）')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='顺序执行时每个用例的请求数')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='并发压测时每个用例的请求总数')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='并发压测的并发连接数')
+    parser.add_argument('--url', default=None,
+                        help='压测已运行的服务（如 http://127.0.0.1:8000），'
+                             '不指定时在本进程内启动服务')
+    parser.add_argument('--seed', type=int, default=0, help='造数随机种子')
+    parser.add_argument('--rebuild', action='store_true', help='重新生成数据集')
+    parser.add_argument('--output', default=None, help='结果JSON文件路径')
+    return parser.parse_args(argv)
+
+def _select(cases, keywords):
+    if not keywords:
+        return cases
+    return [case for case in cases if any(keyword in case.name for keyword in keywords)]
+
+def main(argv=None):
+    args = _parse_args(argv)
+    suites = [suite for suite in args.suites.split(',') if suite]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        sys.exit(f"未知的测试类型: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output) if args.output else None
+    keywords = [keyword for keyword in (args.cases or '').split(',') if keyword]
+
+    # 每次运行使用数据集的副本，写操作不影响下一次运行的结果
+    source = ensure_dataset(args.dataset, seed=args.seed, rebuild=args.rebuild)
+    workdir = tempfile.mkdtemp(prefix='contacts-bench-')
+    shutil.copy(source, os.path.join(workdir, 'contacts.db'))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    results = []
+    try:
+        # 冷启动在子进程中测量，在写操作用例修改数据库之前执行
+        if 'startup' in suites:
+            from benchmarks.startup import STARTUP_ITERATIONS, run_startup
+            results += run_startup(STARTUP_ITERATIONS, cwd=workdir)
+
+        # 数据库文件路径相对于当前目录，切换目录后再导入应用
+        from app import app
+        from benchmarks.load import (
+            ClientTransport, HttpTransport, run_concurrent, run_sequential,
+            start_local_server
+        )
+        from benchmarks.compression import run_compression
+        from benchmarks.micro import run_micro
+        from benchmarks.routes import ROUTE_CASES
+
+        cases = _select(ROUTE_CASES, keywords)
+        if 'client' in suites:
+            results += run_sequential('client', ClientTransport(app), cases, args.iterations)
+        if 'http' in suites:
+            server = None
+            url = args.url
+            if url is None:
+                server, url = start_local_server(app)
+            transport = HttpTransport(url)
+            try:
+                results += run_concurrent('http', transport, cases,
+                                          args.requests, args.concurrency)
+            finally:
+                transport.close()
+                if server is not None:
+                    server.shutdown()
+        if 'micro' in suites:
+            results += run_micro(args.iterations, keywords=keywords)
+        if 'compression' in suites:
+            results += run_compression(ClientTransport(app), args.iterations,
+                                       keywords=keywords)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'git_commit': _git_commit(),
+            'dataset': args.dataset,
+            'contacts': DATASETS[args.dataset],
+            'suites': suites,
+            'iterations': args.iterations,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'url': args.url,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"结果已写入 {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# 准入控制基准 - 导入导出持续占用服务时，测量查询单个联系人的延迟
+#
+# 用法（项目根目录）：
+#     python -m benchmarks.admission --dataset 1k [--duration 20]
+#
+# 分别在关闭和开启准入控制（CONTACTS_ADMISSION）的服务上运行同样的混合负载：
+# BULK_CLIENTS 个客户端循环导出、导入Excel（收到429/503时按 Retry-After 等待），
+# 同时 INTERACTIVE_CLIENTS 个客户端按固定间隔查询随机联系人。每个客户端用
+# 各自的 X-Real-IP（相当于经过Nginx的不同用户）。开启准入控制时交互请求有
+# 失败或p99超过 INTERACTIVE_P99_BUDGET_MS 时返回非零状态码。
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.load import HttpTransport, free_port, start_server_process, wait_until_ready
+from benchmarks.stats import format_result, summarize
+
+# 每种模式的负载持续秒数
+MIXED_DURATION = 20
+
+# 循环导入导出的客户端数（偶数号导出，奇数号导入）
+BULK_CLIENTS = 4
+
+# 查询单个联系人的客户端数
+INTERACTIVE_CLIENTS = 4
+
+# 每个交互客户端两次查询的间隔秒数
+INTERACTIVE_INTERVAL = 0.05
+
+# 开启准入控制时交互请求p99的上限（毫秒）
+INTERACTIVE_P99_BUDGET_MS = 100
+
+# 等待服务启动的最长秒数
+SERVER_TIMEOUT = 120
+
+# 导入请求的multipart分隔符
+_BOUNDARY = 'contacts-admission-benchmark'
+
+def _multipart(filename, data):
+    """把文件编码为 multipart/form-data 请求体"""
+    head = (f'--{_BOUNDARY}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+    return head + data + f'\r\n--{_BOUNDARY}--\r\n'.encode('utf-8')
+
+class _Outcomes:
+    """线程安全地收集请求结果"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def add(self, elapsed=None, error=False, rejected=False):
+        with self._lock:
+            if elapsed is not None:
+                self.latencies.append(elapsed)
+            self.errors += error
+            self.rejected += rejected
+
+def _bulk_client(transport, i, workbook, deadline, outcomes):
+    """循环导出或导入，被拒绝时按 Retry-After 等待"""
+    headers = {'X-Real-IP': f'10.0.1.{i}'}
+    if i % 2:
+        request = ('POST', '/api/contacts/import?mode=upsert', _multipart('contacts.xlsx', workbook),
+                   dict(headers, **{'Content-Type': f'multipart/form-data; boundary={_BOUNDARY}'}))
+    else:
+        request = ('GET', '/api/contacts/export', None, headers)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status, _, response_headers = transport.request(*request)
+        except OSError:
+            outcomes.add(error=True)
+            continue
+        if status in (429, 503):
+            outcomes.add(rejected=True)
+            retry_after = float(response_headers.get('Retry-After', 1))
+            time.sleep(max(0.0, min(retry_after, deadline - time.monotonic())))
+        else:
+            outcomes.add(time.perf_counter() - start, error=status != 200)
+
+def _interactive_client(transport, i, ids, deadline, outcomes):
+    """按固定间隔查询随机联系人"""
+    headers = {'X-Real-IP': f'10.0.2.{i}'}
+    rng = random.Random(i)
+    next_at = time.monotonic()
+    while next_at < deadline:
+        start = time.perf_counter()
+        try:
+            status, _, _ = transport.request('GET', f'/api/contacts/{rng.choice(ids)}',
+                                             headers=headers)
+        except OSError:
+            status = None
+        outcomes.add(time.perf_counter() - start, error=status != 200)
+        next_at += INTERACTIVE_INTERVAL
+        time.sleep(max(0.0, next_at - time.monotonic()))
+
+def run_mixed(cwd, admission, duration=MIXED_DURATION):
+    """在cwd中数据库的副本上运行一轮混合负载，返回 (交互结果, 批量结果)"""
+    mode = 'on' if admission else 'off'
+    workdir = tempfile.mkdtemp(prefix='contacts-admission-')
+    shutil.copy(os.path.join(cwd, 'contacts.db'), os.path.join(workdir, 'contacts.db'))
+    port = free_port()
+    process = start_server_process(workdir, port, os.path.join(workdir, 'server.log'),
+                                   CONTACTS_ADMISSION='1' if admission else '0')
+    transport = HttpTransport(f'http://127.0.0.1:{port}')
+    try:
+        if not wait_until_ready(transport, time.monotonic() + SERVER_TIMEOUT):
+            raise RuntimeError('服务进程未能启动')
+        _, data, _ = transport.request('GET', '/api/contacts?limit=1000')
+        ids = [contact['id'] for contact in json.loads(data)]
+        _, workbook, _ = transport.request('GET', '/api/contacts/export')
+
+        interactive = _Outcomes()
+        bulk = _Outcomes()
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=_bulk_client, args=(transport, i, workbook, deadline, bulk))
+            for i in range(BULK_CLIENTS)
+        ] + [
+            threading.Thread(target=_interactive_client,
+                             args=(transport, i, ids, deadline, interactive))
+            for i in range(INTERACTIVE_CLIENTS)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        transport.close()
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    interactive_result = summarize('mixed', f'interactive_{mode}', interactive.latencies,
+                                   interactive.errors, elapsed)
+    bulk_result = summarize('mixed', f'bulk_{mode}', bulk.latencies, bulk.errors, elapsed)
+    bulk_result['rejected'] = bulk.rejected
+    print(format_result(interactive_result))
+    print(f"{format_result(bulk_result)} rejected={bulk.rejected}")
+    return interactive_result, bulk_result
+
+def main(argv=None):
+    from benchmarks.datasets import DATASETS, ensure_dataset
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.admission',
+                                     description='导入导出与单个查询混合负载下的准入控制测试')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='1k',
+                        help='数据集（默认1k）')
+    parser.add_argument('--duration', type=float, default=MIXED_DURATION,
+                        help='每种模式的负载持续秒数')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='contacts-admission-')
+    try:
+        shutil.copy(ensure_dataset(args.dataset), os.path.join(workdir, 'contacts.db'))
+        run_mixed(workdir, admission=False, duration=args.duration)
+        interactive, _ = run_mixed(workdir, admission=True, duration=args.duration)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if interactive['errors'] or (interactive['p99_ms'] or 0) > INTERACTIVE_P99_BUDGET_MS:
+        print(f"开启准入控制时交互请求失败或p99超过 {INTERACTIVE_P99_BUDGET_MS}ms")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
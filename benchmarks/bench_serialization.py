@@ -0,0 +1,130 @@
+# 序列化基准测试 - 比较联系人列表的几种序列化方式的耗时与内存峰值
+#
+# 用法（项目根目录）：
+#     python benchmarks/bench_serialization.py [--rows 100000] [--json]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+def _seed(rows):
+    """在临时目录中创建数据库并写入测试数据，每个联系人两条联系方式"""
+    from config.database import init_database, write_connection
+    init_database()
+    with write_connection() as conn:
+        conn.executemany(
+            "INSERT INTO contacts (id, name, phone, email, address, is_favorite) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((i, f'联系人{i}', f'138{i:08d}', f'user{i}@example.com',
+              f'某市某区某路{i}号', i % 2) for i in range(1, rows + 1))
+        )
+        conn.executemany(
+            "INSERT INTO contact_methods (contact_id, method_type, method_value, is_primary) "
+            "VALUES (?, ?, ?, ?)",
+            ((i // 2 + 1, '微信' if i % 2 else 'QQ', f'id{i}', i % 2)
+             for i in range(rows * 2))
+        )
+
+def _objects_path():
+    """原实现：每行创建Contact对象，再转成字典，最后整体编码"""
+    from config.database import get_connection
+    from model.contact import Contact
+    with get_connection() as conn:
+        contacts = []
+        for row in conn.execute("SELECT * FROM contacts ORDER BY id").fetchall():
+            contact = Contact(id=row[0], name=row[1], phone=row[2],
+                              email=row[3], address=row[4], is_favorite=row[5])
+            contacts.append(contact.to_dict())
+    return len(json.dumps(contacts))
+
+def _dicts_path():
+    """行直接转字典，再整体编码"""
+    from controller.contact_controller import list_contacts
+    contacts, _ = list_contacts()
+    return len(json.dumps(contacts))
+
+def _stream_path():
+    """流式编码，逐批产出JSON片段"""
+    from controller.contact_controller import stream_contacts
+    return sum(len(chunk) for chunk in stream_contacts())
+
+def _ndjson_path():
+    """流式编码为NDJSON"""
+    from controller.contact_controller import stream_contacts
+    return sum(len(chunk) for chunk in stream_contacts(ndjson=True))
+
+def _stream_with_methods_path():
+    """流式编码并归并联系方式"""
+    from controller.contact_controller import stream_contacts
+    return sum(len(chunk) for chunk in stream_contacts(include_methods=True))
+
+def _dicts_with_methods_path():
+    """行转字典并挂载联系方式，再整体编码"""
+    from controller.contact_controller import list_contacts
+    contacts, _ = list_contacts(include_methods=True)
+    return len(json.dumps(contacts))
+
+CASES = [
+    ('objects', _objects_path),
+    ('row_to_dict', _dicts_path),
+    ('stream', _stream_path),
+    ('ndjson', _ndjson_path),
+    ('row_to_dict+methods', _dicts_with_methods_path),
+    ('stream+methods', _stream_with_methods_path),
+]
+
+def _measure_time(func, repeat):
+    """运行repeat次，返回 (最快一次的秒数, 输出字符数)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, size
+
+def _measure_memory(func):
+    """单独运行一次并跟踪内存分配（跟踪会拖慢执行，不计入耗时），返回峰值MB"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description='联系人列表序列化基准测试')
+    parser.add_argument('--rows', type=int, default=100000, help='联系人数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每种方式运行次数，取最快一次')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args()
+    
+    os.environ.setdefault('CONTACTS_CACHE', '0')
+    os.chdir(tempfile.mkdtemp(prefix='bench_serialization_'))
+    _seed(args.rows)
+    
+    results = []
+    for name, func in CASES:
+        elapsed, size = _measure_time(func, args.repeat)
+        peak = _measure_memory(func)
+        results.append({
+            'case': name,
+            'rows': args.rows,
+            'seconds': round(elapsed, 4),
+            'peak_mb': round(peak, 2),
+            'output_chars': size,
+        })
+    
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"{'方式':<22}{'耗时(s)':>10}{'内存峰值(MB)':>16}")
+    for result in results:
+        print(f"{result['case']:<22}{result['seconds']:>10.3f}{result['peak_mb']:>16.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# 批量导入导出基准 - 对比 xlsx、csv、ndjson（及gzip压缩）的导出与解析耗时
+#
+# 用法（项目根目录）：
+#     python -m benchmarks.bulk --dataset 1m [--write]
+#
+# 每种格式在新进程中从数据集副本导出全部联系人，再解析导出的文件（只解析
+# 不写库）；--write 时再把文件导入一个空数据库。写库的耗时主要是索引和
+# 触发器的维护，各格式相同，只报告不检查。roundtrip 为导出与解析耗时之和
+# （一次同步两端的开销），CSV和NDJSON的 roundtrip 超过 xlsx 的
+# 1/BULK_MIN_SPEEDUP 时返回非零状态码。
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import SRC_DIR
+from benchmarks.stats import format_result, summarize
+
+# 参与对比的格式：(格式, 是否gzip)，第一项为比较基准
+BULK_FORMATS = [
+    ('xlsx', False),
+    ('csv', False),
+    ('csv', True),
+    ('ndjson', False),
+    ('ndjson', True),
+]
+
+# 须达到的加速比（相对xlsx）
+BULK_MIN_SPEEDUP = 10
+
+# 检查加速比的阶段
+CHECKED_PHASES = ('roundtrip',)
+
+# 子进程中执行的测量脚本，最后一行输出JSON结果
+_PROBE = """
+import json, os, sys, time
+from config.database import get_pool
+from controller.bulk_controller import (
+    BULK_IMPORT_BATCH_SIZE, first_data_row, import_file, iter_file_batches,
+    open_text, write_export
+)
+from controller.contact_controller import (
+    IMPORT_BATCH_SIZE, import_workbook, iter_import_batches, write_contacts_workbook
+)
+phase, file_format, compressed, path = json.loads(sys.argv[1])
+# 检查数据库结构（数据集首次使用时执行迁移、空库时建表），不计入耗时
+get_pool()
+if file_format == 'xlsx':
+    from openpyxl import load_workbook
+
+start = time.perf_counter()
+if phase == 'export':
+    if file_format == 'xlsx':
+        rows = write_contacts_workbook(path)
+    else:
+        rows = write_export(path, file_format, compressed)
+elif phase == 'parse':
+    record_error = lambda row_number, message: None
+    if file_format == 'xlsx':
+        workbook = load_workbook(path, read_only=True)
+        batches = iter_import_batches(workbook.active.iter_rows(min_row=2, values_only=True),
+                                      IMPORT_BATCH_SIZE, 2, record_error)
+    else:
+        batches = iter_file_batches(open_text(path), file_format, BULK_IMPORT_BATCH_SIZE,
+                                    first_data_row(file_format), record_error)
+    rows = sum(len(batch) for batch, _ in batches)
+else:
+    if file_format == 'xlsx':
+        report = import_workbook(path)
+    else:
+        report = import_file(path, file_format)
+    rows = report['imported']
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'rows': rows,
+    'bytes': os.path.getsize(path),
+}))
+"""
+
+def _label(file_format, compressed):
+    return file_format + ('.gz' if compressed else '')
+
+def _record(results, baseline, phase, label, seconds, rows, size):
+    """记录一个阶段的结果，第一个格式的耗时作为该阶段的比较基准"""
+    result = summarize('bulk', f'{phase}_{label}', [seconds])
+    result['rows'] = rows
+    result['bytes'] = size
+    result['rows_per_second'] = round(rows / seconds)
+    if not baseline.get(phase):
+        baseline[phase] = seconds
+    result['speedup'] = round(baseline[phase] / seconds, 1)
+    results.append(result)
+    print(f"{format_result(result)} rows/s={result['rows_per_second']} "
+          f"bytes={size} speedup={result['speedup']}x")
+
+def _probe(phase, file_format, compressed, path, cwd):
+    """在新进程中执行一个阶段，返回子进程报告，失败时返回None"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    completed = subprocess.run(
+        [sys.executable, '-c', _PROBE,
+         json.dumps([phase, file_format, compressed, path])],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        print(completed.stderr.strip())
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def run_bulk(cwd, write=False):
+    """在cwd（其中的contacts.db为测试数据库）中依次导出、解析各格式，返回结果列表"""
+    phases = ('export', 'parse', 'import') if write else ('export', 'parse')
+    filedir = tempfile.mkdtemp(prefix='contacts-bulk-')
+    results = []
+    baseline = {}
+    try:
+        for file_format, compressed in BULK_FORMATS:
+            label = _label(file_format, compressed)
+            path = os.path.join(filedir, 'contacts.' + label)
+            reports = {}
+            for phase in phases:
+                # 导入到一个空数据库，不影响后面导出的数据
+                phase_cwd = tempfile.mkdtemp(dir=filedir) if phase == 'import' else cwd
+                report = _probe(phase, file_format, compressed, path, phase_cwd)
+                if report is None:
+                    results.append(summarize('bulk', f'{phase}_{label}', [], errors=1))
+                    continue
+                reports[phase] = report
+                _record(results, baseline, phase, label, report['seconds'],
+                        report['rows'], report['bytes'])
+            if 'export' in reports and 'parse' in reports:
+                _record(results, baseline, 'roundtrip', label,
+                        reports['export']['seconds'] + reports['parse']['seconds'],
+                        reports['parse']['rows'], reports['parse']['bytes'])
+    finally:
+        shutil.rmtree(filedir, ignore_errors=True)
+    return results
+
+def too_slow(results):
+    """CSV、NDJSON中导出加解析未达到 BULK_MIN_SPEEDUP 的结果"""
+    return [result for result in results
+            if result['case'].split('_', 1)[0] in CHECKED_PHASES
+            and not result['case'].endswith('_xlsx')
+            and result.get('speedup') is not None
+            and result['speedup'] < BULK_MIN_SPEEDUP]
+
+def main(argv=None):
+    from benchmarks.datasets import DATASETS, ensure_dataset
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bulk',
+                                     description='批量导入导出格式对比')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='100k',
+                        help='数据集规模（默认100k）')
+    parser.add_argument('--write', action='store_true',
+                        help='同时测量导入到空数据库的耗时（较慢）')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='contacts-bulk-')
+    try:
+        shutil.copy(ensure_dataset(args.dataset), os.path.join(workdir, 'contacts.db'))
+        results = run_bulk(workdir, write=args.write)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = too_slow(results)
+    for result in failures:
+        print(f"{result['case']} 只比xlsx快 {result['speedup']}x，要求 {BULK_MIN_SPEEDUP}x")
+    if failures or any(result['errors'] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# 结果对比 - 比较两次性能测试的结果，延迟回退超过阈值时返回非零状态码
+#
+# 用法：
+#     python -m benchmarks.compare results/before.json results/after.json [--threshold 0.1]
+import argparse
+import json
+import sys
+
+# 参与比较的指标
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'rps')
+
+def load_results(path):
+    """读取结果文件，返回 {(suite, case): 结果}"""
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    return {(result['suite'], result['case']): result for result in report['results']}
+
+def compare(before, after, threshold=0.1, metric='p95_ms'):
+    """逐个用例比较两次结果
+
+    Args:
+        before (dict): 基准结果，load_results 的返回值
+        after (dict): 新结果
+        threshold (float): 判定为回退的相对变化幅度
+        metric (str): 判定回退所用的延迟指标
+
+    Returns:
+        tuple: (对比行列表, 回退的用例列表)
+    """
+    rows = []
+    regressions = []
+    for key in sorted(set(before) | set(after)):
+        old, new = before.get(key), after.get(key)
+        if old is None or new is None:
+            rows.append((key, None, '仅存在于' + ('新结果' if old is None else '基准结果')))
+            continue
+        changes = {}
+        for name in METRICS:
+            if old.get(name) and new.get(name) is not None:
+                changes[name] = (new[name] - old[name]) / old[name]
+        if new.get('errors', 0) > old.get('errors', 0) or \
+                changes.get(metric, 0) > threshold:
+            regressions.append(key)
+        rows.append((key, changes, None))
+    return rows, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='延迟增加超过该比例视为回退（默认0.1）')
+    parser.add_argument('--metric', default='p95_ms', choices=METRICS[:3])
+    args = parser.parse_args(argv)
+
+    rows, regressions = compare(load_results(args.before), load_results(args.after),
+                                args.threshold, args.metric)
+    for (suite, case), changes, note in rows:
+        if note:
+            print(f"{suite:<6} {case:<28} {note}")
+            continue
+        columns = '  '.join(f"{name}={changes[name]:+.1%}" for name in METRICS if name in changes)
+        flag = '  <-- 回退' if (suite, case) in regressions else ''
+        print(f"{suite:<6} {case:<28} {columns}{flag}")
+
+    if regressions:
+        print(f"{len(regressions)} 个用例回退超过 {args.threshold:.0%}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# 压缩基准 - 对比 identity、gzip、br 三种编码下的响应字节数和服务端耗时
+#
+# 由 python -m benchmarks --suites compression 执行，结果中的 bytes 为
+# 响应正文字节数，transfer_ms 为按 LINK_MBPS 估算的传输时间。
+import time
+
+from benchmarks.load import HEAVY_ITERATIONS
+from benchmarks.stats import format_result, summarize
+
+# 估算传输时间所用的链路带宽（Mbit/s）
+LINK_MBPS = 10
+
+# (用例名, 路径, 是否heavy)
+COMPRESSION_CASES = [
+    ('list_page', '/api/contacts?limit=50', False),
+    ('list_page_100', '/api/contacts?limit=100', False),
+    ('list_page_methods', '/api/contacts?limit=50&include=methods', False),
+    ('favorites_page', '/api/contacts/favorites?limit=50', False),
+    ('search_name', '/api/contacts/search?q=%E5%BC%A0%E4%BC%9F', False),
+    ('list_full', '/api/contacts', True),
+]
+
+def _encodings():
+    """参与对比的编码，未安装brotli时不测br"""
+    from config.compression import supported_encodings
+    return ('identity',) + tuple(reversed(supported_encodings()))
+
+def _transfer_ms(size):
+    return round(size * 8 / (LINK_MBPS * 1000 * 1000) * 1000, 3)
+
+def run_compression(transport, iterations, warmup=5, keywords=None):
+    """逐个用例、逐个编码顺序请求，返回结果列表"""
+    results = []
+    for name, path, heavy in COMPRESSION_CASES:
+        if keywords and not any(keyword in name for keyword in keywords):
+            continue
+        count = HEAVY_ITERATIONS if heavy else iterations
+        for encoding in _encodings():
+            headers = {'Accept-Encoding': encoding}
+            for _ in range(0 if heavy else warmup):
+                transport.request('GET', path, headers=headers)
+            latencies = []
+            errors = 0
+            size = 0
+            for _ in range(count):
+                start = time.perf_counter()
+                status, data, response_headers = transport.request('GET', path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                served = response_headers.get('Content-Encoding', 'identity')
+                # 小于最小压缩字节数的响应原样返回，不算错误
+                errors += status != 200 or served not in (encoding, 'identity')
+                size = len(data)
+            result = summarize('compression', f'{name}/{encoding}', latencies, errors)
+            result['bytes'] = size
+            result['transfer_ms'] = _transfer_ms(size)
+            results.append(result)
+            print(f"{format_result(result)} bytes={size} transfer={result['transfer_ms']}ms")
+    return results
@@ -0,0 +1,193 @@
+# 接口压测 - 通过Flask测试客户端顺序执行，或通过本地HTTP服务并发执行
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks import SRC_DIR
+from benchmarks.routes import build_context
+from benchmarks.stats import format_result, summarize
+
+# heavy用例（全量列表、导出、导入）的执行次数
+HEAVY_ITERATIONS = 3
+
+# 在子进程中启动应用的脚本（参数为端口，使用工作目录下的contacts.db）
+SERVE_SCRIPT = """
+import sys
+from werkzeug.serving import WSGIRequestHandler, run_simple
+WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+from app import app
+run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)
+"""
+
+class ClientTransport:
+    """Flask测试客户端：不经过网络，测量路由和控制器本身的开销"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回 (状态码, 响应体字节, 响应头字典)"""
+        response = self.client.open(path, method=method, data=body,
+                                    headers=headers or {})
+        # 读完整个响应体（流式响应在这里才真正生成）
+        data = response.get_data()
+        response.close()
+        return response.status_code, data, dict(response.headers)
+
+    def close(self):
+        pass
+
+class HttpTransport:
+    """HTTP客户端：每个线程复用一个keep-alive连接"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=600)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回 (状态码, 响应体字节, 响应头字典)"""
+        conn = self._connection()
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers or {})
+            response = conn.getresponse()
+        except (ConnectionError, http.client.HTTPException):
+            # 服务端关闭了空闲连接，重连后重试一次
+            conn.close()
+            conn.request(method, self.prefix + path, body=body, headers=headers or {})
+            response = conn.getresponse()
+        data = response.read()
+        return response.status, data, dict(response.getheaders())
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+def start_local_server(app):
+    """在后台线程中启动多线程WSGI服务（随机端口），返回 (服务, 基础URL)"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def free_port():
+    """返回本机一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_process(cwd, args, log_path, **env):
+    """在cwd中启动Python子进程（可导入后端源码），输出追加到log_path"""
+    os.makedirs(cwd, exist_ok=True)
+    with open(log_path, 'ab') as log:
+        return subprocess.Popen(
+            [sys.executable] + args, cwd=cwd, stdout=log, stderr=subprocess.STDOUT,
+            env=dict(os.environ, PYTHONPATH=SRC_DIR, **env)
+        )
+
+def start_server_process(cwd, port, log_path, **env):
+    """在子进程中启动多线程WSGI服务，env为额外的环境变量"""
+    return start_process(cwd, ['-c', SERVE_SCRIPT, str(port)], log_path, **env)
+
+def wait_until_ready(transport, deadline):
+    """等待服务开始响应，到deadline（time.monotonic）仍未响应时返回False"""
+    while time.monotonic() < deadline:
+        try:
+            transport.request('GET', '/api/contacts?limit=1')
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def _prepare(case, transport, ctx, count):
+    """执行用例的准备步骤，并为ETag用例补上条件请求头"""
+    if case.prepare:
+        case.prepare(transport, ctx, count)
+    if 'etag' in ctx and case.expect == (304,):
+        case.headers['If-None-Match'] = ctx['etag']
+
+def _timed_request(transport, case, ctx, i):
+    """执行一次请求，返回 (耗时秒, 是否成功)"""
+    method, path, body, headers = case.build(ctx, i)
+    start = time.perf_counter()
+    try:
+        status, _, _ = transport.request(method, path, body, headers)
+    except (OSError, http.client.HTTPException):
+        return time.perf_counter() - start, False
+    return time.perf_counter() - start, status in case.expect
+
+def run_sequential(suite, transport, cases, iterations, warmup=5):
+    """逐个用例顺序执行，返回结果列表"""
+    ctx = build_context(transport)
+    results = []
+    for case in cases:
+        count = HEAVY_ITERATIONS if case.heavy else iterations
+        warm = 0 if case.heavy else warmup
+        _prepare(case, transport, ctx, count + warm)
+
+        for i in range(warm):
+            _timed_request(transport, case, ctx, i)
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for i in range(warm, warm + count):
+            elapsed, ok = _timed_request(transport, case, ctx, i)
+            latencies.append(elapsed)
+            errors += not ok
+        result = summarize(suite, case.name, latencies, errors,
+                           time.perf_counter() - start)
+        results.append(result)
+        print(format_result(result))
+    return results
+
+def run_concurrent(suite, transport, cases, requests, concurrency):
+    """每个用例用concurrency个线程共发出requests个请求（跳过heavy用例）"""
+    ctx = build_context(transport)
+    results = []
+    for case in cases:
+        if case.heavy:
+            continue
+        _prepare(case, transport, ctx, requests)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(
+                lambda i: _timed_request(transport, case, ctx, i), range(requests)
+            ))
+        wall = time.perf_counter() - start
+
+        latencies = [elapsed for elapsed, _ in outcomes]
+        errors = sum(1 for _, ok in outcomes if not ok)
+        result = summarize(suite, case.name, latencies, errors, wall)
+        result['concurrency'] = concurrency
+        results.append(result)
+        print(format_result(result))
+    return results
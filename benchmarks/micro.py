@@ -0,0 +1,88 @@
+# 控制器微基准 - 直接调用控制器函数，不经过HTTP和路由
+import io
+import time
+
+from benchmarks.routes import build_import_csv, build_import_workbook
+from benchmarks.stats import format_result, summarize
+
+def _sample_ids(count):
+    """读取样本联系人ID"""
+    from config.database import get_connection
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT id FROM contacts ORDER BY random() LIMIT ?", (count,)
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def _drain(iterable):
+    """消费完流式输出"""
+    for _ in iterable:
+        pass
+
+def build_micro_cases():
+    """返回 [(用例名, 调用函数(i), 是否heavy)]"""
+    from config.cache import get_cache
+    from controller import bulk_controller as bc
+    from controller import contact_controller as cc
+    from controller import dedupe_controller as dc
+
+    ids = _sample_ids(1000) or [1]
+    pick = lambda i: ids[i % len(ids)]
+    workbook_bytes = build_import_workbook()
+    csv_bytes = build_import_csv()
+
+    def get_contact_cold(i):
+        get_cache().clear()
+        cc.get_contact_by_id(pick(i))
+
+    return [
+        ('get_contact_by_id_cold', get_contact_cold, False),
+        ('get_contact_by_id_cached', lambda i: cc.get_contact_by_id(ids[0]), False),
+        ('get_contact_methods', lambda i: cc.get_contact_methods(pick(i)), False),
+        ('list_contacts_page', lambda i: cc.list_contacts(limit=50, after_id=pick(i)), False),
+        ('list_contacts_page_methods',
+         lambda i: cc.list_contacts(limit=50, after_id=pick(i), include_methods=True), False),
+        ('list_contacts_q', lambda i: cc.list_contacts(q=str(i % 10), limit=50), False),
+        ('search_contacts', lambda i: cc.search_contacts(f'王{i % 10}'), False),
+        ('get_changes', lambda i: cc.get_changes(0, limit=100), False),
+        ('patch_contact', lambda i: cc.patch_contact(pick(i), {'address': f'补丁路{i}号'}), False),
+        ('toggle_favorite', lambda i: cc.toggle_favorite(pick(i)), False),
+        ('favorites_page',
+         lambda i: cc.get_favorite_contacts(limit=50, after_rank=float(pick(i))), False),
+        ('stream_contacts', lambda i: _drain(cc.stream_contacts()), True),
+        ('stream_contacts_methods',
+         lambda i: _drain(cc.stream_contacts(include_methods=True)), True),
+        ('write_contacts_workbook', lambda i: cc.write_contacts_workbook(io.BytesIO()), True),
+        ('export_csv', lambda i: _drain(bc.stream_export('csv')), True),
+        ('export_ndjson', lambda i: _drain(bc.stream_export('ndjson')), True),
+        ('import_workbook', lambda i: cc.import_workbook(io.BytesIO(workbook_bytes)), True),
+        ('import_workbook_upsert',
+         lambda i: cc.import_workbook(io.BytesIO(workbook_bytes), upsert=True), True),
+        ('import_csv', lambda i: bc.import_file(io.BytesIO(csv_bytes), 'csv'), True),
+        ('find_duplicate_clusters', lambda i: dc.find_duplicate_clusters(), True),
+    ]
+
+def run_micro(iterations, heavy_iterations=3, warmup=5, keywords=None):
+    """顺序执行微基准（keywords非空时只执行名称包含其中任一关键字的用例）"""
+    results = []
+    for name, func, heavy in build_micro_cases():
+        if keywords and not any(keyword in name for keyword in keywords):
+            continue
+        count = heavy_iterations if heavy else iterations
+        for i in range(0 if heavy else warmup):
+            func(i)
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for i in range(count):
+            call_start = time.perf_counter()
+            try:
+                func(i)
+            except Exception as e:
+                print(f"{name} 执行错误: {e}")
+                errors += 1
+            latencies.append(time.perf_counter() - call_start)
+        result = summarize('micro', name, latencies, errors, time.perf_counter() - start)
+        results.append(result)
+        print(format_result(result))
+    return results
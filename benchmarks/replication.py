@@ -0,0 +1,190 @@
+# 复制基准 - 在本机启动主库、副本和同步进程，测量初始同步、复制延迟与读己之写
+#
+# 用法（项目根目录）：
+#     python -m benchmarks.replication --dataset 1k [--writes 200]
+#
+# 主库使用数据集副本，副本从空库开始同步（bootstrap）。追上后向主库逐个
+# 写入，记录副本的日志位置追上写入的耗时（lag）；再写入后立即带上
+# X-Log-Position 从副本读取刚写入的联系人（read_your_writes）。副本返回
+# 旧数据时记为错误，有错误时返回非零状态码。
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import SRC_DIR
+from benchmarks.load import (
+    HttpTransport,
+    free_port,
+    start_process,
+    start_server_process,
+    wait_until_ready
+)
+from benchmarks.stats import format_result, summarize
+
+# 默认的写入次数
+REPLICATION_WRITES = 200
+
+# 等待进程启动、副本追上的最长秒数
+REPLICATION_TIMEOUT = 600
+
+# 副本同步进程的轮询间隔（秒）
+TAILER_POLL_INTERVAL = '0.02'
+
+class _Cluster:
+    """本机的主库、副本和同步进程"""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.processes = []
+        self.primary_port = free_port()
+        self.replica_port = free_port()
+        self.primary_url = f'http://127.0.0.1:{self.primary_port}'
+        self.replica_url = f'http://127.0.0.1:{self.replica_port}'
+
+    def _log(self, name):
+        return os.path.join(self.workdir, f'{name}.log')
+
+    def start_servers(self):
+        self.processes.append(start_server_process(
+            os.path.join(self.workdir, 'primary'), self.primary_port, self._log('primary'),
+            CONTACTS_REPLICATION_ROLE='primary'
+        ))
+        self.processes.append(start_server_process(
+            os.path.join(self.workdir, 'replica'), self.replica_port, self._log('replica'),
+            CONTACTS_REPLICATION_ROLE='replica', CONTACTS_PRIMARY_URL=self.primary_url
+        ))
+
+    def start_tailer(self):
+        self.processes.append(start_process(
+            os.path.join(self.workdir, 'replica'),
+            [os.path.join(SRC_DIR, 'replica.py'), '--primary', self.primary_url],
+            self._log('replica'), CONTACTS_REPLICATION_POLL_INTERVAL=TAILER_POLL_INTERVAL
+        ))
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+def _replica_position(replica):
+    """副本当前的日志位置（副本的读响应都带 X-Log-Position）"""
+    status, _, headers = replica.request('GET', '/api/contacts?limit=1')
+    return int(headers.get('X-Log-Position', 0)) if status == 200 else 0
+
+def _wait_position(replica, position, deadline):
+    while time.monotonic() < deadline:
+        if _replica_position(replica) >= position:
+            return True
+        time.sleep(0.005)
+    return False
+
+def _write(primary, i):
+    """向主库新增一个联系人，返回 (联系人ID, 姓名, 日志位置)"""
+    name = f'复制测试{i}'
+    body = json.dumps({'name': name, 'phone': f'1390000{i:04d}'}).encode('utf-8')
+    status, data, headers = primary.request('POST', '/api/contacts', body=body,
+                                            headers={'Content-Type': 'application/json'})
+    if status != 201:
+        return None, name, None
+    return json.loads(data)['id'], name, int(headers['X-Log-Position'])
+
+def run_replication(cwd, writes=REPLICATION_WRITES):
+    """在cwd（其中的contacts.db为主库的初始数据）中测量，返回结果列表"""
+    workdir = tempfile.mkdtemp(prefix='contacts-replication-')
+    os.makedirs(os.path.join(workdir, 'primary'))
+    shutil.copy(os.path.join(cwd, 'contacts.db'), os.path.join(workdir, 'primary', 'contacts.db'))
+    cluster = _Cluster(workdir)
+    primary = HttpTransport(cluster.primary_url)
+    replica = HttpTransport(cluster.replica_url)
+    results = []
+    try:
+        cluster.start_servers()
+        deadline = time.monotonic() + REPLICATION_TIMEOUT
+        if not (wait_until_ready(primary, deadline) and wait_until_ready(replica, deadline)):
+            raise RuntimeError('主库或副本进程未能启动')
+
+        # 初始同步：副本从空库追上主库
+        status, _, headers = primary.request('GET', '/api/contacts?limit=1')
+        target = int(headers.get('X-Change-Version', 0))
+        start = time.perf_counter()
+        cluster.start_tailer()
+        synced = _wait_position(replica, target, deadline)
+        result = summarize('replication', 'bootstrap', [time.perf_counter() - start],
+                           errors=0 if synced else 1)
+        result['log_position'] = target
+        results.append(result)
+        print(f"{format_result(result)} log_position={target}")
+
+        # 复制延迟：写入到副本日志位置追上
+        lags = []
+        errors = 0
+        for i in range(writes):
+            _, _, position = _write(primary, i)
+            written = time.perf_counter()
+            if position is None or not _wait_position(replica, position, deadline):
+                errors += 1
+                continue
+            lags.append(time.perf_counter() - written)
+        result = summarize('replication', 'lag', lags, errors)
+        results.append(result)
+        print(format_result(result))
+
+        # 读己之写：写入后立即带日志位置从副本读取
+        latencies = []
+        errors = 0
+        redirects = 0
+        for i in range(writes, writes * 2):
+            contact_id, name, position = _write(primary, i)
+            if contact_id is None:
+                errors += 1
+                continue
+            start = time.perf_counter()
+            status, data, _ = replica.request(
+                'GET', f'/api/contacts/{contact_id}',
+                headers={'X-Log-Position': str(position)}
+            )
+            latencies.append(time.perf_counter() - start)
+            if status == 307:
+                # 副本未在等待时间内追上，重定向到主库（结果仍然正确）
+                redirects += 1
+            elif status != 200 or json.loads(data)['name'] != name:
+                errors += 1
+        result = summarize('replication', 'read_your_writes', latencies, errors)
+        result['redirects'] = redirects
+        results.append(result)
+        print(f"{format_result(result)} redirects={redirects}")
+    finally:
+        primary.close()
+        replica.close()
+        cluster.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main(argv=None):
+    from benchmarks.datasets import DATASETS, ensure_dataset
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replication',
+                                     description='主从复制延迟与读己之写测试')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='1k',
+                        help='主库的初始数据集（默认1k）')
+    parser.add_argument('--writes', type=int, default=REPLICATION_WRITES,
+                        help='测量复制延迟和读己之写时各写入的次数')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='contacts-replication-')
+    try:
+        shutil.copy(ensure_dataset(args.dataset), os.path.join(workdir, 'contacts.db'))
+        results = run_replication(workdir, args.writes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if any(result['errors'] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# 接口用例 - 覆盖 src/app.py 中的每个路由
+import io
+import json
+import random
+import time
+import uuid
+
+# 导入用例上传的Excel行数
+IMPORT_ROWS = 1000
+
+# 等待后台任务完成的最长秒数
+JOB_WAIT_SECONDS = 600
+
+class RouteCase:
+    """一个接口的测试用例
+
+    path和body可以是固定值，也可以是 callable(ctx, i)，按第i次请求生成；
+    prepare(transport, ctx, n) 在计时前为n次请求准备数据（如待删除的
+    联系人），结果写入ctx。heavy用例单次耗时与数据集规模成正比，只
+    执行少量次数，压测时跳过。
+    """
+
+    def __init__(self, name, method, path, body=None, headers=None,
+                 prepare=None, expect=(200,), heavy=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+        self.prepare = prepare
+        self.expect = expect
+        self.heavy = heavy
+
+    def build(self, ctx, i):
+        """生成第i次请求：(方法, 路径, 请求体字节, 请求头)"""
+        path = self.path(ctx, i) if callable(self.path) else self.path
+        body = self.body(ctx, i) if callable(self.body) else self.body
+        headers = dict(self.headers)
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif isinstance(body, tuple):
+            # (字节, Content-Type)
+            body, headers['Content-Type'] = body
+        return self.method, path, body, headers
+
+def request_json(transport, method, path, payload=None, headers=None):
+    """发送请求并解析JSON响应，返回 (状态码, 数据)"""
+    headers = dict(headers or {})
+    body = None
+    if payload is not None:
+        body = json.dumps(payload).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    status, data, _ = transport.request(method, path, body, headers)
+    return status, json.loads(data) if data else None
+
+def build_context(transport, sample_size=1000, seed=0):
+    """读取样本联系人ID，作为读写用例的目标"""
+    rng = random.Random(seed)
+    ids = []
+    after_id = None
+    # 按游标分页取前若干页，再随机抽样
+    while len(ids) < sample_size * 5:
+        query = '/api/contacts?limit=500' + (f'&after_id={after_id}' if after_id else '')
+        status, page = request_json(transport, 'GET', query)
+        if status != 200 or not page:
+            break
+        ids.extend(contact['id'] for contact in page)
+        after_id = page[-1]['id']
+    if not ids:
+        # 空库时先造一批联系人
+        _create_contacts(transport, {}, sample_size)
+        return build_context(transport, sample_size, seed)
+
+    sample = [rng.choice(ids) for _ in range(sample_size)]
+    return {
+        'rng': rng,
+        'contact_ids': sample,
+        'method_contact_id': sample[0],
+    }
+
+def _pick(ctx, i):
+    """第i次请求的目标联系人ID"""
+    ids = ctx['contact_ids']
+    return ids[i % len(ids)]
+
+def _contact_body(i):
+    return {
+        'name': f'压测联系人{i}',
+        'phone': f'139{i:08d}',
+        'email': f'bench{i}@example.com',
+        'address': '压测路1号',
+    }
+
+def _create_contacts(transport, ctx, n):
+    """通过批量接口创建n个联系人，ID写入ctx['created_ids']"""
+    created = []
+    while len(created) < n:
+        count = min(500, n - len(created))
+        operations = [{'op': 'create', 'data': _contact_body(i)} for i in range(count)]
+        status, data = request_json(transport, 'POST', '/api/batch',
+                                    {'operations': operations})
+        if status != 200:
+            raise RuntimeError(f'准备数据失败: {data}')
+        created.extend(result['id'] for result in data['results'])
+    ctx['created_ids'] = created
+
+def _create_methods(transport, ctx, n):
+    """为同一个联系人创建n条联系方式，ID写入ctx['created_method_ids']"""
+    contact_id = ctx['method_contact_id']
+    created = []
+    while len(created) < n:
+        count = min(500, n - len(created))
+        operations = [
+            {'op': 'create_method', 'contact_id': contact_id,
+             'data': {'method_type': 'QQ', 'method_value': f'bench{i}'}}
+            for i in range(count)
+        ]
+        status, data = request_json(transport, 'POST', '/api/batch',
+                                    {'operations': operations})
+        if status != 200:
+            raise RuntimeError(f'准备数据失败: {data}')
+        created.extend(result['id'] for result in data['results'])
+    ctx['created_method_ids'] = created
+
+def _create_method_target(transport, ctx, n):
+    """创建一条联系方式作为更新用例的目标（其他写用例可能已替换原有联系方式）"""
+    _create_methods(transport, ctx, 1)
+    ctx['method_id'] = ctx.pop('created_method_ids')[0]
+
+def _fetch_etag(transport, ctx, n):
+    """读取列表当前的ETag"""
+    _, _, headers = transport.request('GET', '/api/contacts?limit=50', None, {})
+    ctx['etag'] = headers.get('ETag') or headers.get('etag')
+
+def _fetch_favorites(transport, ctx, n):
+    """读取一页收藏的联系人ID，作为调整顺序用例的目标"""
+    _, data = request_json(transport, 'GET', '/api/contacts/favorites?limit=100')
+    ctx['favorite_ids'] = [contact['id'] for contact in data]
+
+def _favorite_pick(ctx, i):
+    favorite_ids = ctx['favorite_ids']
+    return favorite_ids[i % len(favorite_ids)]
+
+def _submit_export_job(transport, ctx, n):
+    """创建后台导出任务"""
+    status, data = request_json(transport, 'GET', '/api/contacts/export?async=1')
+    ctx['job_id'] = data['job_id']
+
+def _finished_export_job(transport, ctx, n):
+    """创建后台导出任务并等待完成"""
+    _submit_export_job(transport, ctx, n)
+    deadline = time.monotonic() + JOB_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        status, job = request_json(transport, 'GET', f"/api/jobs/{ctx['job_id']}")
+        if job['status'] in ('succeeded', 'failed'):
+            return
+        time.sleep(0.2)
+    raise RuntimeError('等待导出任务超时')
+
+def build_import_workbook(rows=IMPORT_ROWS):
+    """生成导入用例使用的Excel文件内容"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    worksheet.append(['ID', '姓名', '主要电话', '电子邮箱', '地址', '是否收藏', '其他联系方式'])
+    for i in range(rows):
+        worksheet.append(['', f'导入联系人{i}', f'137{i:08d}', f'import{i}@example.com',
+                          '导入路1号', '否', f'微信: wx{i}; QQ: {i}'])
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+def build_import_csv(rows=IMPORT_ROWS):
+    """生成与 build_import_workbook 内容相同的CSV文件内容"""
+    import csv
+    content = io.StringIO()
+    writer = csv.writer(content)
+    writer.writerow(['ID', '姓名', '主要电话', '电子邮箱', '地址', '是否收藏', '其他联系方式'])
+    for i in range(rows):
+        writer.writerow(['', f'导入联系人{i}', f'137{i:08d}', f'import{i}@example.com',
+                         '导入路1号', '否', f'微信: wx{i}; QQ: {i}'])
+    return content.getvalue().encode('utf-8')
+
+def build_import_file(rows=IMPORT_ROWS):
+    """把导入用例的Excel文件包装为multipart请求体，返回 (请求体, Content-Type)"""
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="bench.xlsx"\r\n'
+        'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n'
+        '\r\n'
+    ).encode('utf-8') + build_import_workbook(rows) + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def _prepare_import_file(transport, ctx, n):
+    ctx['import_file'] = build_import_file()
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+# 读接口用例在前，写接口在后，避免写操作改变读用例的数据
+READ_CASES = [
+    RouteCase('list_page', 'GET', '/api/contacts?limit=50'),
+    RouteCase('list_page_after_id', 'GET',
+              lambda ctx, i: f'/api/contacts?limit=50&after_id={_pick(ctx, i)}'),
+    RouteCase('list_page_methods', 'GET', '/api/contacts?limit=50&include=methods'),
+    RouteCase('list_page_ndjson', 'GET', '/api/contacts?limit=50', headers=NDJSON),
+    RouteCase('list_filter_q', 'GET', '/api/contacts?limit=50&q=%E7%8E%8B'),
+    RouteCase('list_filter_favorite', 'GET', '/api/contacts?limit=50&favorite=1'),
+    RouteCase('favorites_page', 'GET', '/api/contacts/favorites?limit=50'),
+    RouteCase('list_not_modified', 'GET', '/api/contacts?limit=50',
+              prepare=_fetch_etag, expect=(304,)),
+    RouteCase('search_name', 'GET', '/api/contacts/search?q=%E5%BC%A0%E4%BC%9F'),
+    RouteCase('search_phone_suffix', 'GET', '/api/contacts/search?q=1234'),
+    RouteCase('changes', 'GET', '/api/contacts/changes?since=0&limit=100'),
+    RouteCase('get_contact', 'GET', lambda ctx, i: f'/api/contacts/{_pick(ctx, i)}'),
+    RouteCase('get_methods', 'GET', lambda ctx, i: f'/api/contacts/{_pick(ctx, i)}/methods'),
+    RouteCase('cache_stats', 'GET', '/api/cache/stats'),
+    RouteCase('preflight', 'OPTIONS', '/api/contacts',
+              headers={'Origin': 'http://localhost', 'Access-Control-Request-Method': 'GET'}),
+    RouteCase('list_full', 'GET', '/api/contacts', heavy=True),
+    RouteCase('list_full_ndjson', 'GET', '/api/contacts', headers=NDJSON, heavy=True),
+    RouteCase('list_full_methods', 'GET', '/api/contacts?include=methods', heavy=True),
+    RouteCase('favorites', 'GET', '/api/contacts/favorites', heavy=True),
+    RouteCase('export', 'GET', '/api/contacts/export', heavy=True),
+]
+
+WRITE_CASES = [
+    RouteCase('create_contact', 'POST', '/api/contacts',
+              body=lambda ctx, i: _contact_body(i), expect=(201,)),
+    RouteCase('update_contact', 'PUT', lambda ctx, i: f'/api/contacts/{_pick(ctx, i)}',
+              body=lambda ctx, i: _contact_body(i)),
+    RouteCase('patch_contact', 'PATCH', lambda ctx, i: f'/api/contacts/{_pick(ctx, i)}',
+              body=lambda ctx, i: {'address': f'补丁路{i}号', 'methods': [
+                  {'method_type': '微信', 'method_value': f'wx{i}', 'is_primary': 1},
+                  {'method_type': 'QQ', 'method_value': str(i)},
+              ]}),
+    RouteCase('toggle_favorite', 'PUT',
+              lambda ctx, i: f'/api/contacts/{_pick(ctx, i)}/favorite'),
+    RouteCase('move_favorite', 'PUT',
+              lambda ctx, i: f'/api/contacts/{_favorite_pick(ctx, i)}/favorite/position',
+              body=lambda ctx, i: {'before_id': _favorite_pick(ctx, i * 7 + 3)},
+              prepare=_fetch_favorites),
+    RouteCase('create_method', 'POST',
+              lambda ctx, i: f"/api/contacts/{ctx['method_contact_id']}/methods",
+              body=lambda ctx, i: {'method_type': '邮箱', 'method_value': f'm{i}@example.com'},
+              expect=(201,)),
+    RouteCase('update_method', 'PUT', lambda ctx, i: f"/api/contacts/methods/{ctx['method_id']}",
+              body=lambda ctx, i: {'method_type': '微信', 'method_value': f'wx{i}'},
+              prepare=_create_method_target),
+    RouteCase('delete_method', 'DELETE',
+              lambda ctx, i: f"/api/contacts/methods/{ctx['created_method_ids'][i]}",
+              prepare=_create_methods),
+    RouteCase('delete_contact', 'DELETE',
+              lambda ctx, i: f"/api/contacts/{ctx['created_ids'][i]}",
+              prepare=_create_contacts),
+    RouteCase('batch_10_ops', 'POST', '/api/batch',
+              body=lambda ctx, i: {'operations': [
+                  {'op': 'favorite', 'id': _pick(ctx, i * 10 + k)} for k in range(10)
+              ]}),
+    RouteCase('job_status', 'GET', lambda ctx, i: f"/api/jobs/{ctx['job_id']}",
+              prepare=_submit_export_job),
+    RouteCase('import', 'POST', '/api/contacts/import',
+              body=lambda ctx, i: ctx['import_file'], prepare=_prepare_import_file,
+              heavy=True),
+    RouteCase('export_async_submit', 'GET', '/api/contacts/export?async=1',
+              expect=(202,), heavy=True),
+    RouteCase('dedupe_submit', 'POST', '/api/contacts/dedupe', body={'merge': False},
+              expect=(202,), heavy=True),
+    RouteCase('job_result', 'GET', lambda ctx, i: f"/api/jobs/{ctx['job_id']}/result",
+              prepare=_finished_export_job, heavy=True),
+]
+
+ROUTE_CASES = READ_CASES + WRITE_CASES
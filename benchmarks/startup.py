@@ -0,0 +1,134 @@
+# 启动基准 - 在新进程中测量导入应用和处理第一个请求的耗时（冷启动）
+#
+# 用法（项目根目录）：
+#     python -m benchmarks.startup --dataset 100k [--iterations 10]
+#
+# 任一阶段的p50超出 STARTUP_BUDGETS_MS 中的预算时返回非零状态码。
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import SRC_DIR
+from benchmarks.stats import format_result, summarize
+
+# 各阶段的耗时预算（毫秒）
+#   process_boot:  从启动解释器到进程退出（worker启动的总开销）
+#   import_app:    import app
+#   first_request: 第一个请求（检查数据库结构、创建连接池、接管任务）
+STARTUP_BUDGETS_MS = {
+    'process_boot': 1000,
+    'import_app': 300,
+    'first_request': 100,
+}
+
+# 默认的测量次数（每次启动一个新进程）
+STARTUP_ITERATIONS = 10
+
+# 导入应用时不应加载的模块，只在第一次导入导出Excel时加载
+LAZY_MODULES = ('openpyxl',)
+
+# 子进程中执行的测量脚本，最后一行输出JSON结果
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+lazy_loaded = [name for name in {lazy!r} if name in sys.modules]
+pool_created = sys.modules['config.database']._pool is not None
+status = app.app.test_client().get('/api/contacts?limit=1').status_code
+print(json.dumps({{
+    'import_app': imported - start,
+    'first_request': time.perf_counter() - imported,
+    'status': status,
+    'lazy_loaded': lazy_loaded,
+    'pool_created_on_import': pool_created,
+}}))
+"""
+
+def _probe(cwd):
+    """启动一个进程完成一次冷启动，返回 (进程总耗时, 子进程报告)"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(lazy=LAZY_MODULES)],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        print(completed.stderr.strip())
+        return elapsed, None
+    return elapsed, json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _problems(report):
+    """冷启动报告中不符合预期的地方"""
+    if report is None:
+        return ['进程异常退出']
+    problems = []
+    if report['status'] != 200:
+        problems.append(f"第一个请求返回 {report['status']}")
+    if report['lazy_loaded']:
+        problems.append(f"导入应用时加载了 {', '.join(report['lazy_loaded'])}")
+    if report['pool_created_on_import']:
+        problems.append('导入应用时创建了数据库连接池')
+    return problems
+
+def run_startup(iterations=STARTUP_ITERATIONS, cwd=None):
+    """在cwd（其中的contacts.db为测试数据库）中重复冷启动，返回结果列表"""
+    samples = {name: [] for name in STARTUP_BUDGETS_MS}
+    errors = 0
+    for _ in range(iterations):
+        elapsed, report = _probe(cwd or os.getcwd())
+        problems = _problems(report)
+        if problems:
+            errors += 1
+            print(f"冷启动异常: {'; '.join(problems)}")
+        samples['process_boot'].append(elapsed)
+        if report is not None:
+            samples['import_app'].append(report['import_app'])
+            samples['first_request'].append(report['first_request'])
+
+    results = []
+    for name, latencies in samples.items():
+        result = summarize('startup', name, latencies, errors)
+        result['budget_ms'] = STARTUP_BUDGETS_MS[name]
+        results.append(result)
+        print(format_result(result))
+    return results
+
+def over_budget(results):
+    """p50超出预算的结果"""
+    return [result for result in results
+            if result.get('budget_ms') is not None and result['p50_ms'] is not None
+            and result['p50_ms'] > result['budget_ms']]
+
+def main(argv=None):
+    from benchmarks.datasets import DATASETS, ensure_dataset
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup',
+                                     description='应用冷启动耗时测试')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='1k',
+                        help='数据集规模（默认1k）')
+    parser.add_argument('--iterations', type=int, default=STARTUP_ITERATIONS,
+                        help='冷启动次数')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='contacts-startup-')
+    try:
+        shutil.copy(ensure_dataset(args.dataset), os.path.join(workdir, 'contacts.db'))
+        results = run_startup(args.iterations, cwd=workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = over_budget(results)
+    for result in failures:
+        print(f"{result['case']} p50={result['p50_ms']}ms 超出预算 {result['budget_ms']}ms")
+    if failures or any(result['errors'] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
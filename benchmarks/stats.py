@@ -0,0 +1,48 @@
+# 统计工具 - 延迟分位数与吞吐量
+import math
+
+def percentile(sorted_values, fraction):
+    """最近秩法计算分位数，sorted_values须已升序排列"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(suite, case, latencies, errors=0, elapsed=None):
+    """汇总一组请求的延迟（秒）为可比较的结果字典
+
+    Args:
+        suite (str): 测试类型（client、http、micro）
+        case (str): 用例名称
+        latencies (list): 每次请求或调用的耗时（秒）
+        errors (int): 失败次数
+        elapsed (float): 墙钟总耗时，并发压测时用于计算吞吐量；
+            为None时按延迟之和计算
+
+    Returns:
+        dict: 次数、错误数、req/s和各分位数延迟（毫秒）
+    """
+    values = sorted(latencies)
+    total = elapsed if elapsed is not None else sum(values)
+    
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    
+    return {
+        'suite': suite,
+        'case': case,
+        'count': len(values),
+        'errors': errors,
+        'rps': round(len(values) / total, 1) if total else None,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+def format_result(result):
+    """单行打印结果"""
+    return (f"{result['suite']:<6} {result['case']:<24} n={result['count']:<6} "
+            f"err={result['errors']:<4} rps={result['rps']!s:<9} "
+            f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms")
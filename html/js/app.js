@@ -45,46 +45,86 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 });
 
+// 已加载的联系人（按ID索引）及其对应的变更版本号，用于增量同步
+const contactsById = new Map();
+let syncVersion = null;
+
 /**
- * 从后端加载所有联系人并显示
+ * 加载联系人并显示：首次全量加载，之后只拉取变更
  */
 function loadContacts() {
-    fetch(API_URL)
+    if (syncVersion !== null) {
+        syncContacts();
+        return;
+    }
+    // 联系方式随列表一次返回，不再逐个请求
+    fetch(`${API_URL}?include=methods`)
         .then(response => {
             if (!response.ok) throw new Error('无法连接到后端服务，请检查后端是否启动');
+            syncVersion = response.headers.get('X-Change-Version');
             return response.json();
         })
         .then(contacts => {
-            // 获取每个联系人的联系方式
-            const promises = contacts.map(contact => {
-                return fetch(`${API_URL}/${contact.id}/methods`)
-                    .then(res => res.ok ? res.json() : [])
-                    .then(methods => {
-                        contact.methods = methods;
-                        return contact;
-                    });
-            });
-            return Promise.all(promises);
+            contactsById.clear();
+            contacts.forEach(contact => contactsById.set(contact.id, contact));
+            renderContacts();
         })
-        .then(contacts => {
-            const container = document.getElementById('contactContainer');
-            container.innerHTML = '';
+        .catch(error => {
+            showNotification(error.message, 'error');
+        });
+}
 
-            if (contacts.length === 0) {
-                container.innerHTML = '<p class="no-contacts">暂无联系人，请添加第一个联系人吧！</p>';
-                return;
+/**
+ * 拉取上次同步之后的变更并合并到已加载的联系人
+ */
+function syncContacts() {
+    fetch(`${API_URL}/changes?include=methods&since=${syncVersion}`)
+        .then(response => {
+            if (response.status === 410) {
+                // 版本号已失效，重新全量加载
+                syncVersion = null;
+                loadContacts();
+                return null;
+            }
+            if (!response.ok) throw new Error('同步联系人失败');
+            return response.json();
+        })
+        .then(changes => {
+            if (!changes) return;
+            changes.contacts.forEach(contact => contactsById.set(contact.id, contact));
+            changes.deleted.forEach(id => contactsById.delete(id));
+            syncVersion = changes.version;
+            if (changes.has_more) {
+                syncContacts();
+            } else {
+                renderContacts();
             }
-
-            // 生成联系人卡片
-            contacts.forEach(contact => {
-                container.appendChild(createContactCard(contact));
-            });
         })
         .catch(error => {
             showNotification(error.message, 'error');
         });
 }
 
+/**
+ * 按ID顺序显示已加载的联系人
+ */
+function renderContacts() {
+    const container = document.getElementById('contactContainer');
+    container.innerHTML = '';
+
+    if (contactsById.size === 0) {
+        container.innerHTML = '<p class="no-contacts">暂无联系人，请添加第一个联系人吧！</p>';
+        return;
+    }
+
+    // 生成联系人卡片
+    [...contactsById.values()]
+        .sort((a, b) => a.id - b.id)
+        .forEach(contact => {
+            container.appendChild(createContactCard(contact));
+        });
+}
+
 /**
  * 创建联系人卡片元素
  * @param {Object} contact - 联系人数据
@@ -142,7 +182,7 @@ function createContactCard(contact) {
 }
 
 /**
- * 搜索联系人（按姓名或电话）
+ * 搜索联系人（按姓名、电话、邮箱、地址或其他联系方式）
  */
 function searchContacts() {
     const searchTerm = document.getElementById('searchInput').value.toLowerCase().trim();
@@ -152,25 +192,9 @@ function searchContacts() {
         return;
     }
 
-    fetch(API_URL)
+    // 使用后端全文检索（姓名、电话尾号、邮箱、地址及其他联系方式）
+    fetch(`${API_URL}/search?include=methods&limit=100&q=${encodeURIComponent(searchTerm)}`)
         .then(response => response.json())
-        .then(contacts => {
-            const filteredContacts = contacts.filter(contact => 
-                contact.name.toLowerCase().includes(searchTerm) || 
-                contact.phone.toLowerCase().includes(searchTerm)
-            );
-            
-            // 获取过滤后联系人的联系方式
-            const promises = filteredContacts.map(contact => {
-                return fetch(`${API_URL}/${contact.id}/methods`)
-                    .then(res => res.ok ? res.json() : [])
-                    .then(methods => {
-                        contact.methods = methods;
-                        return contact;
-                    });
-            });
-            return Promise.all(promises);
-        })
         .then(contacts => {
             const container = document.getElementById('contactContainer');
             container.innerHTML = '';
@@ -291,6 +315,9 @@ function addContact() {
         return;
     }
 
+    // 联系方式随联系人一起提交，后端在同一个事务中写入
+    newContact.methods = collectContactMethods('#add-contact-methods', 'add');
+
     fetch(API_URL, {
         method: 'POST',
         headers: {
@@ -306,35 +333,6 @@ function addContact() {
         }
         return response.json();
     })
-    .then(contact => {
-        // 添加其他联系方式
-        const contactMethods = document.querySelectorAll('#add-contact-methods .contact-method');
-        const methodPromises = [];
-        
-        contactMethods.forEach(method => {
-            const methodType = method.querySelector('select[name="add-method_type"]').value;
-            const methodValue = method.querySelector('input[name="add-method_value"]').value.trim();
-            const isPrimary = method.querySelector('input[name="add-is_primary"]').checked ? 1 : 0;
-            
-            if (methodValue) {
-                methodPromises.push(
-                    fetch(`${API_URL}/${contact.id}/methods`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({
-                            method_type: methodType,
-                            method_value: methodValue,
-                            is_primary: isPrimary
-                        })
-                    })
-                );
-            }
-        });
-        
-        return Promise.all(methodPromises).then(() => contact);
-    })
     .then(() => {
         hideAddModal();
         loadContacts(); // 重新加载联系人列表
@@ -374,6 +372,7 @@ function showEditModal(id) {
             methods.forEach(method => {
                 const methodDiv = document.createElement('div');
                 methodDiv.className = 'contact-method';
+                methodDiv.dataset.methodId = method.id;
                 methodDiv.innerHTML = `
                     <select name="edit-method_type">
                         <option value="手机" ${method.method_type === '手机' ? 'selected' : ''}>手机</option>
@@ -478,6 +477,30 @@ function hideEditModal() {
     document.getElementById('editModal').style.display = 'none';
 }
 
+/**
+ * 收集表单中填写了值的联系方式
+ * @param {string} selector - 联系方式容器的选择器
+ * @param {string} prefix - 输入项name的前缀（add或edit）
+ * @returns {Array} 联系方式列表，已有的联系方式带id
+ */
+function collectContactMethods(selector, prefix) {
+    const methods = [];
+    document.querySelectorAll(`${selector} .contact-method`).forEach(method => {
+        const methodValue = method.querySelector(`input[name="${prefix}-method_value"]`).value.trim();
+        if (!methodValue) return;
+        const item = {
+            method_type: method.querySelector(`select[name="${prefix}-method_type"]`).value,
+            method_value: methodValue,
+            is_primary: method.querySelector(`input[name="${prefix}-is_primary"]`).checked ? 1 : 0
+        };
+        if (method.dataset.methodId) {
+            item.id = Number(method.dataset.methodId);
+        }
+        methods.push(item);
+    });
+    return methods;
+}
+
 /**
  * 更新联系人信息
  */
@@ -497,9 +520,11 @@ function updateContact() {
         return;
     }
 
-    // 先更新联系人基本信息
+    // 联系人信息和完整的联系方式列表一次提交，后端比对差异后在同一个事务中更新
+    updatedContact.methods = collectContactMethods('#edit-contact-methods', 'edit');
+
     fetch(`${API_URL}/${id}`, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: {
             'Content-Type': 'application/json'
         },
@@ -511,49 +536,7 @@ function updateContact() {
                 throw new Error(data.error || '更新联系人失败');
             });
         }
-        return Promise.resolve();
-    })
-    .then(() => {
-        // 删除所有旧的联系方式
-        return fetch(`${API_URL}/${id}/methods`)
-            .then(res => res.ok ? res.json() : [])
-            .then(methods => {
-                const deletePromises = methods.map(method => 
-                    fetch(`${API_URL}/methods/${method.id}`, {
-                        method: 'DELETE'
-                    })
-                );
-                return Promise.all(deletePromises);
-            });
-    })
-    .then(() => {
-        // 添加新的联系方式
-        const contactMethods = document.querySelectorAll('#edit-contact-methods .contact-method');
-        const methodPromises = [];
-        
-        contactMethods.forEach(method => {
-            const methodType = method.querySelector('select[name="edit-method_type"]').value;
-            const methodValue = method.querySelector('input[name="edit-method_value"]').value.trim();
-            const isPrimary = method.querySelector('input[name="edit-is_primary"]').checked ? 1 : 0;
-            
-            if (methodValue) {
-                methodPromises.push(
-                    fetch(`${API_URL}/${id}/methods`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({
-                            method_type: methodType,
-                            method_value: methodValue,
-                            is_primary: isPrimary
-                        })
-                    })
-                );
-            }
-        });
-        
-        return Promise.all(methodPromises);
+        return response.json();
     })
     .then(() => {
         hideEditModal();
@@ -640,17 +623,18 @@ function importContacts() {
         method: 'POST',
         body: formData
     })
-    .then(response => {
-        if (response.ok) {
-            showNotification('联系人导入成功！', 'success');
-            loadContacts(); // 重新加载联系人列表
-            fileInput.value = ''; // 清空文件输入
-        } else {
-            return response.json().then(data => {
-                throw new Error(data.error || '导入联系人失败');
-            });
+    .then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || '导入联系人失败');
         }
-    })
+        let message = `成功导入 ${data.imported} 个联系人`;
+        if (data.skipped > 0) {
+            message += `，跳过 ${data.skipped} 行`;
+        }
+        showNotification(message, 'success');
+        loadContacts(); // 重新加载联系人列表
+        fileInput.value = ''; // 清空文件输入
+    }))
     .catch(error => {
         showNotification(error.message, 'error');
     });
@@ -1,15 +1,47 @@
-
-from flask import Flask, request, jsonify
+# 应用入口 - 创建Flask应用并定义联系人API路由
+import math
+import os
+import threading
+from flask import Blueprint, Flask, current_app, request, jsonify
 from flask_cors import CORS  # 解决跨域问题
-from config.database import init_database  # 正确导入数据库初始化函数
+from sqlite3 import Error
+from config.admission import ADMISSION_ENABLED, AdmissionMiddleware
+from config.cache import cache_stats
+from config.compression import COMPRESSION_ENABLED, CompressionMiddleware
+from config.database import get_pool
+from config.metrics import (
+    METRICS_ENABLED,
+    MetricsMiddleware,
+    render_metrics,
+    set_request_route
+)
+from config.replication import (
+    LOG_POSITION_HEADER,
+    REPLICATION_BATCH_SIZE,
+    REPLICATION_ROLE,
+    ReplicationMiddleware,
+    get_change_batch,
+    get_snapshot_batch
+)
+from config.sharding import SHARDING_ENABLED, TENANT_HEADER, TenantMiddleware
 from controller.contact_controller import (  # 正确导入控制器函数
-    get_all_contacts,
+    MAX_PAGE_SIZE,
+    list_contacts,
+    stream_contacts,
+    encode_ndjson,
+    get_change_version,
+    get_changes,
+    search_contacts,
     get_contact_by_id,
     create_contact,
     update_contact,
+    patch_contact,
+    apply_batch,
+    BatchError,
     delete_contact,
-    get_favorite_contacts,
     toggle_favorite,
+    get_favorite_contacts,
+    move_favorite,
     get_contact_methods,
     create_contact_method,
     update_contact_method,
@@ -17,38 +49,200 @@ from controller.contact_controller import (  # 正确导入控制器函数
     export_contacts_to_excel,
     import_contacts_from_excel
 )
+from controller.bulk_controller import (
+    FORMAT_MIMETYPES,
+    GZIP_MIMETYPE,
+    TEXT_FORMATS,
+    detect_format,
+    export_file_type,
+    export_filename,
+    import_contacts_from_file,
+    stream_export
+)
+from controller.job_controller import (
+    submit_import_job,
+    submit_export_job,
+    submit_dedupe_job,
+    resume_jobs,
+    get_job,
+    get_job_result_path
+)
+
+# API路由（由 create_app() 注册到应用）
+api = Blueprint('api', __name__)
 
-# 初始化Flask应用
-app = Flask(__name__)
+# API路由定义
+def _is_not_modified(version):
+    """客户端缓存的ETag与当前版本号一致时返回True
+    
+    If-None-Match按弱比较：压缩后的响应带的是弱ETag（W/"版本号"）。
+    """
+    return version is not None and request.if_none_match.contains_weak(str(version))
 
-# 配置CORS（解决跨域预检问题）
-CORS(app, resources={
-    r"/api/*": {
-        "origins": "*",  # 允许所有来源（开发环境专用）
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # 包含预检请求方法
-        "allow_headers": ["Content-Type", "Authorization"]  # 允许必要的请求头
-    }
-})
+def _set_version_headers(response, version):
+    """设置由版本号生成的ETag，要求客户端每次使用前都重新验证
+    
+    这里写入的是强ETag，压缩中间件会把压缩后的响应改为弱ETag；
+    _is_not_modified 按弱比较，两种形式都能命中。
+    """
+    if version is not None:
+        response.set_etag(str(version))
+        response.headers['X-Change-Version'] = str(version)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
 
-# 初始化数据库（启动时自动创建表）
-init_database()
+def _not_modified_response(version):
+    """返回不带正文的304响应"""
+    return _set_version_headers(current_app.response_class(status=304), version)
 
-# API路由定义
-@app.route('/api/contacts', methods=['GET'])
+# NDJSON响应的媒体类型
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def _wants_ndjson():
+    """请求头Accept优先接受NDJSON时返回True（默认返回JSON数组）"""
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+def _streamed_response(body, ndjson):
+    """包装流式生成的正文"""
+    response = current_app.response_class(
+        body, mimetype=NDJSON_MIMETYPE if ndjson else 'application/json'
+    )
+    # 同一URL按Accept返回不同格式
+    response.vary.add('Accept')
+    # 关闭Nginx的代理缓冲，生成一块转发一块
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _parse_int_arg(name):
+    """读取整数类型的查询参数，缺省返回None，格式错误抛出ValueError"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return int(value)
+
+def _parse_limit_arg():
+    """读取分页条数 limit，缺省返回None，不是正整数时抛出ValueError"""
+    limit = _parse_int_arg('limit')
+    if limit is not None and limit <= 0:
+        raise ValueError(limit)
+    return limit
+
+@api.route('/api/contacts', methods=['GET'])
 def api_get_all_contacts():
-    """获取所有联系人"""
-    contacts = get_all_contacts()
+    """获取联系人列表
+    
+    查询参数：
+        q: 按姓名或电话包含匹配
+        favorite: 1/0 按收藏状态过滤
+        limit: 单页条数（不传则返回全部）
+        after_id: 分页游标，取上一页响应头 X-Next-Cursor 的值
+        include: 为 methods 时一并返回联系方式
+    
+    请求头 Accept 为 application/x-ndjson 时每行返回一个联系人（NDJSON）；
+    不分页时两种格式都边查询边输出。响应带有由变更版本号生成的ETag，
+    请求头 If-None-Match 与之相同时返回304（不查询列表）。
+    """
+    try:
+        limit = _parse_limit_arg()
+        after_id = _parse_int_arg('after_id')
+        favorite = _parse_int_arg('favorite')
+    except ValueError:
+        return jsonify({'error': 'limit必须为正整数，after_id和favorite必须为整数'}), 400
+    
+    current_version = get_change_version()
+    if _is_not_modified(current_version):
+        return _not_modified_response(current_version)
+    
+    include = request.args.get('include', '').split(',')
+    q = request.args.get('q', '').strip() or None
+    ndjson = _wants_ndjson()
+    if limit is None:
+        # 不分页时流式输出，不在内存中构造整个列表
+        body = stream_contacts(q=q, favorite=favorite, after_id=after_id,
+                               include_methods='methods' in include,
+                               ndjson=ndjson)
+        return _set_version_headers(_streamed_response(body, ndjson),
+                                    current_version)
+    
+    contacts, next_cursor, version = list_contacts(
+        q=q,
+        favorite=favorite,
+        limit=limit,
+        after_id=after_id,
+        include_methods='methods' in include,
+        with_version=True
+    )
+    if ndjson:
+        response = current_app.response_class(encode_ndjson(contacts),
+                                              mimetype=NDJSON_MIMETYPE)
+        response.vary.add('Accept')
+    else:
+        response = jsonify(contacts)
+    _set_version_headers(response, version)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+@api.route('/api/contacts/changes', methods=['GET'])
+def api_get_contact_changes():
+    """增量同步：返回某个版本之后变更的联系人
+    
+    查询参数：
+        since: 已同步到的版本号（全量加载时取响应头 X-Change-Version）
+        limit: 单次返回的联系人数
+        include: 为 methods 时一并返回联系方式
+    
+    since超过当前版本（如数据库被重建）时返回410，客户端应重新全量加载。
+    """
+    try:
+        since = _parse_int_arg('since')
+        limit = _parse_limit_arg() or MAX_PAGE_SIZE
+    except ValueError:
+        return jsonify({'error': 'since必须为整数，limit必须为正整数'}), 400
+    if since is None or since < 0:
+        return jsonify({'error': '缺少since参数'}), 400
+    
+    include = request.args.get('include', '').split(',')
+    changes = get_changes(since, limit=limit,
+                          include_methods='methods' in include)
+    if changes is None:
+        return jsonify({'error': '查询变更失败'}), 500
+    if changes['version'] < since:
+        return jsonify({'error': '版本号已失效，请重新加载全部联系人'}), 410
+    return jsonify(changes)
+
+@api.route('/api/contacts/search', methods=['GET'])
+def api_search_contacts():
+    """全文搜索联系人（?q=关键字&limit=条数&include=methods）"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': '搜索关键字不能为空'}), 400
+    try:
+        limit = _parse_limit_arg() or 20
+    except ValueError:
+        return jsonify({'error': 'limit必须为正整数'}), 400
+    
+    include = request.args.get('include', '').split(',')
+    contacts = search_contacts(q, limit=limit,
+                               include_methods='methods' in include)
     return jsonify(contacts)
 
-@app.route('/api/contacts/<int:contact_id>', methods=['GET'])
+@api.route('/api/contacts/<int:contact_id>', methods=['GET'])
 def api_get_single_contact(contact_id):
-    """通过ID获取单个联系人"""
-    contact = get_contact_by_id(contact_id)
-    if contact:
-        return jsonify(contact)
-    return jsonify({'error': '联系人不存在'}), 404
+    """通过ID获取单个联系人（支持ETag条件请求）
+    
+    先确认联系人存在再比较ETag：不存在或已删除的联系人总是返回404，
+    不会因为客户端带了匹配的 If-None-Match 而返回304。
+    """
+    contact, version = get_contact_by_id(contact_id, with_version=True)
+    if not contact:
+        return jsonify({'error': '联系人不存在'}), 404
+    if _is_not_modified(version):
+        return _not_modified_response(version)
+    return _set_version_headers(jsonify(contact), version)
 
-@app.route('/api/contacts', methods=['POST'])
+@api.route('/api/contacts', methods=['POST'])
 def api_create_new_contact():
     """创建新联系人"""
     contact_data = request.get_json()
@@ -60,7 +254,7 @@ def api_create_new_contact():
         return jsonify(new_contact), 201  # 201表示创建成功
     return jsonify({'error': '创建联系人失败'}), 500
 
-@app.route('/api/contacts/<int:contact_id>', methods=['PUT'])
+@api.route('/api/contacts/<int:contact_id>', methods=['PUT'])
 def api_update_existing_contact(contact_id):
     """更新联系人"""
     contact_data = request.get_json()
@@ -71,7 +265,32 @@ def api_update_existing_contact(contact_id):
         return jsonify(updated_contact)
     return jsonify({'error': '联系人不存在或更新失败'}), 404
 
-@app.route('/api/contacts/<int:contact_id>', methods=['DELETE'])
+@api.route('/api/contacts/<int:contact_id>', methods=['PATCH'])
+def api_patch_contact(contact_id):
+    """部分更新联系人，methods为完整的联系方式列表时一并同步（单个事务）"""
+    contact_data = request.get_json(silent=True)
+    try:
+        updated_contact = patch_contact(contact_id, contact_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if updated_contact:
+        return jsonify(updated_contact)
+    return jsonify({'error': '联系人不存在或更新失败'}), 404
+
+@api.route('/api/batch', methods=['POST'])
+def api_batch():
+    """在一个事务中执行多项操作，请求体为 {"operations": [...]}"""
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    try:
+        results = apply_batch(operations)
+    except BatchError as e:
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    except Error as e:
+        return jsonify({'error': f'批量操作失败: {str(e)}'}), 500
+    return jsonify({'results': results})
+
+@api.route('/api/contacts/<int:contact_id>', methods=['DELETE'])
 def api_delete_existing_contact(contact_id):
     """删除联系人"""
     success = delete_contact(contact_id)
@@ -80,13 +299,45 @@ def api_delete_existing_contact(contact_id):
     return jsonify({'error': '联系人不存在或删除失败'}), 404
 
 # 收藏功能API
-@app.route('/api/contacts/favorites', methods=['GET'])
+@api.route('/api/contacts/favorites', methods=['GET'])
 def api_get_favorite_contacts():
-    """获取所有收藏的联系人"""
-    contacts = get_favorite_contacts()
-    return jsonify(contacts)
+    """按用户排序获取收藏的联系人
+    
+    查询参数：
+        limit: 单页条数（不传则返回全部）
+        after: 分页游标，取上一页响应头 X-Next-Cursor 的值
+    
+    每个联系人额外带有 favorited_at（收藏时间）和 favorite_rank（排序
+    值）。请求头 Accept 为 application/x-ndjson 时每行返回一个联系人。
+    """
+    try:
+        limit = _parse_limit_arg()
+        after = request.args.get('after')
+        after_rank = float(after) if after else None
+        if after_rank is not None and not math.isfinite(after_rank):
+            raise ValueError(after)
+    except ValueError:
+        return jsonify({'error': 'limit必须为正整数，after必须为数字'}), 400
+    
+    current_version = get_change_version()
+    if _is_not_modified(current_version):
+        return _not_modified_response(current_version)
+    
+    contacts, next_cursor, version = get_favorite_contacts(
+        limit=limit, after_rank=after_rank, with_version=True
+    )
+    if _wants_ndjson():
+        response = current_app.response_class(encode_ndjson(contacts),
+                                              mimetype=NDJSON_MIMETYPE)
+    else:
+        response = jsonify(contacts)
+    response.vary.add('Accept')
+    _set_version_headers(response, version)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
 
-@app.route('/api/contacts/<int:contact_id>/favorite', methods=['PUT'])
+@api.route('/api/contacts/<int:contact_id>/favorite', methods=['PUT'])
 def api_toggle_favorite(contact_id):
     """切换联系人的收藏状态"""
     contact = toggle_favorite(contact_id)
@@ -94,14 +345,30 @@ def api_toggle_favorite(contact_id):
         return jsonify(contact)
     return jsonify({'error': '联系人不存在'}), 404
 
+@api.route('/api/contacts/<int:contact_id>/favorite/position', methods=['PUT'])
+def api_move_favorite(contact_id):
+    """调整收藏的顺序
+    
+    请求体：{"before_id": 收藏联系人ID} 移到该联系人之前，before_id 为
+    null 或省略时移到末尾。
+    """
+    data = request.get_json(silent=True) or {}
+    before_id = data.get('before_id')
+    if before_id is not None and (not isinstance(before_id, int) or isinstance(before_id, bool)):
+        return jsonify({'error': 'before_id必须为整数'}), 400
+    contact = move_favorite(contact_id, before_id)
+    if contact:
+        return jsonify(contact)
+    return jsonify({'error': '联系人或before_id不是收藏的联系人'}), 404
+
 # 联系方式API
-@app.route('/api/contacts/<int:contact_id>/methods', methods=['GET'])
+@api.route('/api/contacts/<int:contact_id>/methods', methods=['GET'])
 def api_get_contact_methods(contact_id):
     """获取联系人的所有联系方式"""
     methods = get_contact_methods(contact_id)
     return jsonify(methods)
 
-@app.route('/api/contacts/<int:contact_id>/methods', methods=['POST'])
+@api.route('/api/contacts/<int:contact_id>/methods', methods=['POST'])
 def api_create_contact_method(contact_id):
     """为联系人创建新的联系方式"""
     method_data = request.get_json()
@@ -113,7 +380,7 @@ def api_create_contact_method(contact_id):
         return jsonify(new_method), 201
     return jsonify({'error': '创建联系方式失败'}), 500
 
-@app.route('/api/contacts/methods/<int:method_id>', methods=['PUT'])
+@api.route('/api/contacts/methods/<int:method_id>', methods=['PUT'])
 def api_update_contact_method(method_id):
     """更新联系方式"""
     method_data = request.get_json()
@@ -125,7 +392,7 @@ def api_update_contact_method(method_id):
         return jsonify(updated_method)
     return jsonify({'error': '联系方式不存在或更新失败'}), 404
 
-@app.route('/api/contacts/methods/<int:method_id>', methods=['DELETE'])
+@api.route('/api/contacts/methods/<int:method_id>', methods=['DELETE'])
 def api_delete_contact_method(method_id):
     """删除联系方式"""
     success = delete_contact_method(method_id)
@@ -134,24 +401,73 @@ def api_delete_contact_method(method_id):
     return jsonify({'error': '联系方式不存在或删除失败'}), 404
 
 # 导出功能API
-@app.route('/api/contacts/export', methods=['GET'])
+# 流式下载时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def _stream_file(file_obj, chunk_size=STREAM_CHUNK_SIZE):
+    """分块读取文件并在读取完毕（或客户端断开）后关闭"""
+    try:
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file_obj.close()
+
+@api.route('/api/contacts/export', methods=['GET'])
 def api_export_contacts():
-    """导出联系人到Excel文件"""
+    """导出联系人到文件（分块流式返回）
+    
+    ?format=xlsx（默认）、csv 或 ndjson；CSV和NDJSON加 ?gzip=1 时下载
+    gzip压缩的文件。?async=1 时创建后台任务并立即返回任务ID。
+    """
+    file_format = request.args.get('format', 'xlsx')
+    if file_format not in FORMAT_MIMETYPES:
+        return jsonify({'error': 'format 只能是 xlsx、csv 或 ndjson'}), 400
+    compressed = file_format in TEXT_FORMATS and request.args.get('gzip') == '1'
+    
+    if request.args.get('async') == '1':
+        job_id = submit_export_job(file_format, compressed)
+        if job_id is None:
+            return jsonify({'error': '创建导出任务失败'}), 500
+        return jsonify({'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202
+    
+    if file_format in TEXT_FORMATS:
+        return current_app.response_class(
+            stream_export(file_format, compressed),
+            mimetype=GZIP_MIMETYPE if compressed else FORMAT_MIMETYPES[file_format],
+            headers={
+                'Content-Disposition':
+                    f'attachment; filename={export_filename(file_format, compressed)}',
+                # 关闭Nginx的代理缓冲，生成一块转发一块
+                'X-Accel-Buffering': 'no'
+            }
+        )
+    
     try:
         excel_file = export_contacts_to_excel()
-        return app.response_class(
-            excel_file.read(),
+        size = os.fstat(excel_file.fileno()).st_size
+        return current_app.response_class(
+            _stream_file(excel_file),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
             headers={
-                'Content-Disposition': 'attachment; filename=contacts_export.xlsx'
+                'Content-Disposition': 'attachment; filename=contacts_export.xlsx',
+                'Content-Length': str(size)
             }
         )
     except Exception as e:
         return jsonify({'error': f'导出失败: {str(e)}'}), 500
 
-@app.route('/api/contacts/import', methods=['POST'])
+@api.route('/api/contacts/import', methods=['POST'])
 def api_import_contacts():
-    """从Excel文件导入联系人"""
+    """从文件导入联系人（?async=1 时创建后台任务并立即返回任务ID）
+    
+    按扩展名识别 .xlsx、.csv、.ndjson（.jsonl），CSV和NDJSON可以是
+    gzip压缩的文件（如 contacts.csv.gz）；也可以用 ?format= 指定格式。
+    ?mode=upsert 时与已有联系人重复（号码、邮箱或联系方式相同且姓名
+    相同）的行合并到已有联系人，而不是重复新增。
+    """
     if 'file' not in request.files:
         return jsonify({'error': '未找到文件'}), 400
     
@@ -159,27 +475,213 @@ def api_import_contacts():
     if file.filename == '':
         return jsonify({'error': '未选择文件'}), 400
     
-    if file and file.filename.endswith('.xlsx'):
+    upsert = request.args.get('mode') == 'upsert'
+    file_format = detect_format(file.filename, request.args.get('format'))
+    if file and file_format is not None:
+        if request.args.get('async') == '1':
+            job_id = submit_import_job(file, upsert=upsert, file_format=file_format)
+            if job_id is None:
+                return jsonify({'error': '创建导入任务失败'}), 500
+            return jsonify({'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202
+        
         try:
-            success = import_contacts_from_excel(file)
-            if success:
-                return jsonify({'message': '联系人导入成功'}), 200
+            if file_format == 'xlsx':
+                report = import_contacts_from_excel(file, upsert=upsert)
+            else:
+                report = import_contacts_from_file(file.stream, file_format, upsert=upsert)
+            if report is not None:
+                return jsonify({'message': '联系人导入成功', **report}), 200
             return jsonify({'error': '导入失败'}), 500
         except Exception as e:
             return jsonify({'error': f'导入失败: {str(e)}'}), 500
     
-    return jsonify({'error': '只支持.xlsx格式的Excel文件'}), 400
+    return jsonify({'error': '只支持.xlsx、.csv和.ndjson格式的文件（CSV和NDJSON可以gzip压缩）'}), 400
+
+# 查重API
+@api.route('/api/contacts/dedupe', methods=['POST'])
+def api_dedupe_contacts():
+    """创建后台查重任务，请求体 {"merge": true} 时合并找到的重复联系人
+    
+    默认只查找并在任务结果中报告重复组，不修改数据。
+    """
+    payload = request.get_json(silent=True) or {}
+    merge = payload.get('merge') is True if isinstance(payload, dict) else False
+    job_id = submit_dedupe_job(merge=merge)
+    if job_id is None:
+        return jsonify({'error': '创建查重任务失败'}), 500
+    return jsonify({'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202
+
+# 后台任务API
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def api_get_job(job_id):
+    """查询后台任务的状态、进度和吞吐量"""
+    job = get_job(job_id)
+    if job:
+        return jsonify(job)
+    return jsonify({'error': '任务不存在'}), 404
+
+@api.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_get_job_result(job_id):
+    """下载导出任务生成的文件"""
+    result_path = get_job_result_path(job_id)
+    if result_path is None:
+        return jsonify({'error': '任务不存在、未完成或没有结果文件'}), 404
+    filename, mimetype = export_file_type(result_path)
+    return current_app.response_class(
+        _stream_file(open(result_path, 'rb')),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'Content-Length': str(os.path.getsize(result_path))
+        }
+    )
+
+# 复制：副本从主库拉取变更日志
+@api.route('/api/replication/changes', methods=['GET'])
+def api_replication_changes():
+    """返回某个日志位置之后的一批变更及相关联系人的当前数据
+    
+    查询参数：
+        since: 副本已应用到的日志位置
+        limit: 最多返回的日志行数
+        until: 只返回不超过该位置的日志（可选）
+        rows: 为 0 时只返回日志行，不附带联系人数据
+    """
+    try:
+        since = _parse_int_arg('since')
+        limit = _parse_int_arg('limit') or REPLICATION_BATCH_SIZE
+        until = _parse_int_arg('until')
+    except ValueError:
+        return jsonify({'error': 'since、limit和until必须为整数'}), 400
+    if since is None or since < 0:
+        return jsonify({'error': '缺少since参数'}), 400
+    
+    batch = get_change_batch(since, limit=max(1, min(limit, REPLICATION_BATCH_SIZE)),
+                             until=until, with_rows=request.args.get('rows') != '0')
+    if batch is None:
+        return jsonify({'error': '读取变更日志失败'}), 500
+    return jsonify(batch)
+
+@api.route('/api/replication/snapshot', methods=['GET'])
+def api_replication_snapshot():
+    """按ID顺序返回一页联系人的当前数据，用于副本初始同步（?after_id=ID&limit=条数）"""
+    try:
+        after_id = _parse_int_arg('after_id') or 0
+        limit = _parse_int_arg('limit') or REPLICATION_BATCH_SIZE
+    except ValueError:
+        return jsonify({'error': 'after_id和limit必须为整数'}), 400
+    
+    batch = get_snapshot_batch(after_id, limit=max(1, min(limit, REPLICATION_BATCH_SIZE)))
+    if batch is None:
+        return jsonify({'error': '读取联系人快照失败'}), 500
+    return jsonify(batch)
+
+# 缓存指标API
+@api.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    """查询读缓存的命中率、条目数和淘汰次数"""
+    stats = cache_stats()
+    lookups = stats.get('hits_total', 0) + stats.get('misses_total', 0)
+    stats['hit_ratio'] = round(stats['hits_total'] / lookups, 4) if lookups else None
+    return jsonify(stats)
+
+# Prometheus指标
+@api.route('/metrics', methods=['GET'])
+def api_metrics():
+    """以Prometheus文本格式输出请求、SQL、连接池和缓存指标"""
+    return current_app.response_class(
+        render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
 
 # 处理预检请求（确保跨域配置生效）
-@app.route('/api/contacts', methods=['OPTIONS'])
-@app.route('/api/contacts/<int:contact_id>', methods=['OPTIONS'])
-@app.route('/api/contacts/favorites', methods=['OPTIONS'])
-@app.route('/api/contacts/<int:contact_id>/favorite', methods=['OPTIONS'])
-@app.route('/api/contacts/<int:contact_id>/methods', methods=['OPTIONS'])
-@app.route('/api/contacts/methods/<int:method_id>', methods=['OPTIONS'])
+@api.route('/api/contacts', methods=['OPTIONS'])
+@api.route('/api/contacts/<int:contact_id>', methods=['OPTIONS'])
+@api.route('/api/contacts/search', methods=['OPTIONS'])
+@api.route('/api/contacts/changes', methods=['OPTIONS'])
+@api.route('/api/contacts/favorites', methods=['OPTIONS'])
+@api.route('/api/contacts/<int:contact_id>/favorite', methods=['OPTIONS'])
+@api.route('/api/contacts/<int:contact_id>/favorite/position', methods=['OPTIONS'])
+@api.route('/api/contacts/<int:contact_id>/methods', methods=['OPTIONS'])
+@api.route('/api/contacts/methods/<int:method_id>', methods=['OPTIONS'])
+@api.route('/api/jobs/<job_id>', methods=['OPTIONS'])
+@api.route('/api/batch', methods=['OPTIONS'])
+@api.route('/api/contacts/dedupe', methods=['OPTIONS'])
 def handle_options():
     return '', 200
 
-# 启动应用
+def record_route():
+    """按路由模板（而非实际URL）标记请求，避免指标标签随ID增长"""
+    set_request_route(request.url_rule.rule if request.url_rule else None)
+
+# 进程内已执行过启动任务的数据库文件（启用分片时每个租户分片各执行一次）
+_startup_done = set()
+_startup_lock = threading.Lock()
+
+def run_startup_tasks():
+    """处理数据库的第一个请求前接管上次崩溃时未完成的后台任务（每个进程一次）"""
+    database = get_pool().database
+    if database in _startup_done:
+        return
+    with _startup_lock:
+        if database not in _startup_done:
+            resume_jobs()
+            _startup_done.add(database)
+
+def create_app():
+    """创建并配置Flask应用
+    
+    创建应用不访问数据库，也不加载openpyxl：数据库结构在第一次取连接
+    时检查（见 config.database.ensure_schema），Excel相关模块在第一次
+    导入导出时加载，worker进程可以很快启动。
+    
+    Returns:
+        Flask: 注册好路由的应用
+    """
+    app = Flask(__name__)
+    
+    # 配置CORS（解决跨域预检问题）
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": "*",  # 允许所有来源（开发环境专用）
+            "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],  # 包含预检请求方法
+            "allow_headers": ["Content-Type", "Authorization", TENANT_HEADER,
+                              LOG_POSITION_HEADER],  # 允许必要的请求头
+            # 允许前端读取分页游标、变更版本号与写入后的日志位置
+            "expose_headers": ["X-Next-Cursor", "ETag", "X-Change-Version",
+                               LOG_POSITION_HEADER]
+        }
+    })
+    
+    # 按租户请求头把请求路由到各自的数据库分片（直到响应正文输出完毕）
+    if SHARDING_ENABLED:
+        app.wsgi_app = TenantMiddleware(app.wsgi_app)
+    
+    # 主从复制：副本把写请求重定向到主库，读请求按日志位置等待副本追上
+    if REPLICATION_ROLE:
+        app.wsgi_app = ReplicationMiddleware(app.wsgi_app)
+    
+    # 准入控制：按路由类别限制并发和排队，按客户端限速，饱和时返回429/503
+    if ADMISSION_ENABLED:
+        app.wsgi_app = AdmissionMiddleware(app.wsgi_app)
+    
+    # 按Accept-Encoding压缩响应（在指标中间件内层，压缩耗时计入请求延迟）
+    if COMPRESSION_ENABLED:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+    
+    # 统计每个请求的延迟与数据库开销（/metrics 输出）
+    if METRICS_ENABLED:
+        app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+    
+    app.before_request(record_route)
+    app.before_request(run_startup_tasks)
+    app.register_blueprint(api)
+    return app
+
+# 默认应用实例（asgi.py、开发服务器和性能测试使用）
+app = create_app()
+
+# 启动应用（开发服务器，生产环境通过 asgi.py 在ASGI服务器下运行）
 if __name__ == '__main__':
-    app.run(debug=True)  # 运行在http://127.0.0.1:5000
\ No newline at end of file
+    # 调试模式会开启交互式调试器，只应在本机开发时通过环境变量打开
+    debug = os.environ.get('CONTACTS_DEBUG', '0') == '1'
+    app.run(debug=debug, threaded=True)  # 运行在http://127.0.0.1:5000
\ No newline at end of file
@@ -0,0 +1,11 @@
+# ASGI入口 - 生产环境在异步服务器下运行同一套路由
+#
+# 用法（在src目录下执行）：
+#     uvicorn asgi:application --workers 4
+#
+# 每个worker进程各自拥有请求线程池（CONTACTS_ASGI_THREADS）、数据库
+# 连接池和读缓存，详见README中的“部署”一节。
+from app import app
+from config.server import AsgiBridge
+
+application = AsgiBridge(app)
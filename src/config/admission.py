@@ -0,0 +1,344 @@
+# 准入控制 - 按路由类别限制并发、有界排队，按客户端令牌桶限速
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from config.metrics import ClosingIterable
+
+# 是否启用准入控制
+ADMISSION_ENABLED = os.environ.get('CONTACTS_ADMISSION', '1') == '1'
+
+# 各路由类别的默认设置：
+#   concurrency: 同时处理的请求数
+#   queue:       并发已满时最多排队等待的请求数，再多直接返回503
+#   timeout:     排队等待的最长秒数，超时返回503
+#   rate/burst:  每个客户端每秒补充的令牌数与令牌桶容量，用完返回429
+#   retry_after: 返回503时 Retry-After 的秒数
+# 每一项都可以用环境变量覆盖，如 CONTACTS_ADMISSION_BULK_CONCURRENCY=2
+ADMISSION_CLASSES = {
+    # 导入、导出、查重和下载任务结果：整个文件在进程中生成或解析，占满CPU
+    'bulk': {
+        'concurrency': max(1, (os.cpu_count() or 1) // 2),
+        'queue': 4,
+        'timeout': 30.0,
+        'rate': 1.0,
+        'burst': 5,
+        'retry_after': 10,
+    },
+    # 不分页的联系人列表与收藏列表：边查询边输出全部联系人
+    'stream': {
+        'concurrency': 4,
+        'queue': 8,
+        'timeout': 10.0,
+        'rate': 2.0,
+        'burst': 10,
+        'retry_after': 5,
+    },
+    # 其余接口：单个联系人的读写、分页列表、搜索等
+    'interactive': {
+        'concurrency': 32,
+        'queue': 64,
+        'timeout': 2.0,
+        'rate': 50.0,
+        'burst': 100,
+        'retry_after': 1,
+    },
+}
+
+# 按方法和路径归为 bulk 类的接口
+BULK_ROUTES = (
+    ('GET', re.compile(r'^/api/contacts/export$')),
+    ('POST', re.compile(r'^/api/contacts/import$')),
+    ('POST', re.compile(r'^/api/contacts/dedupe$')),
+    ('GET', re.compile(r'^/api/jobs/[^/]+/result$')),
+)
+
+# 不带limit参数时返回全部结果、归为 stream 类的GET接口
+STREAM_ROUTES = ('/api/contacts', '/api/contacts/favorites')
+
+# 不做准入控制的路径（指标采集和副本同步不应被业务流量挤掉）
+EXEMPT_PREFIXES = ('/metrics', '/api/replication/')
+
+# 受信任的反向代理地址：来自这些地址的请求按 X-Real-IP 识别客户端，
+# 没有该请求头时视为本机工具直接访问，只限并发不限速
+TRUSTED_PROXIES = frozenset(
+    address.strip()
+    for address in os.environ.get('CONTACTS_TRUSTED_PROXIES', '127.0.0.1,::1').split(',')
+    if address.strip()
+)
+
+# 每个路由类别最多记录的客户端令牌桶数，超出时丢弃最久未访问的
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+# 执行请求的线程中留给 interactive 类的比例：排队的请求同样占着线程，
+# interactive 的并发数与队列长度之和不超过这部分线程，bulk 和 stream
+# 的合计不超过其余的线程
+INTERACTIVE_THREAD_SHARE = 0.5
+
+# 共用其余线程的路由类别
+THREAD_BOUND_CLASSES = ('bulk', 'stream')
+
+def _class_settings(name, defaults):
+    """读取路由类别的设置（环境变量优先）"""
+    settings = {}
+    for key, default in defaults.items():
+        value = os.environ.get(f'CONTACTS_ADMISSION_{name.upper()}_{key.upper()}')
+        settings[key] = type(default)(value) if value else default
+    return settings
+
+class ConcurrencyLimiter:
+    """带有界等待队列的信号量
+    
+    并发未满且没有排队的请求时立即放行；否则排队等待，队列已满或
+    等待超时时拒绝。
+    """
+    
+    def __init__(self, concurrency, queue, timeout):
+        """
+        初始化
+        
+        :param concurrency: 同时持有许可的最大数量
+        :param queue: 最多排队等待的数量
+        :param timeout: 排队等待的最长秒数
+        """
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._admitted = 0
+        self._queued = 0
+        self._queue_full = 0
+        self._timeouts = 0
+    
+    def acquire(self):
+        """获取许可，返回是否获得（获得后须调用 release）"""
+        with self._cond:
+            if self._active < self.concurrency and self._waiting == 0:
+                self._active += 1
+                self._admitted += 1
+                return True
+            if self._waiting >= self.queue:
+                self._queue_full += 1
+                return False
+            
+            self._waiting += 1
+            self._queued += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self._active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        # 可能刚好收到了释放通知，转交给下一个等待者
+                        self._cond.notify()
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self._admitted += 1
+            return True
+    
+    def release(self):
+        """归还许可，唤醒一个排队的请求"""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+    
+    def resize(self, concurrency, queue):
+        """调整并发数与队列长度，已放行和已排队的请求不受影响"""
+        with self._cond:
+            self.concurrency = concurrency
+            self.queue = queue
+            self._cond.notify_all()
+    
+    def stats(self):
+        """返回并发与排队指标"""
+        with self._cond:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'concurrency': self.concurrency,
+                'queue': self.queue,
+                'admitted_total': self._admitted,
+                'queued_total': self._queued,
+                'queue_full_total': self._queue_full,
+                'timeouts_total': self._timeouts,
+            }
+
+class RateLimiter:
+    """按客户端的令牌桶限速"""
+    
+    def __init__(self, rate, burst, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        """
+        初始化
+        
+        :param rate: 每秒补充的令牌数
+        :param burst: 令牌桶容量（允许的突发请求数）
+        :param max_clients: 最多记录的客户端数
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # 客户端 -> [剩余令牌, 上次补充时间]
+        self._lock = threading.Lock()
+        self._limited = 0
+    
+    def take(self, client):
+        """为客户端取一个令牌，返回0表示放行，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self._limited += 1
+            return (1 - bucket[0]) / self.rate
+    
+    def stats(self):
+        """返回限速指标"""
+        with self._lock:
+            return {'clients': len(self._buckets), 'rate_limited_total': self._limited}
+
+def classify(environ):
+    """返回请求的路由类别，不做准入控制的请求返回None"""
+    method = environ['REQUEST_METHOD']
+    path = environ.get('PATH_INFO', '')
+    if method == 'OPTIONS' or path.startswith(EXEMPT_PREFIXES):
+        return None
+    for route_method, pattern in BULK_ROUTES:
+        if method == route_method and pattern.match(path):
+            return 'bulk'
+    if method == 'GET' and path in STREAM_ROUTES and \
+            'limit' not in parse_qs(environ.get('QUERY_STRING', '')):
+        return 'stream'
+    return 'interactive'
+
+def client_address(environ):
+    """返回用于限速的客户端地址，本机直接访问（不经代理）时返回None"""
+    remote = environ.get('REMOTE_ADDR', '')
+    if remote not in TRUSTED_PROXIES:
+        return remote
+    return environ.get('HTTP_X_REAL_IP') or None
+
+_settings = {name: _class_settings(name, defaults) for name, defaults in ADMISSION_CLASSES.items()}
+_limiters = {
+    name: ConcurrencyLimiter(settings['concurrency'], settings['queue'], settings['timeout'])
+    for name, settings in _settings.items()
+}
+_rate_limiters = {
+    name: RateLimiter(settings['rate'], settings['burst'])
+    for name, settings in _settings.items()
+}
+
+def _fit_classes(names, budget):
+    """把一组路由类别的并发数与队列长度之和收紧到budget以内
+    
+    超出时按各类的并发数与队列长度之和分配，每类先保证并发，剩余的
+    作为队列；至少保留1个并发。
+    
+    Returns:
+        bool: 是否做了调整
+    """
+    demands = {name: _settings[name]['concurrency'] + _settings[name]['queue']
+               for name in names}
+    total = sum(demands.values())
+    if total <= budget:
+        return False
+    
+    for name in names:
+        share = max(1, budget * demands[name] // total)
+        concurrency = min(_settings[name]['concurrency'], share)
+        queue = min(_settings[name]['queue'], share - concurrency)
+        _settings[name].update(concurrency=concurrency, queue=queue)
+        _limiters[name].resize(concurrency, queue)
+    return True
+
+def fit_to_threads(threads):
+    """按执行请求的线程数收紧各路由类别的并发和队列
+    
+    请求（包括排队中的）都占着线程：interactive 最多占用线程数的
+    INTERACTIVE_THREAD_SHARE，bulk 和 stream 合计最多占用其余部分。
+    
+    Args:
+        threads (int): 执行请求的线程数
+    """
+    reserved = max(1, math.ceil(threads * INTERACTIVE_THREAD_SHARE))
+    changed = _fit_classes(('interactive',), reserved)
+    changed = _fit_classes(THREAD_BOUND_CLASSES, threads - reserved) or changed
+    if changed:
+        print(f"准入控制按 {threads} 个请求线程调整: " + ", ".join(
+            f"{name} 并发{_settings[name]['concurrency']} 队列{_settings[name]['queue']}"
+            for name in _settings
+        ))
+
+def admission_stats():
+    """返回各路由类别的准入指标"""
+    stats = {'enabled': ADMISSION_ENABLED}
+    for name in _settings:
+        for key, value in _limiters[name].stats().items():
+            stats[f'{name}_{key}'] = value
+        for key, value in _rate_limiters[name].stats().items():
+            stats[f'{name}_{key}'] = value
+    return stats
+
+def _reject(start_response, status, retry_after, message):
+    body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body))),
+        ('Retry-After', str(retry_after)),
+        ('Cache-Control', 'no-store'),
+    ])
+    return [body]
+
+class AdmissionMiddleware:
+    """按路由类别做准入控制的WSGI中间件
+    
+    先按客户端限速（超出返回429），再获取所属类别的并发许可（队列
+    已满或等待超时返回503），两种拒绝都带 Retry-After。许可一直持有到
+    响应正文（包括流式正文）输出完毕或被关闭，导出文件的生成也计入
+    并发。WSGI服务器按规范总会调用正文的 close()；直接调用应用的代码
+    （如测试客户端）也须读完或关闭响应，否则许可不会归还。
+    """
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        route_class = classify(environ)
+        if route_class is None:
+            return self.wsgi_app(environ, start_response)
+        
+        client = client_address(environ)
+        if client is not None:
+            wait = _rate_limiters[route_class].take(client)
+            if wait:
+                return _reject(start_response, '429 TOO MANY REQUESTS',
+                               math.ceil(wait), '请求过于频繁，请稍后重试')
+        
+        limiter = _limiters[route_class]
+        if not limiter.acquire():
+            return _reject(start_response, '503 SERVICE UNAVAILABLE',
+                           _settings[route_class]['retry_after'], '服务繁忙，请稍后重试')
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+        except BaseException:
+            limiter.release()
+            raise
+        return ClosingIterable(iterable, limiter.release)
@@ -0,0 +1,246 @@
+# 缓存配置 - 控制器读操作前的读穿透缓存
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config.sharding import current_tenant
+
+# 是否启用缓存，可通过环境变量关闭
+CACHE_ENABLED = os.environ.get('CONTACTS_CACHE', '1') != '0'
+
+# 进程内缓存的最大条目数
+CACHE_MAX_ENTRIES = 10000
+
+# 缓存条目的存活秒数（键中带有变更版本号，数据变更后旧条目不会再被读到，
+# TTL只决定旧条目占用内存的时间）
+CACHE_TTL = float(os.environ.get('CONTACTS_CACHE_TTL', '5'))
+
+class CacheBackend:
+    """缓存后端接口
+    
+    值由调用方视为只读，后端不做拷贝。缓存未命中时 get 返回None，
+    因此不缓存None值。
+    """
+    
+    def get(self, key):
+        """读取缓存，未命中或已过期返回None"""
+        raise NotImplementedError
+    
+    def set(self, key, value, ttl=None):
+        """写入缓存，ttl为None时使用CACHE_TTL"""
+        raise NotImplementedError
+    
+    def delete(self, key):
+        """删除单个缓存条目"""
+        raise NotImplementedError
+    
+    def clear(self):
+        """清空所有缓存条目"""
+        raise NotImplementedError
+    
+    def stats(self):
+        """返回命中、未命中、淘汰等计数"""
+        raise NotImplementedError
+
+class LRUCache(CacheBackend):
+    """进程内、线程安全、带TTL的LRU缓存"""
+    
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        """
+        初始化缓存
+        
+        :param max_entries: 最大条目数，超出时淘汰最久未使用的条目
+        :param ttl: 默认存活秒数
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+    
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+    
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._invalidations += 1
+    
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'lru',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits_total': self._hits,
+                'misses_total': self._misses,
+                'evictions_total': self._evictions,
+                'expirations_total': self._expirations,
+                'invalidations_total': self._invalidations,
+            }
+
+class SharedCacheBackend(CacheBackend):
+    """多进程共享的缓存后端（如Redis、Memcached）
+    
+    client 只需提供 get(key) 和 set(key, value, ttl)：get 未命中时
+    返回None，ttl为存活秒数。值以JSON保存，元组读出后为列表。缓存键
+    带有数据库的变更版本号，多个进程共享同一后端时无需失效通知。
+    
+    访问后端出错（如连接断开）时按未命中处理，请求改为直接查询数据库。
+    """
+    
+    def __init__(self, client, ttl=CACHE_TTL, prefix='contacts:'):
+        """
+        初始化缓存
+        
+        :param client: 共享缓存的客户端
+        :param ttl: 默认存活秒数
+        :param prefix: 键前缀，多个应用共用同一后端时用来区分
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._invalidations = 0
+    
+    def _key(self, key):
+        return f"{self.prefix}{self._generation}:{key}"
+    
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+    
+    def get(self, key):
+        try:
+            data = self.client.get(self._key(key))
+            value = None if data is None else json.loads(data)
+        except (OSError, ValueError) as e:
+            print(f"读取共享缓存错误: {e}")
+            self._count('_errors')
+            value = None
+        self._count('_misses' if value is None else '_hits')
+        return value
+    
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        try:
+            self.client.set(self._key(key), data,
+                            self.ttl if ttl is None else ttl)
+        except OSError as e:
+            print(f"写入共享缓存错误: {e}")
+            self._count('_errors')
+    
+    def delete(self, key):
+        # 写入null，其他进程读到后按未命中处理
+        self.set(key, None)
+        self._count('_invalidations')
+    
+    def clear(self):
+        # 只有本进程改用新的键前缀，其他进程的条目到期后自然淘汰
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'shared',
+                'ttl_seconds': self.ttl,
+                'hits_total': self._hits,
+                'misses_total': self._misses,
+                'errors_total': self._errors,
+                'invalidations_total': self._invalidations,
+            }
+
+class _NullCache(CacheBackend):
+    """缓存关闭时使用的空实现"""
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, value, ttl=None):
+        pass
+    
+    def delete(self, key):
+        pass
+    
+    def clear(self):
+        pass
+    
+    def stats(self):
+        return {'backend': 'disabled'}
+
+_cache = LRUCache() if CACHE_ENABLED else _NullCache()
+
+def get_cache():
+    """返回当前使用的缓存后端"""
+    return _cache
+
+def set_cache_backend(backend):
+    """替换缓存后端（例如接入共享缓存）"""
+    global _cache
+    _cache = backend
+
+def _tenant_prefix():
+    """当前租户的缓存键前缀，不同分片中ID相同的联系人不会互相命中"""
+    tenant = current_tenant()
+    return "" if tenant is None else f"tenant:{tenant}:"
+
+# 缓存键中的版本号来自数据库中的变更日志（contact_changes），任何进程
+# （包括其他worker和副本的同步进程）提交的修改都会使版本号增大，读到
+# 新版本号的请求自然使用新的键，不需要在写操作后逐个删除缓存。
+
+def contact_key(contact_id, version):
+    """单个联系人的缓存键，version为该联系人的变更版本号"""
+    return f"{_tenant_prefix()}contact:{contact_id}:{version}"
+
+def methods_key(contact_id, version):
+    """联系人联系方式列表的缓存键，version为该联系人的变更版本号"""
+    return f"{_tenant_prefix()}methods:{contact_id}:{version}"
+
+def list_key(version, name, *params):
+    """列表查询的缓存键，包含整表的变更版本号和查询参数"""
+    return f"{_tenant_prefix()}list:{version}:{name}:{params!r}"
+
+def cache_stats():
+    """返回缓存指标"""
+    return dict(_cache.stats())
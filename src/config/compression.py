@@ -0,0 +1,249 @@
+# 响应压缩 - 按Accept-Encoding协商，用gzip（安装brotli时优先br）压缩API响应
+import os
+import zlib
+from functools import partial
+from itertools import chain
+
+from werkzeug.http import parse_accept_header
+
+from config.metrics import ClosingIterable
+
+try:
+    import brotli
+except ImportError:  # brotli是可选依赖，未安装时只提供gzip
+    brotli = None
+
+# 是否压缩响应，可通过环境变量关闭（例如由前置的Nginx负责压缩时）
+COMPRESSION_ENABLED = os.environ.get('CONTACTS_COMPRESSION', '1') != '0'
+
+# 小于该字节数的响应不压缩（压缩收益抵不过开销）
+COMPRESSION_MIN_SIZE = int(os.environ.get('CONTACTS_COMPRESSION_MIN_SIZE', '1024'))
+
+# 已知长度的响应不超过该字节数时整体压缩并给出Content-Length，更大的
+# 响应（如导出任务的结果文件）改为边读边压缩，不把正文读入内存
+COMPRESSION_BUFFER_MAX_SIZE = int(
+    os.environ.get('CONTACTS_COMPRESSION_BUFFER_MAX_SIZE', str(1024 * 1024))
+)
+
+# gzip压缩级别（1-9），级别越高压缩率越高、CPU开销越大
+GZIP_LEVEL = int(os.environ.get('CONTACTS_GZIP_LEVEL', '6'))
+
+# brotli压缩质量（0-11），动态内容用较低的质量
+BROTLI_QUALITY = int(os.environ.get('CONTACTS_BROTLI_QUALITY', '4'))
+
+# 需要压缩的响应类型（Excel文件本身是zip，不再压缩）
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'application/json',
+    'application/x-ndjson',
+    'text/plain',
+    'text/csv',
+    'text/html',
+    'text/css',
+    'application/javascript',
+])
+
+# 没有正文、不能改变正文的状态码
+_UNCOMPRESSIBLE_STATUSES = frozenset(['204', '206', '304'])
+
+def supported_encodings():
+    """服务端支持的编码，按优先顺序排列"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate_encoding(accept_encoding):
+    """按请求头Accept-Encoding选择编码，不接受任何支持的编码时返回None"""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    best, quality = None, 0
+    for encoding in supported_encodings():
+        # 同等权重时按服务端的优先顺序（br优先）
+        if accepted[encoding] > quality:
+            best, quality = encoding, accepted[encoding]
+    return best
+
+class _GzipEncoder:
+    """gzip流式编码器"""
+    
+    def __init__(self, level=GZIP_LEVEL):
+        # wbits=31 输出带gzip头和校验的格式
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, data, flush=False):
+        output = self.compressor.compress(data)
+        if flush:
+            output += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return output
+    
+    def finish(self):
+        return self.compressor.flush()
+
+class _BrotliEncoder:
+    """brotli流式编码器"""
+    
+    def __init__(self, quality=BROTLI_QUALITY):
+        self.compressor = brotli.Compressor(quality=quality)
+    
+    def compress(self, data, flush=False):
+        output = self.compressor.process(data)
+        if flush:
+            output += self.compressor.flush()
+        return output
+    
+    def finish(self):
+        return self.compressor.finish()
+
+def _make_encoder(encoding):
+    return _BrotliEncoder() if encoding == 'br' else _GzipEncoder()
+
+def _header(headers, name):
+    """读取响应头（不区分大小写），不存在时返回None"""
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+def _is_compressible(status, headers):
+    """按状态码和响应头判断正文能否压缩"""
+    if status.split(' ', 1)[0] in _UNCOMPRESSIBLE_STATUSES:
+        return False
+    content_type = _header(headers, 'Content-Type')
+    if content_type is None or \
+            content_type.split(';', 1)[0].strip().lower() not in COMPRESSIBLE_MIMETYPES:
+        return False
+    if _header(headers, 'Content-Encoding') or _header(headers, 'Content-Range'):
+        return False
+    return 'no-transform' not in (_header(headers, 'Cache-Control') or '')
+
+def _rewrite_headers(headers, encoding, length=None):
+    """改写响应头：加上Content-Encoding，ETag改为弱校验，按需重设长度"""
+    rewritten = []
+    for key, value in headers:
+        lowered = key.lower()
+        if lowered == 'content-length':
+            continue
+        if lowered == 'etag' and not value.startswith('W/'):
+            # 压缩后的正文与原文字节不同，强ETag改为弱ETag（与Nginx的gzip一致）
+            value = 'W/' + value
+        rewritten.append((key, value))
+    rewritten.append(('Content-Encoding', encoding))
+    if length is not None:
+        rewritten.append(('Content-Length', str(length)))
+    return rewritten
+
+def _add_vary(headers):
+    """响应随Accept-Encoding变化，通知缓存按编码分别保存"""
+    vary = _header(headers, 'Vary')
+    if vary is None:
+        return headers + [('Vary', 'Accept-Encoding')]
+    if 'accept-encoding' in vary.lower() or vary.strip() == '*':
+        return headers
+    return [(key, value + ', Accept-Encoding' if key.lower() == 'vary' else value)
+            for key, value in headers]
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+def _iter_compressed(iterable, encoder, flush=True):
+    """逐块压缩正文
+    
+    flush为True时每块都刷新输出，客户端可以边收边解压；下载文件时
+    不刷新，压缩率与整体压缩相同。
+    """
+    try:
+        for chunk in iterable:
+            if chunk:
+                output = encoder.compress(chunk, flush=flush)
+                if output:
+                    yield output
+        yield encoder.finish()
+    finally:
+        _close(iterable)
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """把字节片段压缩为一个完整gzip文件的各个片段（用于下载.gz文件）
+    
+    与流式响应不同，各片段之间不刷新，压缩率与整体压缩相同。
+    """
+    encoder = _GzipEncoder(level)
+    try:
+        for chunk in chunks:
+            output = encoder.compress(chunk)
+            if output:
+                yield output
+        yield encoder.finish()
+    finally:
+        _close(chunks)
+
+class CompressionMiddleware:
+    """按Accept-Encoding压缩响应正文的WSGI中间件
+    
+    只压缩 COMPRESSIBLE_MIMETYPES 中的类型。已知长度的响应小于
+    min_size时原样返回，不超过buffer_max_size时整体压缩并重设
+    Content-Length，更大的去掉Content-Length后边读边压缩；流式响应
+    （没有Content-Length）逐块压缩并刷新，不改变边生成边输出的特性。
+    """
+    
+    def __init__(self, wsgi_app, min_size=COMPRESSION_MIN_SIZE,
+                 buffer_max_size=COMPRESSION_BUFFER_MAX_SIZE):
+        """
+        初始化
+        
+        :param wsgi_app: 被包装的WSGI应用
+        :param min_size: 压缩的最小正文字节数
+        :param buffer_max_size: 整体压缩的最大正文字节数
+        """
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.buffer_max_size = buffer_max_size
+    
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        captured = {}
+        written = []
+        
+        def capture(status, headers, exc_info=None):
+            # 推迟到确定是否压缩之后再调用上层的start_response
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            # 通过write输出的正文先暂存，放在返回的正文之前
+            return written.append
+        
+        iterable = self.wsgi_app(environ, capture)
+        if written:
+            iterable = ClosingIterable(chain(written, iterable),
+                                       partial(_close, iterable))
+        status = captured['status']
+        headers = list(captured['headers'])
+        exc_info = captured['exc_info']
+        
+        if not _is_compressible(status, headers):
+            start_response(status, headers, exc_info)
+            return iterable
+        headers = _add_vary(headers)
+        
+        length = _header(headers, 'Content-Length')
+        if encoding is None or (length is not None and int(length) < self.min_size):
+            start_response(status, headers, exc_info)
+            return iterable
+        
+        encoder = _make_encoder(encoding)
+        if length is None:
+            start_response(status, _rewrite_headers(headers, encoding), exc_info)
+            return _iter_compressed(iterable, encoder)
+        if int(length) > self.buffer_max_size:
+            # 压缩后的长度要读完才知道，以分块编码发送
+            start_response(status, _rewrite_headers(headers, encoding), exc_info)
+            return _iter_compressed(iterable, encoder, flush=False)
+        
+        # 正文不大，整体压缩后可以给出准确的Content-Length
+        try:
+            body = b''.join(iterable)
+        finally:
+            _close(iterable)
+        output = encoder.compress(body) + encoder.finish()
+        start_response(status, _rewrite_headers(headers, encoding, len(output)), exc_info)
+        return [output]
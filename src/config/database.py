@@ -1,56 +1,930 @@
 # 数据库配置与连接管理
+import os
 import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from sqlite3 import Error
 
+from config.metrics import (
+    connection_factory,
+    instrument_connection,
+    record_connection_open
+)
+
 # 数据库文件名（自动创建）
 DATABASE_NAME = "contacts.db"
 
-def create_connection():
-    """创建并返回数据库连接"""
+# 连接池最大连接数
+POOL_SIZE = 8
+
+# 连接池耗尽时等待空闲连接的最长秒数
+POOL_TIMEOUT = 10.0
+
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 128
+
+# 空闲超过该秒数的连接在取出前做一次健康检查
+HEALTH_CHECK_INTERVAL = 30.0
+
+# 存储配置档（每个连接建立时执行的PRAGMA）
+#   default:    SQLite默认设置（回滚日志、synchronous=FULL）
+#   concurrent: WAL日志，读写互不阻塞，适合多worker部署
+STORAGE_PROFILES = {
+    'default': {
+        'busy_timeout': 5000,
+    },
+    'concurrent': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # 负数单位为KiB，即64MB
+        'temp_store': 'MEMORY',
+    },
+}
+
+# 使用的存储配置档，可通过环境变量覆盖
+STORAGE_PROFILE = os.environ.get('CONTACTS_DB_PROFILE', 'concurrent')
+
+# 是否启用单写者通道：进程内的写事务排队执行，避免多个线程争抢写锁
+SINGLE_WRITER = os.environ.get('CONTACTS_DB_SINGLE_WRITER', '1') != '0'
+
+# 嵌套写事务使用的保存点名称（同名保存点按最近的一个回滚或释放）
+NESTED_SAVEPOINT = 'nested_write'
+
+def apply_storage_profile(conn, profile=None):
+    """对连接执行存储配置档中的PRAGMA"""
+    pragmas = STORAGE_PROFILES[profile or STORAGE_PROFILE]
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def create_connection(database=None):
+    """创建并返回数据库连接，database为None时连接DATABASE_NAME"""
     conn = None
     try:
         # 连接SQLite数据库（文件不存在则自动创建）
-        conn = sqlite3.connect(DATABASE_NAME)
+        conn = sqlite3.connect(database or DATABASE_NAME)
+        apply_storage_profile(conn)
         return conn
     except Error as e:
         print(f"数据库连接错误: {e}")
     return conn
 
-def init_database():
-    """初始化数据库（创建必要的表）"""
-    conn = create_connection()
-    if conn is not None:
+class PoolTimeoutError(sqlite3.OperationalError):
+    """等待连接池空闲连接超时"""
+
+# 按数据库文件共用的单写者锁。分片连接池被淘汰后可能在旧连接池仍有
+# 请求时重新创建，两个连接池必须共用同一把锁才能保证单写者
+_write_locks = weakref.WeakValueDictionary()
+_write_locks_guard = threading.Lock()
+
+def _shared_write_lock(database):
+    """返回数据库文件的单写者锁，没有连接池再使用时自动释放"""
+    key = os.path.abspath(database)
+    with _write_locks_guard:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = _write_locks[key] = threading.Lock()
+        return lock
+
+class ConnectionPool:
+    """有界、线程安全的SQLite连接池
+    
+    连接跨线程复用（check_same_thread=False），同一时刻只被一个线程
+    持有。同一线程内嵌套调用 connection() 会复用已取出的连接，避免
+    控制器函数互相调用时重复建立连接。写操作通过 write_connection()
+    在单个 BEGIN IMMEDIATE 事务中完成。
+    """
+    
+    def __init__(self, database, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 profile=None, single_writer=None):
+        """
+        初始化连接池
+        
+        :param database: 数据库文件路径
+        :param size: 最大连接数
+        :param timeout: 等待空闲连接的最长秒数
+        :param profile: 存储配置档名称，默认使用STORAGE_PROFILE
+        :param single_writer: 是否启用单写者通道，默认使用SINGLE_WRITER
+        """
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile or STORAGE_PROFILE
+        self.single_writer = SINGLE_WRITER if single_writer is None else single_writer
+        self._write_lock = _shared_write_lock(database)
+        self._closed = False
+        self._idle = []  # (连接, 归还时间)，后进先出
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # 统计指标
+        self._opened = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._write_transactions = 0
+        self._write_wait_time_total = 0.0
+    
+    def _open(self):
+        """新建一个连接"""
+        conn = sqlite3.connect(
+            self.database,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=connection_factory()
+        )
         try:
-            cursor = conn.cursor()
-            # 创建联系人表，添加收藏字段
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS contacts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                email TEXT,
-                address TEXT,
-                is_favorite INTEGER DEFAULT 0
-            )
-            ''')
-            
-            # 创建联系方式表，支持多种联系方式
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS contact_methods (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                contact_id INTEGER NOT NULL,
-                method_type TEXT NOT NULL,
-                method_value TEXT NOT NULL,
-                is_primary INTEGER DEFAULT 0,
-                FOREIGN KEY (contact_id) REFERENCES contacts (id) ON DELETE CASCADE
-            )
-            ''')
+            apply_storage_profile(conn, self.profile)
+        except Error:
+            conn.close()
+            raise
+        instrument_connection(conn)
+        record_connection_open()
+        with self._cond:
+            self._opened += 1
+        return conn
+    
+    def _is_healthy(self, conn):
+        """检查连接是否仍然可用"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Error:
+            return False
+    
+    def acquire(self, timeout=None):
+        """取出一个连接，池满时最多等待timeout秒
+        
+        Raises:
+            PoolTimeoutError: 等待超时
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        released_at = None
+        waited = False
+        
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError("等待数据库连接超时")
+                waited = True
+                self._cond.wait(remaining)
             
+            wait_time = time.monotonic() - start
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+        
+        if conn is not None:
+            idle_for = time.monotonic() - released_at
+            if idle_for < HEALTH_CHECK_INTERVAL or self._is_healthy(conn):
+                return conn
+            with self._cond:
+                self._health_check_failures += 1
+            try:
+                conn.close()
+            except Error:
+                pass
+        
+        try:
+            return self._open()
+        except BaseException:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+    
+    def release(self, conn):
+        """归还连接，未结束的事务会被回滚；连接池已关闭时直接关闭连接"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            self.discard(conn)
+            return
+        if self._closed:
+            self.discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def discard(self, conn):
+        """关闭并丢弃一个已损坏的连接"""
+        try:
+            conn.close()
+        except Error:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+    
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式使用连接
+        
+        出现异常时回滚事务；同一线程内嵌套使用时复用同一个连接，
+        内层不回滚，异常继续抛出，事务由最外层负责回滚或提交。
+        """
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+        
+        conn = self.acquire()
+        local.conn = conn
+        local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            local.conn = None
+            local.depth = 0
+            self.release(conn)
+    
+    @contextmanager
+    def write_connection(self, separate=False):
+        """以单个写事务的方式使用连接
+        
+        进入时执行 BEGIN IMMEDIATE 立即取得写锁，正常退出时提交，
+        出现异常时回滚。启用单写者通道时，进程内的写事务依次执行；
+        嵌套调用并入外层事务，在保存点中执行：内层出现异常时只撤销
+        内层的修改并继续抛出，由外层决定回滚还是继续。
+        
+        separate为True时不复用当前线程正在读取的连接，另取一个连接执行
+        写事务（如在流式导出的过程中记录进度），仍然经过单写者通道。
+        
+        Raises:
+            PoolTimeoutError: 等待写入通道超时
+        """
+        local = self._local
+        if getattr(local, 'writing', False):
+            with self.connection() as conn:
+                conn.execute(f"SAVEPOINT {NESTED_SAVEPOINT}")
+                try:
+                    yield conn
+                except BaseException:
+                    # 部分错误（如磁盘已满）会让SQLite自动回滚整个事务，保存点随之消失
+                    if conn.in_transaction:
+                        conn.execute(f"ROLLBACK TO {NESTED_SAVEPOINT}")
+                        conn.execute(f"RELEASE {NESTED_SAVEPOINT}")
+                    raise
+                conn.execute(f"RELEASE {NESTED_SAVEPOINT}")
+            return
+        
+        locked = False
+        if self.single_writer:
+            start = time.monotonic()
+            if not self._write_lock.acquire(timeout=self.timeout):
+                with self._cond:
+                    self._timeouts += 1
+                raise PoolTimeoutError("等待写入通道超时")
+            locked = True
+            with self._cond:
+                self._write_transactions += 1
+                self._write_wait_time_total += time.monotonic() - start
+        try:
+            if separate:
+                conn = self.acquire()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    yield conn
+                    conn.commit()
+                finally:
+                    self.release(conn)
+                return
+            with self.connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                local.writing = True
+                try:
+                    yield conn
+                    if conn.in_transaction:
+                        conn.commit()
+                finally:
+                    local.writing = False
+        finally:
+            if locked:
+                self._write_lock.release()
+    
+    def in_write_transaction(self):
+        """当前线程是否处于 write_connection() 开启的写事务中"""
+        return getattr(self._local, 'writing', False)
+    
+    def close_all(self):
+        """关闭所有空闲连接（用于进程退出或切换数据库文件）"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Error:
+                pass
+    
+    def close(self):
+        """关闭连接池：关闭空闲连接，使用中的连接在归还时关闭"""
+        self._closed = True
+        self.close_all()
+    
+    def stats(self):
+        """返回连接池指标"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle),
+                'in_use': self._created - len(self._idle),
+                'opened_total': self._opened,
+                'checkouts_total': self._checkouts,
+                'waits_total': self._waits,
+                'wait_seconds_total': self._wait_time_total,
+                'wait_seconds_max': self._wait_time_max,
+                'timeouts_total': self._timeouts,
+                'health_check_failures_total': self._health_check_failures,
+                'write_transactions_total': self._write_transactions,
+                'write_wait_seconds_total': self._write_wait_time_total,
+                'profile': self.profile,
+                'single_writer': self.single_writer,
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# 当前请求（或任务）绑定的连接池，未绑定时使用全局连接池
+_bound_pool = ContextVar('contacts_bound_pool', default=None)
+
+def bind_pool(pool):
+    """把当前上下文的数据库访问切换到指定连接池，None恢复为全局连接池
+    
+    用于按租户分片（见 config.sharding）。绑定保存在ContextVar中，
+    线程池中执行的任务需要通过 contextvars.copy_context() 继承绑定。
+    """
+    _bound_pool.set(pool)
+
+def get_pool():
+    """返回当前上下文绑定的连接池，未绑定时返回全局连接池（首次调用时创建）"""
+    bound = _bound_pool.get()
+    if bound is not None:
+        return bound
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 第一次取连接时才检查数据库结构，导入模块和创建应用不访问数据库
+                ensure_schema()
+                _pool = ConnectionPool(DATABASE_NAME)
+    return _pool
+
+def close_pool():
+    """关闭全局连接池的空闲连接（服务关闭时调用），连接池未创建时不做任何事"""
+    if _pool is not None:
+        _pool.close_all()
+
+def get_connection():
+    """从连接池取出连接的上下文管理器
+    
+    用法::
+        
+        with get_connection() as conn:
+            conn.execute(...)
+    """
+    return get_pool().connection()
+
+def in_write_transaction():
+    """当前线程是否处于写事务中（写事务内应读取未提交的最新数据）"""
+    return get_pool().in_write_transaction()
+
+def write_connection(separate=False):
+    """取出连接并开启写事务的上下文管理器，退出时自动提交
+    
+    用法::
+        
+        with write_connection() as conn:
+            conn.execute("UPDATE ...")
+    
+    Args:
+        separate (bool): 为True时另取一个连接，不并入当前线程正在使用的连接
+    """
+    return get_pool().write_connection(separate=separate)
+
+# 全文检索虚拟表（FTS5），rowid与contacts.id一致
+# trigram分词按任意三个字符的子串建索引，中文姓名中间的字和号码尾号
+# 都能命中；phone列只保存数字
+FTS_TABLE_SQL = '''
+CREATE VIRTUAL TABLE contacts_fts USING fts5(
+    name, phone, email, address, methods,
+    tokenize = 'trigram'
+)
+'''
+
+# 号码中忽略的分隔符
+PHONE_SEPARATORS = ('-', ' ', '+', '(', ')', '.')
+
+def _phone_digits_sql(expr):
+    """生成去掉号码中常见分隔符的SQL表达式"""
+    for separator in PHONE_SEPARATORS:
+        expr = f"replace({expr}, '{separator}', '')"
+    return expr
+
+def _fts_insert_sql(where_clause=""):
+    """生成从contacts（及其联系方式）写入全文索引行的SQL语句"""
+    return f'''
+    INSERT INTO contacts_fts (rowid, name, phone, email, address, methods)
+    SELECT c.id, c.name, {_phone_digits_sql('c.phone')}, c.email, c.address,
+           (SELECT group_concat(m.method_value, ' ')
+              FROM contact_methods AS m WHERE m.contact_id = c.id)
+      FROM contacts AS c {where_clause}'''
+
+def _fts_refresh_sql(contact_id_expr):
+    """生成按联系人ID重建全文索引行的SQL语句（用于触发器）"""
+    return f'''
+    DELETE FROM contacts_fts WHERE rowid = {contact_id_expr};
+    {_fts_insert_sql(f"WHERE c.id = {contact_id_expr}")};'''
+
+def _fts_trigger_sqls():
+    """生成保持全文索引与contacts、contact_methods同步的触发器"""
+    refresh_new_contact = _fts_refresh_sql('NEW.id')
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts
+        BEGIN {refresh_new_contact} END""",
+        # 全文索引只包含文本列，收藏等其他列变化时不重建
+        f"""CREATE TRIGGER IF NOT EXISTS contacts_fts_au
+        AFTER UPDATE OF name, phone, email, address ON contacts
+        BEGIN
+            DELETE FROM contacts_fts WHERE rowid = OLD.id;
+            {refresh_new_contact}
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts
+        BEGIN DELETE FROM contacts_fts WHERE rowid = OLD.id; END""",
+        f"""CREATE TRIGGER IF NOT EXISTS contact_methods_fts_ai AFTER INSERT ON contact_methods
+        BEGIN {_fts_refresh_sql('NEW.contact_id')} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS contact_methods_fts_au AFTER UPDATE ON contact_methods
+        BEGIN
+            {_fts_refresh_sql('OLD.contact_id')}
+            {_fts_refresh_sql('NEW.contact_id')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS contact_methods_fts_ad AFTER DELETE ON contact_methods
+        BEGIN {_fts_refresh_sql('OLD.contact_id')} END""",
+    ]
+
+def init_full_text_index(cursor):
+    """创建全文检索表和同步触发器，首次创建时回填已有数据
+    
+    SQLite未编译FTS5时只输出日志，搜索接口会退回LIKE查询。
+    """
+    try:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contacts_fts'"
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(FTS_TABLE_SQL)
+            # 回填已有联系人
+            cursor.execute(_fts_insert_sql())
+        for trigger_sql in _fts_trigger_sqls():
+            cursor.execute(trigger_sql)
+    except Error as e:
+        print(f"创建全文索引错误: {e}")
+
+def _migrate_base_tables(cursor):
+    """创建联系人表和联系方式表，补齐旧库缺少的is_favorite字段"""
+    # 创建联系人表，添加收藏字段
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS contacts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        email TEXT,
+        address TEXT,
+        is_favorite INTEGER DEFAULT 0
+    )
+    ''')
+    
+    # 早期版本的contacts表没有is_favorite字段
+    cursor.execute("PRAGMA table_info(contacts)")
+    if 'is_favorite' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE contacts ADD COLUMN is_favorite INTEGER DEFAULT 0")
+    
+    # 创建联系方式表，支持多种联系方式
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS contact_methods (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        contact_id INTEGER NOT NULL,
+        method_type TEXT NOT NULL,
+        method_value TEXT NOT NULL,
+        is_primary INTEGER DEFAULT 0,
+        FOREIGN KEY (contact_id) REFERENCES contacts (id) ON DELETE CASCADE
+    )
+    ''')
+
+def _migrate_jobs_table(cursor):
+    """创建后台任务表（导入导出任务的状态、进度与断点）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        processed INTEGER DEFAULT 0,
+        total INTEGER,
+        checkpoint INTEGER DEFAULT 0,
+        input_path TEXT,
+        result_path TEXT,
+        result TEXT,
+        error TEXT,
+        attempt INTEGER DEFAULT 0,
+        created_at REAL,
+        started_at REAL,
+        updated_at REAL,
+        finished_at REAL
+    )
+    ''')
+
+def _migrate_secondary_indexes(cursor):
+    """为常用查询条件创建二级索引"""
+    # 按联系人查询、重置主要联系方式、级联删除联系方式
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contact_methods_contact_id "
+        "ON contact_methods (contact_id)"
+    )
+    # 收藏过滤
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contacts_is_favorite "
+        "ON contacts (is_favorite)"
+    )
+    # 按号码查找
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contacts_phone ON contacts (phone)"
+    )
+    # 按姓名查找与排序（不区分大小写）
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contacts_name_nocase "
+        "ON contacts (name COLLATE NOCASE)"
+    )
+
+def _migrate_change_log(cursor):
+    """创建联系人变更日志表及触发器，用于ETag与增量同步
+    
+    联系人或其联系方式每次新增、修改、删除都写入一行，自增的version
+    就是整表的变更计数器。日志只记录联系人ID，客户端按ID重新读取当前
+    数据，读不到即表示已删除。
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS contact_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        contact_id INTEGER NOT NULL
+    )
+    ''')
+    # 查询单个联系人的最新版本号
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contact_changes_contact_id "
+        "ON contact_changes (contact_id, version)"
+    )
+    
+    log_sql = "INSERT INTO contact_changes (contact_id) VALUES ({});"
+    triggers = [
+        ('contacts_changes_ai', 'AFTER INSERT ON contacts', log_sql.format('NEW.id')),
+        ('contacts_changes_au', 'AFTER UPDATE ON contacts', log_sql.format('NEW.id')),
+        ('contacts_changes_ad', 'AFTER DELETE ON contacts', log_sql.format('OLD.id')),
+        ('contact_methods_changes_ai', 'AFTER INSERT ON contact_methods',
+         log_sql.format('NEW.contact_id')),
+        # 联系方式改挂到其他联系人时，新旧联系人都记为已变更
+        ('contact_methods_changes_au', 'AFTER UPDATE ON contact_methods',
+         log_sql.format('NEW.contact_id') +
+         " INSERT INTO contact_changes (contact_id) SELECT OLD.contact_id"
+         " WHERE OLD.contact_id != NEW.contact_id;"),
+        ('contact_methods_changes_ad', 'AFTER DELETE ON contact_methods',
+         log_sql.format('OLD.contact_id')),
+    ]
+    for name, event, body in triggers:
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+# 参与去重匹配的号码最少位数（更短的号码如分机号不作为匹配依据）
+PHONE_KEY_MIN_LENGTH = 5
+
+def phone_key_sql(expr):
+    """生成号码匹配键的SQL表达式：'p:' 加规范化的数字串，不是号码时为NULL
+    
+    去掉分隔符后必须全为数字，并去掉 86/0086 国家码，例如
+    "+86 138-0000-0000" 与 "13800000000" 的匹配键相同。
+    """
+    digits = _phone_digits_sql(expr)
+    return (
+        f"CASE WHEN length({digits}) < {PHONE_KEY_MIN_LENGTH} "
+        f"OR {digits} GLOB '*[^0-9]*' THEN NULL "
+        f"WHEN length({digits}) = 13 AND {digits} GLOB '86*' THEN 'p:' || substr({digits}, 3) "
+        f"WHEN length({digits}) = 15 AND {digits} GLOB '0086*' THEN 'p:' || substr({digits}, 5) "
+        f"ELSE 'p:' || {digits} END"
+    )
+
+def email_key_sql(expr):
+    """生成邮箱匹配键的SQL表达式：'e:' 加去空格、转小写的地址，不是邮箱时为NULL"""
+    return f"CASE WHEN instr(trim({expr}), '@') > 1 THEN 'e:' || lower(trim({expr})) END"
+
+def method_key_sql(expr):
+    """生成联系方式匹配键的SQL表达式：含@的按邮箱、否则按号码规范化"""
+    return (
+        f"CASE WHEN instr(trim({expr}), '@') > 1 THEN 'e:' || lower(trim({expr})) "
+        f"ELSE {phone_key_sql(expr)} END"
+    )
+
+def _migrate_dedupe_keys(cursor):
+    """为号码、邮箱和联系方式的匹配键创建表达式索引，用于查重与合并导入
+    
+    查询时必须使用 phone_key_sql 等函数生成的同一表达式才能命中索引。
+    联系方式的索引包含contact_id，按匹配键顺序扫描时无需回表。
+    索引只收录匹配键非空的行：微信号、网址等不参与匹配的联系方式占多
+    数时，全表统计会让查询计划器误判索引的选择性而改为全表扫描。
+    """
+    for name, table, expr, extra in (
+        ('idx_contacts_phone_key', 'contacts', phone_key_sql('phone'), ''),
+        ('idx_contacts_email_key', 'contacts', email_key_sql('email'), ''),
+        ('idx_contact_methods_value_key', 'contact_methods',
+         method_key_sql('method_value'), ', contact_id'),
+    ):
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON {table} ({expr}{extra}) WHERE {expr} IS NOT NULL"
+        )
+
+def _migrate_job_params(cursor):
+    """为后台任务表增加参数字段（JSON）"""
+    cursor.execute("PRAGMA table_info(jobs)")
+    if 'params' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE jobs ADD COLUMN params TEXT")
+
+# 当前Unix时间戳（秒）的SQL表达式，供触发器使用
+_NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+def next_favorite_rank_sql():
+    """新收藏联系人的排序值：排在所有收藏之后（由索引直接取最大值）"""
+    return ("(SELECT coalesce(max(favorite_rank), 0) + 1 "
+            "FROM contacts WHERE is_favorite = 1)")
+
+def _migrate_favorites(cursor):
+    """为收藏增加收藏时间和用户排序值，并创建按收藏顺序排列的索引
+    
+    toggle_favorite 在切换收藏的同一条UPDATE中维护这两列；新增、编辑、
+    导入联系人时由触发器补齐。全文索引的更新触发器收窄为只在文本列
+    变化时执行，收藏不再重建全文索引行。
+    """
+    cursor.execute("PRAGMA table_info(contacts)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'favorited_at' not in columns:
+        cursor.execute("ALTER TABLE contacts ADD COLUMN favorited_at REAL")
+    if 'favorite_rank' not in columns:
+        cursor.execute("ALTER TABLE contacts ADD COLUMN favorite_rank REAL")
+    
+    # 先替换全文索引触发器，下面的回填不会重建全文索引
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contacts_fts'"
+    )
+    if cursor.fetchone() is not None:
+        cursor.execute("DROP TRIGGER IF EXISTS contacts_fts_au")
+        init_full_text_index(cursor)
+    
+    # 已收藏的联系人按ID排序
+    cursor.execute(
+        """UPDATE contacts SET favorite_rank = id, favorited_at = ?
+           WHERE is_favorite = 1 AND favorite_rank IS NULL""",
+        (time.time(),)
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_contacts_favorite_rank "
+        "ON contacts (is_favorite, favorite_rank)"
+    )
+    
+    next_rank = next_favorite_rank_sql()
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS contacts_favorite_ai AFTER INSERT ON contacts
+    WHEN NEW.is_favorite = 1 AND NEW.favorite_rank IS NULL
+    BEGIN
+        UPDATE contacts SET favorited_at = coalesce(NEW.favorited_at, {_NOW_SQL}),
+                            favorite_rank = {next_rank}
+        WHERE id = NEW.id;
+    END""")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS contacts_favorite_au AFTER UPDATE OF is_favorite ON contacts
+    WHEN (NEW.is_favorite = 1) != (NEW.favorite_rank IS NOT NULL)
+    BEGIN
+        UPDATE contacts
+        SET favorited_at = CASE WHEN NEW.is_favorite = 1 THEN {_NOW_SQL} END,
+            favorite_rank = CASE WHEN NEW.is_favorite = 1 THEN {next_rank} END
+        WHERE id = NEW.id;
+    END""")
+
+def _migrate_fts_trigram(cursor):
+    """把全文索引改为trigram分词并重建
+    
+    unicode61把连续的中文当作一个词，搜“三”找不到“张三”。trigram
+    按子串匹配，号码尾号也能直接命中，不再需要倒序号码列。已是trigram
+    的索引（新建的库由迁移4直接创建）不重建。
+    """
+    cursor.execute(
+        "SELECT sql FROM sqlite_master "
+        "WHERE type = 'table' AND name = 'contacts_fts'"
+    )
+    row = cursor.fetchone()
+    if row is not None and 'trigram' in row[0]:
+        return
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND sql LIKE '%contacts_fts%'"
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    cursor.execute("DROP TABLE IF EXISTS contacts_fts")
+    init_full_text_index(cursor)
+
+# 数据库迁移列表：(版本号, 说明, 迁移函数)，版本号记录在PRAGMA user_version中
+# 迁移函数必须幂等，以兼容在引入版本号之前就已建表的旧库
+MIGRATIONS = [
+    (1, '创建联系人与联系方式表', _migrate_base_tables),
+    (2, '创建后台任务表', _migrate_jobs_table),
+    (3, '创建二级索引', _migrate_secondary_indexes),
+    (4, '创建全文检索索引', init_full_text_index),
+    (5, '创建联系人变更日志', _migrate_change_log),
+    (6, '创建去重匹配索引', _migrate_dedupe_keys),
+    (7, '为后台任务增加参数字段', _migrate_job_params),
+    (8, '整理收藏排序与收藏时间', _migrate_favorites),
+    (9, '全文索引改为trigram分词', _migrate_fts_trigram),
+]
+
+# 当前代码对应的数据库结构版本
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """读取数据库的结构版本号"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """依次执行尚未应用的迁移，每个迁移单独提交
+    
+    每个迁移在 BEGIN IMMEDIATE 事务中执行，并在事务内重新确认版本
+    号，多个进程同时启动时只有一个会真正执行迁移。
+    
+    Args:
+        conn: 数据库连接
+    
+    Returns:
+        list: 本次应用的迁移版本号列表
+    
+    Raises:
+        sqlite3.Error: 迁移执行失败（该迁移整体回滚）
+    """
+    applied = []
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return applied
+    
+    cursor = conn.cursor()
+    for version, description, apply in MIGRATIONS:
+        if conn.in_transaction:
+            conn.commit()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
             conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"已应用数据库迁移 {version}: {description}")
+    return applied
+
+# 关键查询及其应使用的索引，用于检查执行计划
+QUERY_PLAN_EXPECTATIONS = [
+    ("SELECT * FROM contact_methods WHERE contact_id = ?", (1,),
+     'idx_contact_methods_contact_id'),
+    ("UPDATE contact_methods SET is_primary = 0 WHERE contact_id = ? AND id != ?",
+     (1, 1), 'idx_contact_methods_contact_id'),
+    ("DELETE FROM contact_methods WHERE contact_id = ?", (1,),
+     'idx_contact_methods_contact_id'),
+    ("SELECT * FROM contacts WHERE is_favorite = ? AND id > ? ORDER BY id LIMIT 50",
+     (1, 0), 'idx_contacts_is_favorite'),
+    ("SELECT id FROM contacts WHERE is_favorite = 1 AND favorite_rank > ? "
+     "ORDER BY favorite_rank LIMIT 50", (0,), 'idx_contacts_favorite_rank'),
+    (f"SELECT {next_favorite_rank_sql()}", (), 'idx_contacts_favorite_rank'),
+    ("SELECT * FROM contacts WHERE phone = ?", ('10086',),
+     'idx_contacts_phone'),
+    ("SELECT * FROM contacts WHERE name = ? COLLATE NOCASE", ('a',),
+     'idx_contacts_name_nocase'),
+    ("SELECT * FROM contacts ORDER BY name COLLATE NOCASE", (),
+     'idx_contacts_name_nocase'),
+    ("SELECT max(version) FROM contact_changes WHERE contact_id = ?", (1,),
+     'idx_contact_changes_contact_id'),
+    (f"SELECT id FROM contacts WHERE {phone_key_sql('phone')} IN (?)", ('p:10086',),
+     'idx_contacts_phone_key'),
+    (f"SELECT id FROM contacts WHERE {email_key_sql('email')} IN (?)", ('e:a@b.c',),
+     'idx_contacts_email_key'),
+    (f"SELECT contact_id FROM contact_methods WHERE {method_key_sql('method_value')} IN (?)",
+     ('p:10086',), 'idx_contact_methods_value_key'),
+]
+
+def check_query_plans(conn):
+    """用 EXPLAIN QUERY PLAN 检查关键查询是否使用了预期的索引
+    
+    Returns:
+        list: 未命中索引的 (SQL, 实际执行计划) 列表，全部命中时为空
+    """
+    failures = []
+    for sql, params, index_name in QUERY_PLAN_EXPECTATIONS:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        if not any(index_name in detail for detail in plan):
+            failures.append((sql, plan))
+    return failures
+
+# 最多记录的已确认结构的数据库文件数（每个租户分片一个），超出时
+# 忘记最久未检查的，下次打开时重新读取一次结构版本
+READY_DATABASES_MAX = 1024
+
+# 本进程已确认结构为最新版本的数据库文件，按最近检查排序
+_ready_databases = OrderedDict()
+_schema_lock = threading.RLock()
+
+def _mark_ready(database):
+    """记录数据库结构已是最新版本"""
+    with _schema_lock:
+        _ready_databases[database] = True
+        _ready_databases.move_to_end(database)
+        while len(_ready_databases) > READY_DATABASES_MAX:
+            _ready_databases.popitem(last=False)
+
+def init_database(database=None):
+    """初始化数据库（执行尚未应用的迁移）
+    
+    数据库版本已是最新时只读取一次user_version，不执行任何DDL。
+    
+    Args:
+        database: 数据库文件路径，默认为DATABASE_NAME
+    
+    Returns:
+        bool: 数据库结构是否已是最新版本
+    """
+    database = database or DATABASE_NAME
+    ready = False
+    conn = create_connection(database)
+    if conn is not None:
+        try:
+            migrate(conn)
+            _mark_ready(database)
+            ready = True
             print("数据库初始化成功")
         except Error as e:
             print(f"创建表错误: {e}")
         finally:
             conn.close()
     else:
-        print("错误！无法创建数据库连接")
\ No newline at end of file
+        print("错误！无法创建数据库连接")
+    return ready
+
+def ensure_schema(database=None):
+    """确认数据库结构为最新版本，每个进程对每个数据库文件只检查一次
+    
+    由 get_pool() 和分片路由在创建连接池前调用。检查失败时不记录结果，
+    下次调用时重试；记录超过 READY_DATABASES_MAX 个文件后，最久未检查
+    的文件会被重新检查。
+    
+    Args:
+        database: 数据库文件路径，默认为DATABASE_NAME
+    
+    Returns:
+        bool: 数据库结构是否已是最新版本
+    """
+    database = database or DATABASE_NAME
+    if database in _ready_databases:
+        return True
+    with _schema_lock:
+        if database in _ready_databases:
+            return True
+        return init_database(database)
\ No newline at end of file
@@ -0,0 +1,453 @@
+# 监控指标 - 请求延迟、SQL耗时与连接池/缓存指标，以Prometheus文本格式输出
+import cProfile
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 是否采集请求与SQL指标，可通过环境变量关闭
+METRICS_ENABLED = os.environ.get('CONTACTS_METRICS', '1') != '0'
+
+# 单条SQL耗时超过该毫秒数时打印慢查询日志，0表示关闭
+SLOW_QUERY_MS = float(os.environ.get('CONTACTS_SLOW_QUERY_MS', '0'))
+
+# 按该比例随机抽取请求用cProfile分析，0表示关闭
+PROFILE_SAMPLE_RATE = float(os.environ.get('CONTACTS_PROFILE_SAMPLE_RATE', '0'))
+
+# 抽样分析结果（.prof文件，可用snakeviz或pstats查看）的保存目录
+PROFILE_DIR = os.environ.get('CONTACTS_PROFILE_DIR', 'profiles')
+
+# 请求延迟直方图的分桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 每个请求执行SQL条数直方图的分桶上界
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# 按语句统计时最多区分的SQL条数，超出的归入"other"，防止标签无限增长
+MAX_TRACKED_STATEMENTS = 500
+
+# SQLite虚拟机每执行该数量的指令回调一次进度处理器，用于统计每个请求的计算量
+PROGRESS_HANDLER_INTERVAL = 1000
+
+# 没有匹配到路由的请求（如404）使用的路由标签
+UNMATCHED_ROUTE = '<unmatched>'
+
+class Histogram:
+    """按标签分组的直方图（线程安全）"""
+    
+    def __init__(self, buckets):
+        """
+        初始化直方图
+        
+        :param buckets: 升序排列的分桶上界，末尾自动追加+Inf
+        """
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签元组 -> [各桶计数, 总和, 次数]
+        self._lock = threading.Lock()
+    
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def snapshot(self):
+        """返回 {标签元组: (累计桶计数, 总和, 次数)}"""
+        with self._lock:
+            return {
+                labels: (_cumulative(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+
+class Counter:
+    """按标签分组的计数器，也用作可增减的仪表（线程安全）"""
+    
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+def _cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+# 请求级指标（标签见 render_metrics 中的说明）
+_requests_total = Counter()
+_requests_in_flight = Counter()
+_request_duration = Histogram(LATENCY_BUCKETS)
+_request_queries = Histogram(QUERY_COUNT_BUCKETS)
+_request_query_seconds = Counter()
+_request_connections_opened = Counter()
+_request_vm_steps = Counter()
+_profiled_requests = Counter()
+
+# SQL语句级指标：规范化后的SQL -> [执行次数, 总耗时, 最大耗时]
+_statements = {}
+_statement_labels = {}  # 原始SQL -> 规范化后的SQL
+_statements_lock = threading.Lock()
+_slow_queries = 0
+
+# 当前线程正在执行的请求的指标，只在请求的应用调用和正文的每一步
+# 执行期间设置（见 _MeteredResponse）
+_local = threading.local()
+
+class _RequestStats:
+    """单个请求执行期间累计的数据库开销"""
+    
+    __slots__ = ('route', 'in_flight', 'queries', 'query_seconds', 'connections_opened',
+                 'vm_steps')
+    
+    def __init__(self):
+        self.route = UNMATCHED_ROUTE
+        self.in_flight = False
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.connections_opened = 0
+        self.vm_steps = 0
+
+# 连续的占位符（如 IN (?, ?, ?)）合并为一个，使参数个数不同的同一语句归为一类
+_PLACEHOLDER_RUN = re.compile(r'\?(?:\s*,\s*\?)+')
+_WHITESPACE = re.compile(r'\s+')
+
+def _statement_label(sql):
+    """把SQL规范化为指标标签：合并空白与占位符序列"""
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = _PLACEHOLDER_RUN.sub('?, ...', _WHITESPACE.sub(' ', sql).strip())
+        if len(_statement_labels) < MAX_TRACKED_STATEMENTS * 4:
+            _statement_labels[sql] = label
+    return label
+
+def record_query(sql, elapsed):
+    """记录一条SQL的执行耗时"""
+    global _slow_queries
+    label = _statement_label(sql)
+    with _statements_lock:
+        entry = _statements.get(label)
+        if entry is None:
+            if len(_statements) >= MAX_TRACKED_STATEMENTS:
+                label = 'other'
+                entry = _statements.get(label)
+            if entry is None:
+                entry = _statements[label] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+        slow = SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS
+        if slow:
+            _slow_queries += 1
+    
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+    if slow:
+        route = stats.route if stats is not None else '-'
+        print(f"慢查询 {elapsed * 1000:.1f}ms [{route}]: {label}")
+
+def record_connection_open():
+    """记录连接池新建了一个连接"""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.connections_opened += 1
+
+def _progress_handler():
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.vm_steps += PROGRESS_HANDLER_INTERVAL
+    return 0
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每次 execute/executemany 耗时的游标
+    
+    耗时包括语句准备和执行到第一行结果为止，不含之后fetch的时间；
+    大结果集的读取开销由进度处理器统计的虚拟机指令数反映。
+    """
+    
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+    
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """游标与快捷执行方法都经过 InstrumentedCursor 的连接"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory():
+    """sqlite3.connect 使用的连接类，关闭指标时为默认连接类"""
+    return InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection
+
+def instrument_connection(conn):
+    """为新建的连接安装进度处理器"""
+    if METRICS_ENABLED:
+        conn.set_progress_handler(_progress_handler, PROGRESS_HANDLER_INTERVAL)
+
+def set_request_route(route):
+    """路由匹配后记录当前请求的路由模板（在Flask的before_request中调用）"""
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.route = route or UNMATCHED_ROUTE
+        stats.in_flight = True
+        _requests_in_flight.inc((stats.route,))
+
+class MetricsMiddleware:
+    """统计每个请求延迟与数据库开销的WSGI中间件
+    
+    延迟从收到请求计到响应正文（包括流式正文）全部输出完毕；路由
+    标签取自Flask的URL规则，由 set_request_route() 在路由匹配后写入。
+    """
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        response = _MeteredResponse(environ['REQUEST_METHOD'])
+        
+        def capture_status(status, headers, exc_info=None):
+            response.status = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+        
+        try:
+            with response.active():
+                response.iterable = self.wsgi_app(environ, capture_status)
+        except BaseException:
+            response.close()
+            raise
+        return response
+
+class ClosingIterable:
+    """包装响应正文，正文输出完毕或被关闭时执行一次回调"""
+    
+    def __init__(self, iterable, callback):
+        self.iterable = iterable
+        self.callback = callback
+        self.finished = False
+    
+    def __iter__(self):
+        yield from self.iterable
+        self._finish()
+    
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self._finish()
+    
+    def _finish(self):
+        if not self.finished:
+            self.finished = True
+            self.callback()
+
+class _MeteredResponse(ClosingIterable):
+    """一个请求的响应正文，持有该请求的指标和抽样分析器
+    
+    应用调用和正文的每一步都在 active() 中执行，只在这期间把指标设为
+    当前线程的指标并启用分析器。正文在其他线程输出、或没有被关闭
+    时，指标和分析器也不会留在线程上，算到之后的请求里。
+    """
+    
+    def __init__(self, method):
+        super().__init__((), self._record)
+        self.method = method
+        self.status = '500'
+        self.stats = _RequestStats()
+        self.start = time.perf_counter()
+        self.profiler = None
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            self.profiler = cProfile.Profile()
+    
+    @contextmanager
+    def active(self):
+        """在当前线程上执行本请求的一步"""
+        previous = getattr(_local, 'stats', None)
+        _local.stats = self.stats
+        profiling = False
+        if self.profiler is not None:
+            try:
+                self.profiler.enable()
+                profiling = True
+            except (RuntimeError, ValueError):
+                # 已有其他分析器在运行（如嵌套调用或外部调试器），放弃本次抽样
+                self.profiler = None
+        try:
+            yield
+        finally:
+            if profiling:
+                self.profiler.disable()
+            _local.stats = previous
+    
+    def __iter__(self):
+        iterator = iter(self.iterable)
+        while True:
+            with self.active():
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+        self._finish()
+    
+    def close(self):
+        try:
+            with self.active():
+                if hasattr(self.iterable, 'close'):
+                    self.iterable.close()
+        finally:
+            self._finish()
+    
+    def _record(self):
+        elapsed = time.perf_counter() - self.start
+        stats = self.stats
+        route = stats.route
+        if self.profiler is not None:
+            _dump_profile(self.profiler, self.method, route, elapsed)
+        if stats.in_flight:
+            _requests_in_flight.inc((route,), -1)
+        _requests_total.inc((route, self.method, self.status))
+        _request_duration.observe((route, self.method), elapsed)
+        _request_queries.observe((route,), stats.queries)
+        _request_query_seconds.inc((route,), stats.query_seconds)
+        if stats.connections_opened:
+            _request_connections_opened.inc((route,), stats.connections_opened)
+        if stats.vm_steps:
+            _request_vm_steps.inc((route,), stats.vm_steps)
+
+def _dump_profile(profiler, method, route, elapsed):
+    """保存一次抽样请求的分析结果"""
+    name = re.sub(r'[^A-Za-z0-9_]+', '_', route).strip('_') or 'root'
+    path = os.path.join(
+        PROFILE_DIR,
+        f"{time.strftime('%Y%m%d-%H%M%S')}_{method}_{name}_{elapsed * 1000:.0f}ms.prof"
+    )
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        _profiled_requests.inc((route,))
+    except OSError as e:
+        print(f"保存性能分析结果错误: {e}")
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _render_counter(lines, name, kind, help_text, label_names, values):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in sorted(values.items()):
+        lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+
+def _render_histogram(lines, name, help_text, label_names, histogram):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    bounds = [repr(float(bound)) for bound in histogram.buckets] + ['+Inf']
+    for labels, (cumulative, total, count) in sorted(histogram.snapshot().items()):
+        for bound, bucket_count in zip(bounds, cumulative):
+            bucket_labels = _format_labels(label_names + ('le',), labels + (bound,))
+            lines.append(f"{name}_bucket{bucket_labels} {bucket_count}")
+        series_labels = _format_labels(label_names, labels)
+        lines.append(f"{name}_sum{series_labels} {_format_value(total)}")
+        lines.append(f"{name}_count{series_labels} {count}")
+
+def _render_gauges(lines, prefix, stats, help_text):
+    """把指标字典中的数值项输出为仪表"""
+    for key, value in sorted(stats.items()):
+        if isinstance(value, (int, float)):
+            name = f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {'counter' if key.endswith('_total') else 'gauge'}")
+            lines.append(f"{name} {_format_value(value)}")
+
+def render_metrics():
+    """以Prometheus文本格式（0.0.4）输出所有指标"""
+    from config.admission import admission_stats
+    from config.cache import cache_stats
+    from config.database import get_pool
+    from config.replication import replication_stats
+    from config.sharding import shard_stats
+    
+    lines = []
+    _render_counter(lines, 'contacts_http_requests_total', 'counter',
+                    '按路由、方法和状态码统计的请求数',
+                    ('route', 'method', 'status'), _requests_total.snapshot())
+    _render_counter(lines, 'contacts_http_requests_in_flight', 'gauge',
+                    '正在处理的请求数', ('route',), _requests_in_flight.snapshot())
+    _render_histogram(lines, 'contacts_http_request_duration_seconds',
+                      '请求延迟（含流式正文输出）', ('route', 'method'), _request_duration)
+    _render_histogram(lines, 'contacts_http_request_queries',
+                      '每个请求执行的SQL条数', ('route',), _request_queries)
+    _render_counter(lines, 'contacts_http_request_query_seconds_total', 'counter',
+                    '请求中执行SQL的累计耗时', ('route',), _request_query_seconds.snapshot())
+    _render_counter(lines, 'contacts_http_request_connections_opened_total', 'counter',
+                    '请求中新建的数据库连接数', ('route',),
+                    _request_connections_opened.snapshot())
+    _render_counter(lines, 'contacts_http_request_sqlite_vm_steps_total', 'counter',
+                    '请求中SQLite虚拟机执行的指令数（按进度处理器间隔取整）', ('route',),
+                    _request_vm_steps.snapshot())
+    _render_counter(lines, 'contacts_profiled_requests_total', 'counter',
+                    '被抽样做cProfile分析的请求数', ('route',), _profiled_requests.snapshot())
+    
+    with _statements_lock:
+        statements = {(sql,): tuple(entry) for sql, entry in _statements.items()}
+        slow_queries = _slow_queries
+    _render_counter(lines, 'contacts_sql_queries_total', 'counter', '按语句统计的执行次数',
+                    ('sql',), {key: entry[0] for key, entry in statements.items()})
+    _render_counter(lines, 'contacts_sql_seconds_total', 'counter', '按语句统计的累计耗时',
+                    ('sql',), {key: entry[1] for key, entry in statements.items()})
+    _render_counter(lines, 'contacts_sql_seconds_max', 'gauge', '按语句统计的最大耗时',
+                    ('sql',), {key: entry[2] for key, entry in statements.items()})
+    _render_counter(lines, 'contacts_sql_slow_queries_total', 'counter',
+                    '耗时超过 CONTACTS_SLOW_QUERY_MS 的SQL条数', (), {(): slow_queries})
+    
+    _render_gauges(lines, 'contacts_db_pool', get_pool().stats(), '数据库连接池指标')
+    _render_gauges(lines, 'contacts_cache', cache_stats(), '读缓存指标')
+    _render_gauges(lines, 'contacts_shards', shard_stats(), '租户分片指标')
+    _render_gauges(lines, 'contacts_replication', replication_stats(), '复制指标')
+    _render_gauges(lines, 'contacts_admission', admission_stats(), '准入控制指标')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,498 @@
+# 复制配置 - 主库按变更日志提供联系人数据，副本进程拉取并应用到自己的SQLite副本
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from sqlite3 import Error
+from urllib.parse import parse_qs, quote, urlencode
+
+from config.database import get_connection, write_connection
+from config.sharding import TENANT_HEADER
+
+# 当前进程的复制角色
+#   primary: 主库，写请求的响应带日志位置，提供变更日志接口
+#   replica: 副本，只处理读请求，写请求重定向到主库
+#   未设置:   单机部署，不做任何处理
+REPLICATION_ROLE = os.environ.get('CONTACTS_REPLICATION_ROLE', '')
+
+# 主库地址（副本重定向写请求时使用）
+PRIMARY_URL = os.environ.get('CONTACTS_PRIMARY_URL', '').rstrip('/')
+
+# 日志位置请求头/响应头：写响应返回提交后的位置，读请求带上它即可读到自己的写入
+LOG_POSITION_HEADER = 'X-Log-Position'
+
+# 副本每次拉取的变更日志行数
+REPLICATION_BATCH_SIZE = 5000
+
+# 副本追上主库后轮询的间隔秒数
+REPLICATION_POLL_INTERVAL = float(os.environ.get('CONTACTS_REPLICATION_POLL_INTERVAL', '0.1'))
+
+# 拉取或应用失败后重试的间隔秒数
+REPLICATION_RETRY_INTERVAL = 2.0
+
+# 读请求的日志位置超过副本时等待副本追上的最长秒数，超时后重定向到主库
+READ_YOUR_WRITES_TIMEOUT = float(os.environ.get('CONTACTS_READ_YOUR_WRITES_TIMEOUT', '1.0'))
+
+# 等待副本追上时检查位置的间隔秒数
+READ_YOUR_WRITES_POLL_INTERVAL = 0.02
+
+# 复制的表及其联系人ID列，按应用顺序排列：先写联系方式再写联系人，
+# 全文索引触发器对每个联系人只生成一次索引行
+REPLICATED_TABLES = (
+    ('contact_methods', 'contact_id'),
+    ('contacts', 'id'),
+)
+
+# 只在主库处理的路径（后台任务和变更日志不复制）
+PRIMARY_ONLY_PREFIXES = ('/api/jobs', '/api/replication')
+
+# 副本处理的请求方法
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 按ID查询时每条SQL的最大参数个数
+_ID_CHUNK_SIZE = 500
+
+class ReplicationError(Exception):
+    """副本无法应用主库的变更（如主库被重建、副本结构版本落后）"""
+
+def read_log_position(cursor):
+    """读取变更日志的最新版本号，即数据库的日志位置，没有变更时为0"""
+    cursor.execute("SELECT coalesce(max(version), 0) FROM contact_changes")
+    return cursor.fetchone()[0]
+
+def get_log_position():
+    """返回当前数据库的日志位置，查询失败时返回None"""
+    try:
+        with get_connection() as conn:
+            return read_log_position(conn.cursor())
+    except Error as e:
+        print(f"查询日志位置错误: {e}")
+        return None
+
+def _chunks(ids):
+    for start in range(0, len(ids), _ID_CHUNK_SIZE):
+        yield ids[start:start + _ID_CHUNK_SIZE]
+
+def _attach_rows(cursor, batch):
+    """为批次读取 contact_ids 中联系人及其联系方式的当前数据"""
+    contact_ids = batch['contact_ids']
+    for table, id_column in REPLICATED_TABLES:
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        columns = [column[0] for column in cursor.description]
+        rows = []
+        for chunk in _chunks(contact_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT * FROM {table} WHERE {id_column} IN ({placeholders})", chunk
+            )
+            rows.extend(list(row) for row in cursor.fetchall())
+        batch[table] = {'columns': columns, 'rows': rows}
+    return batch
+
+def read_change_batch(cursor, since, limit=REPLICATION_BATCH_SIZE, until=None, with_rows=True):
+    """读取某个日志位置之后的一批变更（主库）
+    
+    变更日志只记录联系人ID，批次中附带这些联系人和联系方式的当前数据。
+    先读日志再读数据，数据不会比日志旧；比日志新的部分由之后的日志
+    再次发送，副本最终与主库一致。
+    
+    Args:
+        cursor: 主库游标
+        since (int): 副本已应用到的日志位置
+        limit (int): 最多读取的日志行数
+        until (int): 只读取不超过该位置的日志（初始同步复制历史日志时使用）
+        with_rows (bool): 是否附带联系人数据，False时只返回日志行
+    
+    Returns:
+        dict: position（本批的日志位置）、has_more、changes（日志行）、
+        contact_ids，以及每个复制表的 {"columns", "rows"}
+    """
+    cursor.execute(
+        "SELECT version, contact_id FROM contact_changes WHERE version > ? AND version <= ? "
+        "ORDER BY version LIMIT ?",
+        (since, read_log_position(cursor) if until is None else until, limit)
+    )
+    changes = [list(row) for row in cursor.fetchall()]
+    batch = {
+        'position': changes[-1][0] if changes else read_log_position(cursor),
+        'has_more': len(changes) == limit,
+        'changes': changes,
+        'contact_ids': sorted({contact_id for _, contact_id in changes}) if with_rows else [],
+    }
+    return _attach_rows(cursor, batch)
+
+def read_snapshot_batch(cursor, after_id, limit=REPLICATION_BATCH_SIZE):
+    """按ID顺序读取一页联系人的当前数据（副本初始同步使用）
+    
+    position为读取时主库的日志位置，副本复制完全部联系人后从第一页的
+    位置开始追日志，期间的修改由日志再次发送。
+    
+    Returns:
+        dict: 与 read_change_batch 相同的结构，changes为空
+    """
+    position = read_log_position(cursor)
+    cursor.execute("SELECT id FROM contacts WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    contact_ids = [row[0] for row in cursor.fetchall()]
+    batch = {
+        'position': position,
+        'has_more': len(contact_ids) == limit,
+        'changes': [],
+        'contact_ids': contact_ids,
+    }
+    return _attach_rows(cursor, batch)
+
+def get_change_batch(since, limit=REPLICATION_BATCH_SIZE, until=None, with_rows=True):
+    """读取一批变更（变更日志接口使用），查询失败时返回None"""
+    try:
+        with get_connection() as conn:
+            return read_change_batch(conn.cursor(), since, limit, until, with_rows)
+    except Error as e:
+        print(f"读取变更日志错误: {e}")
+        return None
+
+def get_snapshot_batch(after_id, limit=REPLICATION_BATCH_SIZE):
+    """读取一页联系人数据（初始同步接口使用），查询失败时返回None"""
+    try:
+        with get_connection() as conn:
+            return read_snapshot_batch(conn.cursor(), after_id, limit)
+    except Error as e:
+        print(f"读取联系人快照错误: {e}")
+        return None
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {column[1] for column in cursor.fetchall()}
+
+def apply_change_batch(cursor, batch):
+    """把一批变更应用到副本，须在写事务中调用
+    
+    先删除批次中联系人的全部联系方式和主库已删除的联系人，再写入
+    当前数据，最后原样写入日志行，副本的日志位置与主库一致。
+    
+    Raises:
+        ReplicationError: 副本缺少主库数据中的列（副本须先升级数据库结构）
+    """
+    contact_ids = batch['contact_ids']
+    if contact_ids:
+        _apply_rows(cursor, batch)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO contact_changes (version, contact_id) VALUES (?, ?)",
+        batch['changes']
+    )
+
+def _apply_rows(cursor, batch):
+    """写入批次中联系人的当前数据：先删除再写入，主库已删除的联系人在副本上删除"""
+    contact_ids = batch['contact_ids']
+    for table, _ in REPLICATED_TABLES:
+        missing = set(batch[table]['columns']) - _table_columns(cursor, table)
+        if missing:
+            raise ReplicationError(f"副本的{table}表缺少列 {sorted(missing)}，请先升级数据库")
+    
+    contacts = batch['contacts']
+    id_index = contacts['columns'].index('id')
+    present = {row[id_index] for row in contacts['rows']}
+    deleted_ids = [contact_id for contact_id in contact_ids if contact_id not in present]
+    for chunk in _chunks(contact_ids):
+        cursor.execute(
+            f"DELETE FROM contact_methods WHERE contact_id IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+    for chunk in _chunks(deleted_ids):
+        cursor.execute(
+            f"DELETE FROM contacts WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        )
+    
+    methods = batch['contact_methods']
+    if methods['rows']:
+        columns = methods['columns']
+        # 联系方式改挂到其他联系人时，旧联系人的日志可能在下一批，按ID覆盖
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO contact_methods ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            methods['rows']
+        )
+    if contacts['rows']:
+        columns = contacts['columns']
+        assignments = ", ".join(f"{column} = excluded.{column}"
+                                for column in columns if column != 'id')
+        cursor.executemany(
+            f"INSERT INTO contacts ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {assignments}",
+            contacts['rows']
+        )
+
+def prepare_replica(cursor):
+    """删除副本上写变更日志的触发器，日志只来自主库，版本号与主库保持一致"""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND sql LIKE '%INSERT INTO contact_changes%'"
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+
+class HttpLogSource:
+    """通过主库的 /api/replication/changes 接口拉取变更"""
+    
+    def __init__(self, base_url, timeout=30):
+        """
+        初始化
+        
+        :param base_url: 主库地址，如 http://10.0.0.1:5000
+        :param timeout: 单次请求的超时秒数
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+    
+    def _get(self, path, params):
+        url = f"{self.base_url}{path}?{urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            return json.load(response)
+    
+    def fetch(self, since, limit, until=None, with_rows=True):
+        params = {'since': since, 'limit': limit, 'rows': int(with_rows)}
+        if until is not None:
+            params['until'] = until
+        return self._get('/api/replication/changes', params)
+    
+    def fetch_snapshot(self, after_id, limit):
+        return self._get('/api/replication/snapshot', {'after_id': after_id, 'limit': limit})
+
+class FileLogSource:
+    """以只读方式直接打开同一台机器上的主库文件拉取变更"""
+    
+    def __init__(self, path):
+        """
+        初始化
+        
+        :param path: 主库数据库文件路径
+        """
+        self.path = path
+    
+    def _read(self, reader, *args):
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro", uri=True)
+        try:
+            return reader(conn.cursor(), *args)
+        finally:
+            conn.close()
+    
+    def fetch(self, since, limit, until=None, with_rows=True):
+        return self._read(read_change_batch, since, limit, until, with_rows)
+    
+    def fetch_snapshot(self, after_id, limit):
+        return self._read(read_snapshot_batch, after_id, limit)
+
+class ReplicaTailer:
+    """持续从主库拉取变更日志并应用到本进程的数据库（副本）"""
+    
+    def __init__(self, source, batch_size=REPLICATION_BATCH_SIZE,
+                 interval=REPLICATION_POLL_INTERVAL):
+        """
+        初始化
+        
+        :param source: 变更来源（HttpLogSource 或 FileLogSource）
+        :param batch_size: 每次拉取的日志行数
+        :param interval: 追上主库后轮询的间隔秒数
+        """
+        self.source = source
+        self.batch_size = batch_size
+        self.interval = interval
+    
+    def prepare(self):
+        """初始化副本数据库（建表、删除变更日志触发器），空副本先做初始同步"""
+        with write_connection() as conn:
+            prepare_replica(conn.cursor())
+            position = read_log_position(conn.cursor())
+        if position == 0:
+            self.bootstrap()
+    
+    def bootstrap(self):
+        """初始同步：复制主库的全部联系人，再复制到开始时为止的变更日志
+        
+        变更日志可能不包含早于日志功能的联系人，因此不能只靠回放日志。
+        中途失败时副本的日志位置仍为0，下次启动重新执行。
+        
+        Returns:
+            int: 同步完成后的日志位置
+        """
+        after_id = 0
+        position = None
+        while True:
+            batch = self.source.fetch_snapshot(after_id, self.batch_size)
+            if position is None:
+                position = batch['position']
+            if batch['contact_ids']:
+                with write_connection() as conn:
+                    apply_change_batch(conn.cursor(), batch)
+                after_id = batch['contact_ids'][-1]
+            if not batch['has_more']:
+                break
+        
+        since = 0
+        while since < position:
+            batch = self.source.fetch(since, self.batch_size, until=position, with_rows=False)
+            if not batch['changes']:
+                break
+            with write_connection() as conn:
+                apply_change_batch(conn.cursor(), batch)
+            since = batch['position']
+        return position
+    
+    def sync_once(self):
+        """拉取并应用一批变更
+        
+        Returns:
+            tuple: (应用后的日志位置, 主库是否还有未拉取的变更)
+        
+        Raises:
+            ReplicationError: 主库的日志位置落后于副本，或副本结构版本落后
+        """
+        with get_connection() as conn:
+            position = read_log_position(conn.cursor())
+        batch = self.source.fetch(position, self.batch_size)
+        if batch['position'] < position:
+            raise ReplicationError(
+                f"主库的日志位置 {batch['position']} 落后于副本的 {position}，"
+                "主库可能已被重建，请重新创建副本"
+            )
+        if batch['changes']:
+            with write_connection() as conn:
+                apply_change_batch(conn.cursor(), batch)
+        return max(position, batch['position']), batch['has_more']
+    
+    def catch_up(self):
+        """一直拉取到追上主库为止，返回最终的日志位置"""
+        while True:
+            position, has_more = self.sync_once()
+            if not has_more:
+                return position
+    
+    def run(self, stop_event=None):
+        """持续同步，直到stop_event被设置；出错时打印日志并稍后重试"""
+        stop_event = stop_event or threading.Event()
+        prepared = False
+        while not stop_event.is_set():
+            try:
+                if not prepared:
+                    self.prepare()
+                    prepared = True
+                _, has_more = self.sync_once()
+            except (Error, OSError, ValueError, KeyError, ReplicationError) as e:
+                print(f"复制错误: {e}")
+                stop_event.wait(REPLICATION_RETRY_INTERVAL)
+                continue
+            if not has_more:
+                stop_event.wait(self.interval)
+
+def wait_for_position(position, timeout=READ_YOUR_WRITES_TIMEOUT):
+    """等待本地数据库的日志位置达到position，超时返回False"""
+    deadline = time.monotonic() + timeout
+    while True:
+        current = get_log_position()
+        if current is not None and current >= position:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(READ_YOUR_WRITES_POLL_INTERVAL)
+
+# 副本的请求统计
+_stats = {
+    'redirects_total': 0,
+    'waits_total': 0,
+    'wait_timeouts_total': 0,
+}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def replication_stats():
+    """返回复制指标"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['replica'] = REPLICATION_ROLE == 'replica'
+    position = get_log_position()
+    if position is not None:
+        stats['log_position'] = position
+    return stats
+
+def _environ_header(name):
+    return 'HTTP_' + name.upper().replace('-', '_')
+
+class ReplicationMiddleware:
+    """按复制角色处理请求的WSGI中间件
+    
+    主库：写请求的响应带 X-Log-Position（提交后的日志位置）。
+    副本：写请求、后台任务、带租户的请求（分片不复制）以 307 重定向到
+    主库；读请求带的 X-Log-Position 超过副本时先等待副本追上，超时
+    后同样重定向到主库，保证客户端能读到自己的写入。副本进程的读缓存
+    按复制来的日志版本号分键，同步进程追上后不会再命中旧的缓存条目。
+    """
+    
+    def __init__(self, wsgi_app, role=REPLICATION_ROLE, primary_url=PRIMARY_URL):
+        """
+        初始化
+        
+        :param wsgi_app: WSGI应用
+        :param role: 复制角色，primary 或 replica
+        :param primary_url: 主库地址（副本重定向时使用）
+        """
+        self.wsgi_app = wsgi_app
+        self.role = role
+        self.primary_url = primary_url.rstrip('/')
+    
+    def __call__(self, environ, start_response):
+        if self.role == 'replica':
+            return self._handle_replica(environ, start_response)
+        if environ['REQUEST_METHOD'] in READ_METHODS:
+            return self.wsgi_app(environ, start_response)
+        return self.wsgi_app(environ, self._with_position(start_response))
+    
+    def _with_position(self, start_response):
+        """在响应头中加上当前的日志位置（视图返回后、写事务已提交时读取）"""
+        def add_position(status, headers, exc_info=None):
+            position = get_log_position()
+            if position is not None:
+                headers = list(headers) + [(LOG_POSITION_HEADER, str(position))]
+            return start_response(status, headers, exc_info)
+        return add_position
+    
+    def _handle_replica(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = environ.get('PATH_INFO', '')
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if (method not in READ_METHODS or path.startswith(PRIMARY_ONLY_PREFIXES)
+                or query.get('async') == ['1'] or environ.get(_environ_header(TENANT_HEADER))):
+            return self._redirect(environ, start_response)
+        
+        wanted = environ.get(_environ_header(LOG_POSITION_HEADER), '')
+        if wanted.isdigit():
+            _count('waits_total')
+            if not wait_for_position(int(wanted)):
+                _count('wait_timeouts_total')
+                return self._redirect(environ, start_response)
+        return self.wsgi_app(environ, self._with_position(start_response))
+    
+    def _redirect(self, environ, start_response):
+        """307重定向到主库（保留请求方法和请求体）"""
+        if not self.primary_url:
+            body = json.dumps({'error': '副本不处理该请求，且未配置主库地址'},
+                              ensure_ascii=False).encode('utf-8')
+            start_response('503 SERVICE UNAVAILABLE', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(body))),
+            ])
+            return [body]
+        _count('redirects_total')
+        location = self.primary_url + quote(environ.get('PATH_INFO', '').encode('latin-1'))
+        if environ.get('QUERY_STRING'):
+            location += '?' + environ['QUERY_STRING']
+        start_response('307 TEMPORARY REDIRECT', [
+            ('Location', location),
+            ('Cache-Control', 'no-store'),
+            ('Content-Length', '0'),
+        ])
+        return [b'']
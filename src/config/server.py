@@ -0,0 +1,167 @@
+# 服务配置 - 在ASGI服务器下运行Flask（WSGI）应用
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from config.admission import fit_to_threads
+from config.database import POOL_SIZE, close_pool
+from config.sharding import get_router
+
+# 执行请求的线程数（每个请求从开始到响应正文输出完毕都占用一个线程）
+ASGI_THREADS = int(os.environ.get('CONTACTS_ASGI_THREADS', str(POOL_SIZE * 2)))
+
+# 请求体超过该字节数时写入临时文件，避免上传的大文件占用内存
+REQUEST_BODY_SPOOL_SIZE = 1024 * 1024
+
+class AsgiBridge:
+    """把WSGI应用包装为ASGI应用
+    
+    事件循环只负责收发消息，路由函数和其中的同步sqlite3调用在有界
+    线程池中执行，因此多个请求可以同时查询数据库，控制器函数的签名
+    和实现都不需要改变。每个请求（包括流式响应的正文生成）在同一个
+    线程内执行完毕，连接池按线程复用连接的逻辑保持不变。
+    """
+    
+    def __init__(self, wsgi_app, threads=ASGI_THREADS):
+        """
+        初始化
+        
+        :param wsgi_app: WSGI应用（Flask实例）
+        :param threads: 线程池大小，决定同时执行的请求数上限
+        """
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='asgi'
+        )
+        # 准入控制在线程内执行，排队的请求也占着线程，须给交互请求留出线程
+        fit_to_threads(threads)
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._handle_lifespan(receive, send)
+        else:
+            raise ValueError(f"不支持的ASGI连接类型: {scope['type']}")
+    
+    async def _handle_lifespan(self, receive, send):
+        """处理服务启动与关闭事件"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 请求线程发送响应时需要事件循环继续运行，在另一个线程中等待
+                # 它们结束；连接池从未使用过时不为关闭而初始化数据库
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.executor.shutdown, True
+                )
+                close_pool()
+                get_router().close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    async def _handle_http(self, scope, receive, send):
+        """读取完整请求体后交给线程池执行WSGI应用"""
+        body = tempfile.SpooledTemporaryFile(max_size=REQUEST_BODY_SPOOL_SIZE)
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                more_body = message.get('more_body', False)
+            body.seek(0)
+            
+            loop = asyncio.get_running_loop()
+            environ = self._build_environ(scope, body)
+            await loop.run_in_executor(
+                self.executor, self._run_wsgi, environ, loop, send
+            )
+        finally:
+            body.close()
+    
+    def _build_environ(self, scope, body):
+        """按PEP 3333由ASGI scope构造WSGI environ"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            # 请求体已完整读入，没有Content-Length（分块上传）时也可读到结尾
+            'wsgi.input_terminated': True,
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = f'HTTP_{name}'
+            # 重复的请求头按WSGI约定用逗号合并
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+    
+    def _run_wsgi(self, environ, loop, send):
+        """在线程池中执行WSGI应用，逐块把响应发回事件循环
+        
+        每条消息都等待发送完成后再生成下一块，客户端接收慢时生成端
+        随之放慢（背压）；客户端断开时发送失败，生成器被关闭并归还
+        数据库连接。
+        """
+        response_start = {}
+        
+        def send_message(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+        
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response_start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ],
+            }
+            return write
+        
+        def write(data):
+            if not response_start.get('sent'):
+                send_message(response_start['message'])
+                response_start['sent'] = True
+            send_message({'type': 'http.response.body', 'body': data,
+                          'more_body': True})
+        
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if chunk:
+                    write(chunk)
+            if not response_start.get('sent'):
+                send_message(response_start['message'])
+                response_start['sent'] = True
+            send_message({'type': 'http.response.body', 'body': b'',
+                          'more_body': False})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
@@ -0,0 +1,204 @@
+# 多租户分片配置 - 按租户ID把请求路由到各自的SQLite分片文件
+import json
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from config.database import ConnectionPool, bind_pool, ensure_schema
+from config.metrics import ClosingIterable
+
+# 是否启用多租户分片，关闭时忽略租户请求头，所有请求使用同一个数据库
+SHARDING_ENABLED = os.environ.get('CONTACTS_SHARDING', '0') == '1'
+
+# 携带租户ID的请求头（未携带时使用默认数据库 DATABASE_NAME）
+TENANT_HEADER = 'X-Tenant-ID'
+
+# 合法的租户ID：字母、数字开头，只含字母、数字、下划线和连字符（同时用作文件名）
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+# 分片文件目录，多个目录用 os.pathsep 分隔（如分布在多块磁盘上）
+SHARD_DIRS = [
+    path for path in os.environ.get('CONTACTS_SHARD_DIRS', 'shards').split(os.pathsep) if path
+]
+
+# 同时保持打开的分片数，超出时关闭最久未使用的分片的连接池
+SHARD_MAX_OPEN = int(os.environ.get('CONTACTS_SHARD_MAX_OPEN', '64'))
+
+# 每个分片连接池的最大连接数（总连接数最多为 SHARD_MAX_OPEN 倍）
+SHARD_POOL_SIZE = int(os.environ.get('CONTACTS_SHARD_POOL_SIZE', '4'))
+
+# 当前请求（或任务）的租户ID，None表示默认数据库
+_current_tenant = ContextVar('contacts_tenant', default=None)
+
+def current_tenant():
+    """返回当前上下文的租户ID，未指定租户时返回None"""
+    return _current_tenant.get()
+
+def is_valid_tenant(tenant):
+    """租户ID是否合法"""
+    return bool(TENANT_ID_PATTERN.match(tenant))
+
+def shard_path(tenant):
+    """返回租户分片文件的路径
+    
+    已存在的分片文件按 SHARD_DIRS 的顺序查找，因此把分片文件移动到
+    其他目录后仍能找到；新租户按租户ID的哈希值选择目录。
+    """
+    filename = f"{tenant}.db"
+    for directory in SHARD_DIRS:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    directory = SHARD_DIRS[zlib.crc32(tenant.encode('utf-8')) % len(SHARD_DIRS)]
+    return os.path.join(directory, filename)
+
+class ShardUnavailableError(Exception):
+    """分片数据库无法打开或初始化"""
+
+class ShardRouter:
+    """按租户ID取分片连接池，保持最近使用的 max_open 个分片打开
+    
+    第一次打开某个分片时创建目录并检查数据库结构（新分片在这时建表），
+    之后直接返回缓存的连接池。被淘汰的分片连接池关闭空闲连接，仍在
+    使用的连接在归还时关闭；淘汰后重新打开的连接池与旧连接池共用
+    同一把单写者锁。
+    """
+    
+    def __init__(self, max_open=SHARD_MAX_OPEN, pool_size=SHARD_POOL_SIZE):
+        """
+        初始化分片路由
+        
+        :param max_open: 同时保持打开的分片数
+        :param pool_size: 每个分片连接池的最大连接数
+        """
+        self.max_open = max_open
+        self.pool_size = pool_size
+        self._pools = OrderedDict()  # 租户ID -> 连接池，按最近使用排序
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._opens = 0
+        self._evictions = 0
+    
+    def get_pool(self, tenant):
+        """返回租户的分片连接池
+        
+        Raises:
+            ShardUnavailableError: 分片数据库结构检查失败
+            OSError: 无法创建分片目录
+        """
+        with self._lock:
+            pool = self._pools.get(tenant)
+            if pool is not None:
+                self._pools.move_to_end(tenant)
+                self._hits += 1
+                return pool
+        
+        # 建表可能较慢，不持有路由锁；并发打开同一分片时以先放入的为准
+        path = shard_path(tenant)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if not ensure_schema(path):
+            raise ShardUnavailableError(f"分片 {tenant} 初始化失败")
+        pool = ConnectionPool(path, size=self.pool_size)
+        
+        evicted = []
+        with self._lock:
+            existing = self._pools.get(tenant)
+            if existing is not None:
+                self._pools.move_to_end(tenant)
+                self._hits += 1
+                evicted.append(pool)
+                pool = existing
+            else:
+                self._pools[tenant] = pool
+                self._opens += 1
+                while len(self._pools) > self.max_open:
+                    _, old_pool = self._pools.popitem(last=False)
+                    evicted.append(old_pool)
+                    self._evictions += 1
+        for old_pool in evicted:
+            old_pool.close()
+        return pool
+    
+    def close_all(self):
+        """关闭所有分片连接池（用于进程退出）"""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), OrderedDict()
+        for pool in pools:
+            pool.close()
+    
+    def stats(self):
+        """返回分片路由指标"""
+        with self._lock:
+            return {
+                'open': len(self._pools),
+                'max_open': self.max_open,
+                'hits_total': self._hits,
+                'opens_total': self._opens,
+                'evictions_total': self._evictions,
+            }
+
+_router = ShardRouter()
+
+def get_router():
+    """返回进程内的分片路由"""
+    return _router
+
+def use_tenant(tenant):
+    """把当前上下文切换到租户的分片，None切换回默认数据库
+    
+    Raises:
+        ShardUnavailableError: 分片数据库初始化失败
+    """
+    bind_pool(None if tenant is None else _router.get_pool(tenant))
+    _current_tenant.set(tenant)
+
+def shard_stats():
+    """返回分片指标"""
+    stats = _router.stats()
+    stats['enabled'] = SHARDING_ENABLED
+    return stats
+
+def _error_response(start_response, status, message):
+    body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+    start_response(status, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body))),
+    ])
+    return [body]
+
+class TenantMiddleware:
+    """按租户请求头切换数据库分片的WSGI中间件
+    
+    从请求开始到响应正文（包括流式正文）输出完毕都使用租户的分片，
+    结束后切换回默认数据库，复用同一线程的下一个请求不受影响。
+    租户ID不合法时返回400，分片无法打开时返回503。
+    """
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+    
+    def __call__(self, environ, start_response):
+        header = 'HTTP_' + TENANT_HEADER.upper().replace('-', '_')
+        tenant = environ.get(header) or None
+        if tenant is None:
+            # 上一个请求的响应正文未被关闭时绑定不会被清除，这里总是重新设置
+            use_tenant(None)
+            return self.wsgi_app(environ, start_response)
+        if not is_valid_tenant(tenant):
+            return _error_response(start_response, '400 BAD REQUEST', '无效的租户ID')
+        try:
+            use_tenant(tenant)
+        except (ShardUnavailableError, OSError) as e:
+            print(f"打开租户分片错误: {e}")
+            use_tenant(None)
+            return _error_response(start_response, '503 SERVICE UNAVAILABLE', '租户数据库不可用')
+        
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+        except BaseException:
+            use_tenant(None)
+            raise
+        return ClosingIterable(iterable, lambda: use_tenant(None))
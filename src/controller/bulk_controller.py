@@ -0,0 +1,353 @@
+# 批量导入导出控制器 - CSV与NDJSON格式，可gzip压缩，比Excel快一个数量级
+from config.compression import GZIP_LEVEL, gzip_chunks
+from config.database import get_pool, get_connection
+from controller.contact_controller import (
+    EXPORT_HEADERS,
+    import_error_recorder,
+    iter_import_batches,
+    new_import_report,
+    select_export_rows,
+    write_import_batches
+)
+from itertools import islice
+import csv
+import gzip
+import io
+import json
+
+# 导入导出支持的格式及其扩展名、MIME类型（xlsx由contact_controller处理）
+FORMAT_EXTENSIONS = {
+    'xlsx': '.xlsx',
+    'csv': '.csv',
+    'ndjson': '.ndjson',
+}
+FORMAT_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# 可以gzip压缩的文本格式
+TEXT_FORMATS = ('csv', 'ndjson')
+
+# 导入时也按NDJSON识别的扩展名
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+GZIP_MIMETYPE = 'application/gzip'
+
+# gzip文件的前两个字节
+GZIP_MAGIC = b'\x1f\x8b'
+
+# CSV/NDJSON每批写入的联系人数量（解析开销小，批次比Excel大）
+BULK_IMPORT_BATCH_SIZE = 5000
+
+# 导出时每次从游标读取并输出的行数
+BULK_EXPORT_CHUNK_ROWS = 1000
+
+# 文件导出的gzip压缩级别：批量文件较大，用较低的级别换取速度
+BULK_GZIP_LEVEL = min(GZIP_LEVEL, 3)
+
+def detect_format(filename, requested=None):
+    """按 ?format= 参数或文件名（可带.gz后缀）确定导入文件的格式
+    
+    Returns:
+        str: 'xlsx'、'csv' 或 'ndjson'，不支持时返回None
+    """
+    if requested:
+        return requested if requested in FORMAT_EXTENSIONS else None
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith(NDJSON_EXTENSIONS):
+        return 'ndjson'
+    for file_format in TEXT_FORMATS + ('xlsx',):
+        if name.endswith(FORMAT_EXTENSIONS[file_format]):
+            return file_format
+    return None
+
+def export_filename(file_format, compressed=False):
+    """导出文件的下载文件名"""
+    return 'contacts_export' + FORMAT_EXTENSIONS[file_format] + ('.gz' if compressed else '')
+
+def export_file_type(path):
+    """按导出文件的扩展名返回 (下载文件名, MIME类型)"""
+    compressed = path.endswith('.gz')
+    base = path[:-3] if compressed else path
+    for file_format, extension in FORMAT_EXTENSIONS.items():
+        if base.endswith(extension):
+            mimetype = GZIP_MIMETYPE if compressed else FORMAT_MIMETYPES[file_format]
+            return export_filename(file_format, compressed), mimetype
+    return export_filename('xlsx'), FORMAT_MIMETYPES['xlsx']
+
+# NDJSON导出行：每行一个联系人对象，联系方式为 [类型, 值] 数组的数组，
+# 整行由SQLite的JSON函数生成
+NDJSON_ROWS_SQL = """
+SELECT json_object(
+    'id', c.id, 'name', c.name, 'phone', c.phone, 'email', c.email,
+    'address', c.address, 'is_favorite', c.is_favorite,
+    'methods', json((SELECT json_group_array(json_array(m.method_type, m.method_value))
+                     FROM contact_methods AS m WHERE m.contact_id = c.id)))
+FROM contacts AS c
+ORDER BY c.id"""
+
+def first_data_row(file_format):
+    """第一条数据所在的行号：CSV第1行为表头，NDJSON没有表头"""
+    return 1 if file_format == 'ndjson' else 2
+
+def _iter_csv_chunks(pool):
+    """逐批把导出行编码为CSV，产出 (UTF-8字节, 本批联系人数)"""
+    conn = pool.acquire()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM让Excel按UTF-8打开；列与Excel导出相同
+        buffer.write('\ufeff')
+        writer.writerow(EXPORT_HEADERS)
+        cursor = select_export_rows(conn.cursor())
+        while True:
+            rows = cursor.fetchmany(BULK_EXPORT_CHUNK_ROWS)
+            writer.writerows(rows)
+            # 第一批带上表头；没有联系人时只输出表头
+            if buffer.tell():
+                yield buffer.getvalue().encode('utf-8'), len(rows)
+                buffer.seek(0)
+                buffer.truncate()
+            if not rows:
+                break
+    finally:
+        pool.release(conn)
+
+def _iter_ndjson_chunks(pool):
+    """逐批读取SQL生成的JSON行，产出 (UTF-8字节, 本批联系人数)"""
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(NDJSON_ROWS_SQL)
+        while True:
+            rows = cursor.fetchmany(BULK_EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield ''.join(row[0] + '\n' for row in rows).encode('utf-8'), len(rows)
+    finally:
+        pool.release(conn)
+
+def _iter_export_chunks(file_format):
+    # 在请求上下文中确定连接池，生成器可能在请求结束后才被迭代
+    pool = get_pool()
+    if file_format == 'csv':
+        return _iter_csv_chunks(pool)
+    return _iter_ndjson_chunks(pool)
+
+def _iter_bytes(chunks):
+    try:
+        for data, _ in chunks:
+            yield data
+    finally:
+        chunks.close()
+
+def stream_export(file_format, compressed=False):
+    """流式导出全部联系人
+    
+    CSV的列与Excel导出相同（其他联系方式为 "type: value; ..."）；
+    NDJSON每行一个联系人，联系方式为 [类型, 值] 数组的数组。两种格式
+    都可以原样导入。
+    
+    Args:
+        file_format (str): 'csv' 或 'ndjson'
+        compressed (bool): 为True时输出gzip文件
+    
+    Returns:
+        generator: 依次产出字节片段；开始迭代时才从连接池取连接
+    """
+    chunks = _iter_bytes(_iter_export_chunks(file_format))
+    if compressed:
+        return gzip_chunks(chunks, BULK_GZIP_LEVEL)
+    return chunks
+
+def write_export(output_path, file_format, compressed=False, on_progress=None):
+    """把全部联系人导出到文件（后台导出任务使用）
+    
+    Args:
+        output_path (str): 输出文件路径
+        file_format (str): 'csv' 或 'ndjson'
+        compressed (bool): 为True时写入gzip文件
+        on_progress (callable): 每输出一批调用 on_progress(已写入数, 联系人总数)
+    
+    Returns:
+        int: 写入的联系人数
+    
+    Raises:
+        sqlite3.Error: 数据库操作异常
+    """
+    total = None
+    if on_progress is not None:
+        with get_connection() as conn:
+            total = conn.execute("SELECT count(*) FROM contacts").fetchone()[0]
+    
+    written = 0
+    opener = gzip.open if compressed else open
+    kwargs = {'compresslevel': BULK_GZIP_LEVEL} if compressed else {}
+    chunks = _iter_export_chunks(file_format)
+    try:
+        with opener(output_path, 'wb', **kwargs) as output:
+            for data, count in chunks:
+                output.write(data)
+                written += count
+                if on_progress is not None and count:
+                    on_progress(written, total)
+    finally:
+        chunks.close()
+    return written
+
+def open_text(file_stream):
+    """以UTF-8文本方式打开导入文件，gzip压缩的文件边读边解压
+    
+    Args:
+        file_stream: 文件路径或可定位的二进制文件对象
+    """
+    if isinstance(file_stream, str):
+        file_stream = open(file_stream, 'rb')
+    head = file_stream.read(len(GZIP_MAGIC))
+    file_stream.seek(0)
+    if head == GZIP_MAGIC:
+        file_stream = gzip.GzipFile(fileobj=file_stream, mode='rb')
+    return io.TextIOWrapper(file_stream, encoding='utf-8-sig', newline='')
+
+def count_file_rows(file_stream, file_format):
+    """按换行符统计数据行数（不含表头，用作导入进度的总数）"""
+    text = open_text(file_stream)
+    try:
+        lines = sum(chunk.count('\n') for chunk in iter(lambda: text.read(1 << 20), ''))
+    finally:
+        text.close()
+    return max(lines - (first_data_row(file_format) - 1), 0)
+
+def _text(value):
+    """把JSON字段转换为去掉首尾空白的文本，缺失时返回空字符串"""
+    if value is None:
+        return ''
+    return str(value).strip()
+
+def _parse_json_methods(value):
+    """解析NDJSON的methods数组
+    
+    每项为导出格式的 [类型, 值]，或接口返回的 {"method_type", "method_value"}。
+    """
+    methods = []
+    if not isinstance(value, list):
+        return methods
+    for item in value:
+        if isinstance(item, list) and len(item) == 2:
+            method_type, method_value = item
+        elif isinstance(item, dict):
+            method_type, method_value = item.get('method_type'), item.get('method_value')
+        else:
+            continue
+        method_type, method_value = _text(method_type), _text(method_value)
+        if method_type and method_value:
+            methods.append((method_type, method_value))
+    return methods
+
+def _iter_ndjson_batches(lines, batch_size, start_line, record_error):
+    """逐行解析NDJSON，按batch_size生成 (批次, 批次最后一行的行号)"""
+    batch = []
+    line_number = start_line - 1
+    
+    for line_number, line in enumerate(lines, start_line):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            record_error(line_number, '不是有效的JSON')
+            continue
+        if not isinstance(item, dict):
+            record_error(line_number, '每行须为一个JSON对象')
+            continue
+        
+        name = _text(item.get('name'))
+        phone = _text(item.get('phone'))
+        if not name or not phone:
+            record_error(line_number, '姓名和电话为必填项')
+            continue
+        
+        contact = (
+            name,
+            phone,
+            _text(item.get('email')),
+            _text(item.get('address')),
+            1 if item.get('is_favorite') == 1 else 0
+        )
+        batch.append((contact, _parse_json_methods(item.get('methods'))))
+        
+        if len(batch) >= batch_size:
+            yield batch, line_number
+            batch = []
+    
+    if batch:
+        yield batch, line_number
+
+def iter_file_batches(text, file_format, batch_size, start_row, record_error):
+    """逐行解析CSV或NDJSON文本，按batch_size生成 (批次, 批次最后一行的行号)
+    
+    Args:
+        text: open_text 打开的文本文件
+        file_format (str): 'csv' 或 'ndjson'
+        batch_size (int): 每批的联系人数量
+        start_row (int): 从该行开始读取
+        record_error (callable): 跳过无效行时调用 record_error(行号, 错误信息)
+    """
+    if file_format == 'csv':
+        rows = islice(csv.reader(text), start_row - 1, None)
+        return iter_import_batches(rows, batch_size, start_row, record_error)
+    lines = islice(text, start_row - 1, None)
+    return _iter_ndjson_batches(lines, batch_size, start_row, record_error)
+
+def import_file(file_stream, file_format, batch_size=BULK_IMPORT_BATCH_SIZE,
+                start_row=None, report=None, on_batch=None, upsert=False):
+    """从CSV或NDJSON文件批量导入联系人，出错时抛出异常
+    
+    逐行流式解析（gzip文件边读边解压），每batch_size行用executemany
+    写入一次；事务、断点和upsert的语义与 import_workbook 相同。
+    
+    Args:
+        file_stream: 文件路径或可定位的二进制文件对象
+        file_format (str): 'csv' 或 'ndjson'
+        batch_size (int): 每批写入的联系人数量
+        start_row (int): 从该行开始读取，默认为第一条数据所在的行
+        report (dict): 断点续传时已累计的导入报告
+        on_batch (callable): 每批提交前的回调
+        upsert (bool): 为True时重复的行合并到已有联系人
+    
+    Returns:
+        dict: 导入报告，见 import_contacts_from_excel
+    
+    Raises:
+        Exception: 文件无法解析或数据库写入失败
+    """
+    if report is None:
+        report = new_import_report()
+    if start_row is None:
+        start_row = first_data_row(file_format)
+    record_error = import_error_recorder(report)
+    
+    text = open_text(file_stream)
+    try:
+        batches = iter_file_batches(text, file_format, batch_size, start_row, record_error)
+        write_import_batches(batches, report, on_batch=on_batch, upsert=upsert)
+    finally:
+        text.close()
+    
+    return report
+
+def import_contacts_from_file(file_stream, file_format, upsert=False):
+    """从CSV或NDJSON文件批量导入联系人，全部行在同一个事务中提交
+    
+    Returns:
+        dict: 导入报告，见 import_contacts_from_excel；文件无法读取或
+        写入失败时返回None
+    """
+    try:
+        return import_file(file_stream, file_format, upsert=upsert)
+    except Exception as e:
+        print(f"导入失败: {e}")
+        return None
@@ -1,77 +1,566 @@
 # 联系人控制器 - 处理联系人相关业务逻辑
-from config.database import create_connection
+from config.database import (
+    get_pool,
+    get_connection,
+    write_connection,
+    in_write_transaction,
+    next_favorite_rank_sql
+)
+from config.cache import get_cache, contact_key, methods_key, list_key
+from controller.dedupe_controller import merge_import_batch
 from model.contact import Contact, ContactMethod
 from sqlite3 import Error
-from openpyxl import Workbook, load_workbook
-from openpyxl.utils import get_column_letter
-import io
+from itertools import groupby
+from operator import itemgetter
+import json
+import re
+import tempfile
+import time
 
-def get_all_contacts():
-    """获取所有联系人"""
+# 分页查询单页的最大条数
+MAX_PAGE_SIZE = 500
+
+# 读缓存的键带有查询前读到的变更版本号（整表或单个联系人）。数据总在
+# 版本号之后读取，只会比键中的版本新，不会把旧数据缓存到新版本下。
+
+def _cache_lookup(key):
+    """读取缓存；写事务内需要看到未提交的修改，不使用缓存"""
+    if in_write_transaction():
+        return None
+    return get_cache().get(key)
+
+def _cache_store(key, value):
+    """写入缓存；写事务内读到的是未提交的数据，不缓存"""
+    if in_write_transaction():
+        return
+    get_cache().set(key, value)
+
+def get_all_contacts(include_methods=False):
+    """获取所有联系人
+    
+    Args:
+        include_methods (bool): 为 True 时把联系方式嵌入每个联系人的
+            ``methods`` 字段（一次分组查询，避免逐个请求）
+    
+    Returns:
+        list: 联系人字典列表
+    """
+    contacts, _ = list_contacts(include_methods=include_methods)
+    return contacts
+
+def _build_list_query(q, favorite, limit, after_id):
+    """生成列表查询的SQL和参数
+    
+    Returns:
+        tuple: (SQL, 参数列表, 修正后的limit)；分页时SQL多取一条
+    """
+    conditions = []
+    params = []
+    
+    if q:
+        # 转义LIKE通配符，按字面量做包含匹配
+        escaped = (q.replace('\\', '\\\\')
+                    .replace('%', '\\%')
+                    .replace('_', '\\_'))
+        pattern = f'%{escaped}%'
+        conditions.append("(name LIKE ? ESCAPE '\\' OR phone LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+    if favorite is not None:
+        conditions.append("is_favorite = ?")
+        params.append(1 if favorite else 0)
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+    
+    sql = "SELECT * FROM contacts"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY id"
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        # 多取一条用于判断是否还有下一页
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    
+    return sql, params, limit
+
+def list_contacts(q=None, favorite=None, limit=None, after_id=None,
+                  include_methods=False, with_version=False):
+    """按条件查询联系人（过滤与键集分页都在SQL中完成）
+    
+    Args:
+        q (str): 姓名或电话包含的关键字
+        favorite (int): 1只查收藏，0只查未收藏，None不过滤
+        limit (int): 单页条数，None表示不分页；超过MAX_PAGE_SIZE按上限处理
+        after_id (int): 游标，只返回id大于该值的联系人
+        include_methods (bool): 是否嵌入联系方式
+        with_version (bool): 是否额外返回读取数据前的变更版本号（用作ETag）
+    
+    Returns:
+        tuple: (联系人字典列表, 下一页游标)，没有下一页时游标为None；
+        with_version为True时追加版本号，查询失败时版本号为None
+    """
     contacts = []
-    conn = create_connection()
+    next_cursor = None
+    version = None
+    sql, params, limit = _build_list_query(q, favorite, limit, after_id)
     
-    if conn is not None:
-        try:
+    try:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM contacts")
+            # 先读版本号再读数据：数据只会比版本号新，ETag不会标记旧数据
+            version = _read_change_version(cursor)
+            key = list_key(version, 'contacts', q, favorite, limit, after_id,
+                           include_methods)
+            cached = _cache_lookup(key)
+            if cached is not None:
+                contacts, next_cursor = cached
+                if with_version:
+                    return contacts, next_cursor, version
+                return contacts, next_cursor
+            
+            cursor.execute(sql, params)
             rows = cursor.fetchall()
             
-            # 转换为Contact对象列表
-            for row in rows:
-                contact = Contact(
-                    id=row[0],
-                    name=row[1],
-                    phone=row[2],
-                    email=row[3],
-                    address=row[4],
-                    is_favorite=row[5]
-                )
-                contacts.append(contact.to_dict())
-        except Error as e:
-            print(f"查询联系人错误: {e}")
-        finally:
-            conn.close()  # 确保连接关闭
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = rows[-1][0]
+            
+            # 行直接转换为字典，不创建中间的Contact对象
+            contacts = [Contact.row_to_dict(row) for row in rows]
+            
+            if include_methods:
+                _attach_methods(cursor, contacts, paged=limit is not None)
+        
+        # 不分页的全量结果可能很大，只缓存单页结果
+        if len(contacts) <= MAX_PAGE_SIZE:
+            _cache_store(key, (contacts, next_cursor))
+    except Error as e:
+        print(f"查询联系人错误: {e}")
     
-    return contacts
+    if with_version:
+        return contacts, next_cursor, version
+    return contacts, next_cursor
 
-def get_favorite_contacts():
-    """获取所有收藏的联系人"""
-    contacts = []
-    conn = create_connection()
+def _read_change_version(cursor, contact_id=None):
+    """读取变更日志的最新版本号（整表或单个联系人），没有变更记录时为0"""
+    if contact_id is None:
+        cursor.execute("SELECT coalesce(max(version), 0) FROM contact_changes")
+    else:
+        cursor.execute(
+            "SELECT coalesce(max(version), 0) FROM contact_changes WHERE contact_id = ?",
+            (contact_id,)
+        )
+    return cursor.fetchone()[0]
+
+def get_change_version(contact_id=None):
+    """获取联系人数据的当前变更版本号
     
-    if conn is not None:
-        try:
+    Args:
+        contact_id (int): 指定时返回该联系人的版本号，否则返回整表版本号
+    
+    Returns:
+        int: 版本号；查询失败时返回None
+    """
+    try:
+        with get_connection() as conn:
+            return _read_change_version(conn.cursor(), contact_id)
+    except Error as e:
+        print(f"查询变更版本错误: {e}")
+        return None
+
+def get_changes(since, limit=MAX_PAGE_SIZE, include_methods=False):
+    """获取某个版本之后新增、修改或删除的联系人
+    
+    同一联系人的多次变更合并为一条，返回其当前数据；已删除的联系人
+    只返回ID。结果按联系人最后一次变更的版本排序，客户端把返回的
+    version作为下一次请求的since即可逐页追上最新状态。
+    
+    Args:
+        since (int): 客户端已同步到的版本号
+        limit (int): 单次返回的联系人数，超过MAX_PAGE_SIZE按上限处理
+        include_methods (bool): 是否嵌入联系方式
+    
+    Returns:
+        dict: 包含 version（下次请求的since）、contacts（变更后的联系人）、
+        deleted（已删除的联系人ID）和 has_more（是否还有未返回的变更）；
+        查询失败时返回None
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    try:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM contacts WHERE is_favorite = 1")
+            # 以本次读取时的最新版本为上界，之后的变更留给下一次请求
+            latest = _read_change_version(cursor)
+            cursor.execute(
+                """SELECT contact_id, max(version) AS last_version
+                   FROM contact_changes
+                   WHERE version > ? AND version <= ?
+                   GROUP BY contact_id
+                   ORDER BY last_version
+                   LIMIT ?""",
+                (since, latest, limit + 1)
+            )
             rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            changed_ids = [row[0] for row in rows]
             
-            # 转换为Contact对象列表
-            for row in rows:
-                contact = Contact(
-                    id=row[0],
-                    name=row[1],
-                    phone=row[2],
-                    email=row[3],
-                    address=row[4],
-                    is_favorite=row[5]
+            contacts = []
+            if changed_ids:
+                placeholders = ", ".join("?" * len(changed_ids))
+                cursor.execute(
+                    f"SELECT * FROM contacts WHERE id IN ({placeholders}) ORDER BY id",
+                    changed_ids
                 )
-                contacts.append(contact.to_dict())
-        except Error as e:
-            print(f"查询收藏联系人错误: {e}")
-        finally:
-            conn.close()  # 确保连接关闭
+                contacts = [Contact.row_to_dict(row) for row in cursor.fetchall()]
+                if include_methods:
+                    _attach_methods(cursor, contacts, paged=True)
+    except Error as e:
+        print(f"查询变更错误: {e}")
+        return None
+    
+    existing_ids = {contact['id'] for contact in contacts}
+    return {
+        'version': rows[-1][1] if has_more else latest,
+        'contacts': contacts,
+        'deleted': [contact_id for contact_id in changed_ids
+                    if contact_id not in existing_ids],
+        'has_more': has_more,
+    }
+
+def prune_changes():
+    """压缩变更日志，每个联系人只保留最后一次变更
+    
+    get_changes、ETag和副本同步都只用到每个联系人的最大版本号，被同一
+    联系人后续变更覆盖的行对任何since都不再需要，删除后增量同步结果
+    不变。已删除联系人的最后一行会保留，用来告知客户端删除。
+    
+    Returns:
+        int: 删除的行数；失败时返回None
+    """
+    try:
+        with write_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """DELETE FROM contact_changes WHERE version NOT IN (
+                       SELECT max(version) FROM contact_changes
+                       GROUP BY contact_id)"""
+            )
+            return cursor.rowcount
+    except Error as e:
+        print(f"压缩变更日志错误: {e}")
+        return None
+
+# 流式输出时每次从游标读取的行数
+STREAM_FETCH_SIZE = 1000
+
+# 流式输出使用的JSON编码器（紧凑格式，中文不转义）
+_json_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+def _iter_method_groups(cursor):
+    """按contact_id分组产出 (contact_id, 联系方式字典列表)，游标须按contact_id排序"""
+    for contact_id, rows in groupby(cursor, key=itemgetter(1)):
+        yield contact_id, [ContactMethod.row_to_dict(row) for row in rows]
+
+def stream_contacts(q=None, favorite=None, after_id=None,
+                    include_methods=False, ndjson=False):
+    """流式输出联系人（不分页的全量列表）
+    
+    用fetchmany逐批从游标读取并编码，首字节时间和内存占用与总行数
+    无关。联系方式用第二个按contact_id排序的游标做归并，同样不整体
+    载入。
+    
+    Args:
+        q (str): 姓名或电话包含的关键字
+        favorite (int): 1只查收藏，0只查未收藏，None不过滤
+        after_id (int): 只返回id大于该值的联系人
+        include_methods (bool): 是否嵌入联系方式
+        ndjson (bool): 为 True 时每行输出一个JSON对象（NDJSON），
+            否则输出一个JSON数组
+    
+    Returns:
+        generator: 依次产出文本片段；开始迭代时才从连接池取连接，
+        迭代结束或被关闭时归还
+    """
+    sql, params, _ = _build_list_query(q, favorite, None, after_id)
+    # 在请求上下文中确定连接池，生成器可能在请求结束后才被迭代
+    pool = get_pool()
+    batches = _iter_contact_batches(pool, sql, params, include_methods)
+    if ndjson:
+        return _iter_ndjson(batches)
+    return _iter_json_array(batches)
+
+def encode_ndjson(items):
+    """把字典列表编码为NDJSON文本（每行一个JSON对象）"""
+    return ''.join(_json_encode(item) + '\n' for item in items)
+
+def _iter_contact_batches(pool, sql, params, include_methods):
+    """执行查询并逐批产出联系人字典列表"""
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        groups = None
+        pending = None
+        if include_methods:
+            # 与联系人查询处于同一个读事务中，看到的是同一份快照
+            groups = _iter_method_groups(conn.execute(
+                "SELECT * FROM contact_methods ORDER BY contact_id, id"
+            ))
+            pending = next(groups, None)
+        
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                contact = Contact.row_to_dict(row)
+                if groups is not None:
+                    # 跳过不属于本次结果的联系人的联系方式
+                    while pending is not None and pending[0] < row[0]:
+                        pending = next(groups, None)
+                    if pending is not None and pending[0] == row[0]:
+                        contact['methods'] = pending[1]
+                        pending = next(groups, None)
+                    else:
+                        contact['methods'] = []
+                batch.append(contact)
+            yield batch
+    finally:
+        pool.release(conn)
+
+def _iter_json_array(batches):
+    """把批次编码为一个JSON数组的各个片段"""
+    try:
+        yield '['
+        separator = ''
+        for batch in batches:
+            # 整批编码为数组后去掉两端括号，每批只调用一次编码器
+            yield separator + _json_encode(batch)[1:-1]
+            separator = ','
+        yield ']'
+    finally:
+        batches.close()
+
+def _iter_ndjson(batches):
+    """把批次编码为NDJSON片段"""
+    try:
+        for batch in batches:
+            yield encode_ndjson(batch)
+    finally:
+        batches.close()
+
+# 全文索引的列
+FTS_COLUMNS = ('name', 'phone', 'email', 'address', 'methods')
+
+# 全文检索各列的bm25权重，与FTS_COLUMNS一一对应
+FTS_COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 2.0)
+
+# trigram分词能通过索引匹配的最短词长
+FTS_MIN_TOKEN_LENGTH = 3
+
+def _build_fts_query(q):
+    """把用户输入拆为FTS5查询和短词
+    
+    三个字符以上的词交给trigram索引按子串匹配；更短的词无法使用索引，
+    原样返回，由调用方逐行匹配。
+    
+    Returns:
+        tuple: (FTS5查询，没有长词时为空字符串, 短词列表)
+    """
+    terms = []
+    short_tokens = []
+    for token in re.findall(r'[^\W_]+', q):
+        if len(token) >= FTS_MIN_TOKEN_LENGTH:
+            terms.append(f'"{token}"')
+        else:
+            short_tokens.append(token.lower())
+    return " AND ".join(terms), short_tokens
+
+def _short_token_condition():
+    """短词在任一全文索引列中出现的条件（参数为同一个词重复各列次）
+    
+    用instr逐行匹配而不用LIKE：部分SQLite版本的trigram对不足三个
+    字符的LIKE会误返回空结果。
+    """
+    return "(" + " OR ".join(
+        f"instr(lower(contacts_fts.{column}), ?) > 0" for column in FTS_COLUMNS
+    ) + ")"
+
+def search_contacts(q, limit=20, include_methods=False):
+    """全文搜索联系人（姓名、电话、邮箱、地址及各类联系方式）
+    
+    Args:
+        q (str): 搜索关键字，多个词之间为“且”关系，每个词按子串匹配
+        limit (int): 返回条数，超过MAX_PAGE_SIZE按上限处理
+        include_methods (bool): 是否嵌入联系方式
+    
+    Returns:
+        list: 按bm25相关度排序的联系人字典列表；只有一两个字符的短词
+        时无法计算相关度，姓名命中的排在前面
+    """
+    match, short_tokens = _build_fts_query(q)
+    if not match and not short_tokens:
+        return []
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    contacts = []
+    
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            key = list_key(_read_change_version(cursor), 'search', match,
+                           short_tokens, limit, include_methods)
+            cached = _cache_lookup(key)
+            if cached is not None:
+                return cached
+            
+            conditions = [_short_token_condition()] * len(short_tokens)
+            params = [token for token in short_tokens
+                      for _ in FTS_COLUMNS]
+            if match:
+                conditions.insert(0, "contacts_fts MATCH ?")
+                params.insert(0, match)
+                weights = ", ".join(str(w) for w in FTS_COLUMN_WEIGHTS)
+                order_by = f"bm25(contacts_fts, {weights})"
+            else:
+                order_by = "instr(lower(contacts_fts.name), ?) = 0, c.id"
+                params.append(short_tokens[0])
+            cursor.execute(
+                f"""SELECT c.* FROM contacts_fts
+                    JOIN contacts AS c ON c.id = contacts_fts.rowid
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY {order_by}
+                    LIMIT ?""",
+                params + [limit]
+            )
+            contacts = [Contact.row_to_dict(row) for row in cursor.fetchall()]
+            
+            if include_methods:
+                _attach_methods(cursor, contacts, paged=True)
+        _cache_store(key, contacts)
+    except Error as e:
+        if 'contacts_fts' not in str(e):
+            print(f"搜索联系人错误: {e}")
+            return contacts
+        # 未启用FTS5时退回LIKE查询
+        contacts, _ = list_contacts(q=q, limit=limit,
+                                    include_methods=include_methods)
     
     return contacts
 
-def get_contact_by_id(contact_id):
-    """通过ID获取单个联系人"""
-    conn = create_connection()
+def _attach_methods(cursor, contacts, paged=False):
+    """用一条按contact_id排序的查询取出联系方式，并挂到对应联系人下
+    
+    分页时只查询本页联系人的联系方式（页大小不超过MAX_PAGE_SIZE，
+    不会超出SQLite的参数个数限制）。
+    """
+    methods_by_contact = {}
+    for contact in contacts:
+        contact['methods'] = []
+        methods_by_contact[contact['id']] = contact['methods']
+    
+    if not methods_by_contact:
+        return
+    
+    if paged:
+        placeholders = ", ".join("?" * len(methods_by_contact))
+        cursor.execute(
+            f"SELECT * FROM contact_methods WHERE contact_id IN ({placeholders}) "
+            "ORDER BY contact_id, id",
+            list(methods_by_contact)
+        )
+    else:
+        cursor.execute("SELECT * FROM contact_methods ORDER BY contact_id, id")
+    for row in cursor:
+        methods = methods_by_contact.get(row[1])
+        if methods is not None:
+            methods.append(ContactMethod.row_to_dict(row))
+
+# 收藏列表返回的列：联系人字段之后是收藏时间和排序值
+FAVORITE_COLUMNS = "id, name, phone, email, address, is_favorite, favorited_at, favorite_rank"
+
+def _favorite_row_to_dict(row):
+    """把收藏列表的一行转换为字典"""
+    contact = Contact.row_to_dict(row)
+    contact['favorited_at'] = row[6]
+    contact['favorite_rank'] = row[7]
+    return contact
+
+def get_favorite_contacts(limit=None, after_rank=None, with_version=False):
+    """按用户排序获取收藏的联系人（由索引提供顺序，不排序也不扫描全表）
+    
+    Args:
+        limit (int): 单页条数，None表示全部；超过MAX_PAGE_SIZE按上限处理
+        after_rank (float): 游标，只返回排序值大于该值的收藏
+        with_version (bool): 是否额外返回读取数据前的变更版本号（用作ETag）
+    
+    Returns:
+        tuple: (联系人字典列表, 下一页游标)，联系人含 favorited_at 与
+        favorite_rank；with_version为True时追加版本号
+    """
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    contacts = []
+    next_cursor = None
+    version = None
+    sql = f"SELECT {FAVORITE_COLUMNS} FROM contacts WHERE is_favorite = 1"
+    params = []
+    if after_rank is not None:
+        sql += " AND favorite_rank > ?"
+        params.append(after_rank)
+    sql += " ORDER BY favorite_rank"
+    if limit is not None:
+        # 多取一条用于判断是否还有下一页
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            version = _read_change_version(cursor)
+            key = list_key(version, 'favorites', limit, after_rank)
+            cached = _cache_lookup(key)
+            if cached is not None:
+                contacts, next_cursor = cached
+                if with_version:
+                    return contacts, next_cursor, version
+                return contacts, next_cursor
+            
+            rows = cursor.execute(sql, params).fetchall()
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = rows[-1][7]
+            contacts = [_favorite_row_to_dict(row) for row in rows]
+        
+        if len(contacts) <= MAX_PAGE_SIZE:
+            _cache_store(key, (contacts, next_cursor))
+    except Error as e:
+        print(f"查询收藏联系人错误: {e}")
+    
+    if with_version:
+        return contacts, next_cursor, version
+    return contacts, next_cursor
+
+def get_contact_by_id(contact_id, with_version=False):
+    """通过ID获取单个联系人
+    
+    with_version为True时返回 (联系人, 读取前的变更版本号)
+    """
     contact = None
+    version = None
     
-    if conn is not None:
-        try:
+    try:
+        with get_connection() as conn:
             cursor = conn.cursor()
+            version = _read_change_version(cursor, contact_id)
+            key = contact_key(contact_id, version)
+            cached = _cache_lookup(key)
+            if cached is not None:
+                return (cached, version) if with_version else cached
+            
             # 使用参数化查询防止SQL注入
             cursor.execute("SELECT * FROM contacts WHERE id = ?", (contact_id,))
             row = cursor.fetchone()  # 获取单条记录
@@ -85,48 +574,40 @@ def get_contact_by_id(contact_id):
                     address=row[4],
                     is_favorite=row[5]
                 ).to_dict()
-        except Error as e:
-            print(f"查询单个联系人错误: {e}")
-        finally:
-            conn.close()  # 确保连接关闭
+                _cache_store(key, contact)
+    except Error as e:
+        print(f"查询单个联系人错误: {e}")
     
+    if with_version:
+        return contact, version
     return contact
 
 def get_contact_methods(contact_id):
     """获取联系人的所有联系方式"""
     methods = []
-    conn = create_connection()
     
-    if conn is not None:
-        try:
+    try:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM contact_methods WHERE contact_id = ?", (contact_id,))
-            rows = cursor.fetchall()
+            key = methods_key(contact_id, _read_change_version(cursor, contact_id))
+            cached = _cache_lookup(key)
+            if cached is not None:
+                return cached
             
-            # 转换为ContactMethod对象列表
-            for row in rows:
-                method = ContactMethod(
-                    id=row[0],
-                    contact_id=row[1],
-                    method_type=row[2],
-                    method_value=row[3],
-                    is_primary=row[4]
-                )
-                methods.append(method.to_dict())
-        except Error as e:
-            print(f"查询联系方式错误: {e}")
-        finally:
-            conn.close()
+            cursor.execute("SELECT * FROM contact_methods WHERE contact_id = ?", (contact_id,))
+            methods = [ContactMethod.row_to_dict(row) for row in cursor.fetchall()]
+        _cache_store(key, methods)
+    except Error as e:
+        print(f"查询联系方式错误: {e}")
     
     return methods
 
 def create_contact(contact_data):
     """创建新联系人"""
-    conn = create_connection()
     new_contact = None
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             # 插入新联系人（返回自增ID）
             cursor.execute(
@@ -136,32 +617,28 @@ def create_contact(contact_data):
                  contact_data.get('email', ''), contact_data.get('address', ''),
                  contact_data.get('is_favorite', 0))
             )
-            conn.commit()  # 提交事务
             
             # 获取刚创建的联系人ID
             contact_id = cursor.lastrowid
             
-            # 如果有联系方式数据，创建联系方式
+            # 如果有联系方式数据，创建联系方式；任何一条失败都回滚整个联系人
             if 'methods' in contact_data and isinstance(contact_data['methods'], list):
                 for method_data in contact_data['methods']:
-                    create_contact_method(contact_id, method_data)
+                    if create_contact_method(contact_id, method_data) is None:
+                        raise Error(f"联系方式创建失败: {method_data}")
             
             new_contact = get_contact_by_id(contact_id)  # 返回完整的新联系人信息
-        except Error as e:
-            print(f"创建联系人错误: {e}")
-            conn.rollback()  # 出错时回滚
-        finally:
-            conn.close()  # 确保连接关闭
+    except Error as e:
+        print(f"创建联系人错误: {e}")
     
     return new_contact
 
 def create_contact_method(contact_id, method_data):
     """创建新的联系方式"""
-    conn = create_connection()
     new_method = None
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             # 插入新联系方式
             cursor.execute(
@@ -170,7 +647,6 @@ def create_contact_method(contact_id, method_data):
                 (contact_id, method_data['method_type'], method_data['method_value'],
                  method_data.get('is_primary', 0))
             )
-            conn.commit()
             
             # 获取刚创建的联系方式ID
             method_id = cursor.lastrowid
@@ -181,8 +657,7 @@ def create_contact_method(contact_id, method_data):
                     "UPDATE contact_methods SET is_primary = 0 WHERE contact_id = ? AND id != ?",
                     (contact_id, method_id)
                 )
-                conn.commit()
-                
+            
             # 获取完整的联系方式信息
             cursor.execute("SELECT * FROM contact_methods WHERE id = ?", (method_id,))
             row = cursor.fetchone()
@@ -194,21 +669,17 @@ def create_contact_method(contact_id, method_data):
                     method_value=row[3],
                     is_primary=row[4]
                 ).to_dict()
-        except Error as e:
-            print(f"创建联系方式错误: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"创建联系方式错误: {e}")
     
     return new_method
 
 def update_contact(contact_id, contact_data):
     """更新已有联系人"""
-    conn = create_connection()
     updated_contact = None
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             # 更新联系人信息
             cursor.execute(
@@ -219,25 +690,171 @@ def update_contact(contact_id, contact_data):
                  contact_data.get('is_favorite', 0), 
                  contact_id)
             )
-            conn.commit()  # 提交事务
             
             # 验证更新结果（查询更新后的联系人）
             updated_contact = get_contact_by_id(contact_id)
-        except Error as e:
-            print(f"更新联系人错误: {e}")
-            conn.rollback()  # 出错时回滚
-        finally:
-            conn.close()  # 确保连接关闭
+    except Error as e:
+        print(f"更新联系人错误: {e}")
+    
+    return updated_contact
+
+# 联系人表中可以部分更新的字段
+CONTACT_FIELDS = ('name', 'phone', 'email', 'address', 'is_favorite')
+
+def _validate_contact_data(contact_data, partial=False):
+    """校验联系人数据，partial为True时只校验出现的字段
+    
+    Raises:
+        ValueError: 数据格式不正确或必填字段为空
+    """
+    if not isinstance(contact_data, dict):
+        raise ValueError('联系人数据必须为对象')
+    for field in ('name', 'phone'):
+        if (not partial or field in contact_data) and not contact_data.get(field):
+            raise ValueError('姓名和电话为必填项')
+    methods = contact_data.get('methods')
+    if methods is not None:
+        if not isinstance(methods, list):
+            raise ValueError('methods必须为数组')
+        for method_data in methods:
+            _validate_method_data(method_data)
+
+def _validate_method_data(method_data):
+    """校验联系方式数据
+    
+    Raises:
+        ValueError: 类型或值为空
+    """
+    if not isinstance(method_data, dict) or \
+            not method_data.get('method_type') or not method_data.get('method_value'):
+        raise ValueError('联系方式的类型和值为必填项')
+
+def _sync_contact_methods(cursor, contact_id, methods):
+    """把联系人的联系方式同步为给定的完整列表，只增删改有差异的行
+    
+    带id的项对应已有记录；不带id的项按类型和值匹配剩余的已有记录，
+    匹配不到才新增；没有出现的已有记录被删除。多个项标记为主要时只
+    保留最后一个，写入后每个联系人至多一个主要联系方式。
+    
+    Returns:
+        tuple: (新增数, 修改数, 删除数)
+    
+    Raises:
+        ValueError: id不属于该联系人或重复出现
+    """
+    cursor.execute(
+        "SELECT id, method_type, method_value, is_primary FROM contact_methods "
+        "WHERE contact_id = ? ORDER BY id",
+        (contact_id,)
+    )
+    remaining = {row[0]: (row[1], row[2], 1 if row[3] else 0)
+                 for row in cursor.fetchall()}
+    
+    desired = [
+        [method_data.get('id'), method_data['method_type'],
+         method_data['method_value'], 1 if method_data.get('is_primary') else 0]
+        for method_data in methods
+    ]
+    primaries = [item for item in desired if item[3]]
+    for item in primaries[:-1]:
+        item[3] = 0
+    
+    updates = []
+    inserts = []
+    unidentified = []
+    for method_id, method_type, method_value, is_primary in desired:
+        if method_id is None:
+            unidentified.append((method_type, method_value, is_primary))
+            continue
+        if method_id not in remaining:
+            raise ValueError(f'联系方式 {method_id} 不属于该联系人或重复出现')
+        if remaining.pop(method_id) != (method_type, method_value, is_primary):
+            updates.append((method_type, method_value, is_primary, method_id))
+    
+    ids_by_value = {}
+    for method_id, (method_type, method_value, _) in remaining.items():
+        ids_by_value.setdefault((method_type, method_value), []).append(method_id)
+    for method_type, method_value, is_primary in unidentified:
+        candidates = ids_by_value.get((method_type, method_value))
+        if candidates:
+            method_id = candidates.pop(0)
+            if remaining.pop(method_id)[2] != is_primary:
+                updates.append((method_type, method_value, is_primary, method_id))
+        else:
+            inserts.append((contact_id, method_type, method_value, is_primary))
+    
+    # 先删除再修改、新增，任何时刻都不会出现两个主要联系方式
+    cursor.executemany("DELETE FROM contact_methods WHERE id = ?",
+                       [(method_id,) for method_id in remaining])
+    cursor.executemany(
+        """UPDATE contact_methods SET method_type = ?, method_value = ?, is_primary = ?
+           WHERE id = ?""",
+        updates
+    )
+    cursor.executemany(
+        """INSERT INTO contact_methods (contact_id, method_type, method_value, is_primary)
+           VALUES (?, ?, ?, ?)""",
+        inserts
+    )
+    return len(inserts), len(updates), len(remaining)
+
+def patch_contact(contact_id, contact_data):
+    """部分更新联系人，并在同一事务中同步其联系方式
+    
+    Args:
+        contact_id (int): 联系人ID
+        contact_data (dict): 只更新出现的字段（name、phone、email、address、
+            is_favorite）；包含methods时视为该联系人完整的联系方式列表，
+            与已有记录比对后只写入有差异的行
+    
+    Returns:
+        dict: 更新后的联系人，methods字段为其联系方式；联系人不存在或
+        数据库错误时返回None
+    
+    Raises:
+        ValueError: 数据校验失败（整体回滚）
+    """
+    _validate_contact_data(contact_data, partial=True)
+    updated_contact = None
+    
+    try:
+        with write_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(CONTACT_FIELDS)} FROM contacts WHERE id = ?",
+                (contact_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            # 只写入值发生变化的字段
+            current = dict(zip(CONTACT_FIELDS, row))
+            changed = [field for field in CONTACT_FIELDS
+                       if field in contact_data and contact_data[field] != current[field]]
+            if changed:
+                assignments = ", ".join(f"{field} = ?" for field in changed)
+                cursor.execute(
+                    f"UPDATE contacts SET {assignments} WHERE id = ?",
+                    [contact_data[field] for field in changed] + [contact_id]
+                )
+            
+            if 'methods' in contact_data:
+                _sync_contact_methods(cursor, contact_id, contact_data['methods'])
+            
+            updated_contact = dict(get_contact_by_id(contact_id),
+                                   methods=get_contact_methods(contact_id))
+    except Error as e:
+        print(f"部分更新联系人错误: {e}")
     
     return updated_contact
 
 def update_contact_method(method_id, method_data):
     """更新联系方式"""
-    conn = create_connection()
     updated_method = None
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             
             # 获取联系方式的contact_id
@@ -262,8 +879,6 @@ def update_contact_method(method_id, method_data):
                     (contact_id, method_id)
                 )
             
-            conn.commit()
-            
             # 获取更新后的联系方式
             cursor.execute("SELECT * FROM contact_methods WHERE id = ?", (method_id,))
             row = cursor.fetchone()
@@ -275,210 +890,595 @@ def update_contact_method(method_id, method_data):
                     method_value=row[3],
                     is_primary=row[4]
                 ).to_dict()
-        except Error as e:
-            print(f"更新联系方式错误: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"更新联系方式错误: {e}")
     
     return updated_method
 
 def delete_contact_method(method_id):
     """删除联系方式"""
-    conn = create_connection()
     success = False
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM contact_methods WHERE id = ?", (method_id,))
-            conn.commit()
             success = cursor.rowcount > 0
-        except Error as e:
-            print(f"删除联系方式错误: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+    except Error as e:
+        print(f"删除联系方式错误: {e}")
     
     return success
 
 def toggle_favorite(contact_id):
-    """切换联系人的收藏状态"""
-    conn = create_connection()
+    """切换联系人的收藏状态
+    
+    一条 UPDATE ... RETURNING 完成切换并返回结果，不需要先查询也不需要
+    重新读取。收藏时记录收藏时间并排到收藏列表末尾，取消收藏时清除。
+    
+    Returns:
+        dict: 切换后的联系人，不存在时返回None
+    """
     updated_contact = None
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
+            rows = conn.execute(
+                f"""UPDATE contacts
+                    SET is_favorite = CASE WHEN is_favorite = 0 THEN 1 ELSE 0 END,
+                        favorited_at = CASE WHEN is_favorite = 0 THEN ? END,
+                        favorite_rank = CASE WHEN is_favorite = 0
+                                             THEN {next_favorite_rank_sql()} END
+                    WHERE id = ?
+                    RETURNING id, name, phone, email, address, is_favorite""",
+                (time.time(), contact_id)
+            ).fetchall()
+        if rows:
+            updated_contact = Contact.row_to_dict(rows[0])
+    except Error as e:
+        print(f"切换收藏状态错误: {e}")
+    
+    return updated_contact
+
+def _renumber_favorites(cursor):
+    """把收藏的排序值重新编为1, 2, 3...（相邻排序值之间已无法再取中间值时）"""
+    cursor.execute(
+        """UPDATE contacts SET favorite_rank = ranked.position
+           FROM (SELECT id, row_number() OVER (ORDER BY favorite_rank, id) AS position
+                 FROM contacts WHERE is_favorite = 1) AS ranked
+           WHERE contacts.id = ranked.id"""
+    )
+
+def _rank_before(cursor, contact_id, before_id):
+    """计算把收藏移到before_id之前的排序值，before_id不是收藏时返回None"""
+    row = cursor.execute(
+        "SELECT favorite_rank FROM contacts WHERE id = ? AND is_favorite = 1",
+        (before_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    next_rank = row[0]
+    previous_rank = cursor.execute(
+        """SELECT max(favorite_rank) FROM contacts
+           WHERE is_favorite = 1 AND favorite_rank < ? AND id != ?""",
+        (next_rank, contact_id)
+    ).fetchone()[0]
+    if previous_rank is None:
+        return next_rank - 1
+    return (previous_rank + next_rank) / 2
+
+def move_favorite(contact_id, before_id=None):
+    """调整收藏的顺序：移到before_id之前，before_id为None时移到末尾
+    
+    排序值取前后两个收藏的中间值，只更新被移动的一行；浮点数精度用尽
+    时先把全部收藏重新编号。
+    
+    Returns:
+        dict: 移动后的联系人（含 favorited_at 与 favorite_rank），联系人
+        或before_id不是收藏时返回None
+    """
+    moved_contact = None
+    
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
-            
-            # 获取当前收藏状态
-            cursor.execute("SELECT is_favorite FROM contacts WHERE id = ?", (contact_id,))
-            result = cursor.fetchone()
-            if not result:
+            if before_id is None:
+                rank = cursor.execute(f"SELECT {next_favorite_rank_sql()}").fetchone()[0]
+            elif before_id == contact_id:
+                rank = cursor.execute(
+                    "SELECT favorite_rank FROM contacts WHERE id = ?", (contact_id,)
+                ).fetchone()
+                rank = rank[0] if rank else None
+            else:
+                rank = _rank_before(cursor, contact_id, before_id)
+                # 中间值与已有排序值相同说明精度已用尽
+                if rank is not None and cursor.execute(
+                        """SELECT 1 FROM contacts
+                           WHERE is_favorite = 1 AND favorite_rank = ? AND id != ?""",
+                        (rank, contact_id)).fetchone():
+                    _renumber_favorites(cursor)
+                    rank = _rank_before(cursor, contact_id, before_id)
+            if rank is None:
                 return None
             
-            current_favorite = result[0]
-            new_favorite = 1 if current_favorite == 0 else 0
-            
-            # 更新收藏状态
-            cursor.execute("UPDATE contacts SET is_favorite = ? WHERE id = ?", (new_favorite, contact_id))
-            conn.commit()
-            
-            updated_contact = get_contact_by_id(contact_id)
-        except Error as e:
-            print(f"切换收藏状态错误: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            rows = cursor.execute(
+                f"""UPDATE contacts SET favorite_rank = ?
+                    WHERE id = ? AND is_favorite = 1
+                    RETURNING {FAVORITE_COLUMNS}""",
+                (rank, contact_id)
+            ).fetchall()
+        if rows:
+            moved_contact = _favorite_row_to_dict(rows[0])
+    except Error as e:
+        print(f"调整收藏顺序错误: {e}")
     
-    return updated_contact
+    return moved_contact
 
-def export_contacts_to_excel():
-    """将所有联系人导出为Excel文件"""
-    # 创建Workbook对象
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "联系人列表"
-    
-    # 设置表头
-    headers = ["ID", "姓名", "主要电话", "电子邮箱", "地址", "是否收藏", "其他联系方式"]
-    for col_idx, header in enumerate(headers, 1):
-        col_letter = get_column_letter(col_idx)
-        ws[f"{col_letter}1"] = header
-    
-    # 获取所有联系人
-    contacts = get_all_contacts()
-    
-    # 填充数据
-    for row_idx, contact in enumerate(contacts, 2):
-        # 基本信息
-        ws[f"A{row_idx}"] = contact["id"]
-        ws[f"B{row_idx}"] = contact["name"]
-        ws[f"C{row_idx}"] = contact["phone"]
-        ws[f"D{row_idx}"] = contact["email"]
-        ws[f"E{row_idx}"] = contact["address"]
-        ws[f"F{row_idx}"] = "是" if contact["is_favorite"] == 1 else "否"
+# 导出表头
+EXPORT_HEADERS = ["ID", "姓名", "主要电话", "电子邮箱", "地址", "是否收藏", "其他联系方式"]
+
+# 导出列宽上限
+EXPORT_MAX_COLUMN_WIDTH = 50
+
+def _estimate_export_column_widths(cursor):
+    """用聚合查询估算每列的最大字符数（不需要先把数据读进内存）"""
+    cursor.execute(
+        """SELECT max(length(id)), max(length(name)), max(length(phone)),
+                  max(length(coalesce(email, 'None'))),
+                  max(length(coalesce(address, 'None')))
+           FROM contacts"""
+    )
+    lengths = list(cursor.fetchone())
+    # 是否收藏列固定为“是/否”
+    lengths.append(1)
+    # 其他联系方式列按 "type: value; " 的总长度估算
+    cursor.execute(
+        """SELECT max(total) FROM (
+               SELECT sum(length(method_type) + length(method_value) + 4) AS total
+               FROM contact_methods GROUP BY contact_id
+           )"""
+    )
+    lengths.append(cursor.fetchone()[0])
+    
+    widths = []
+    for header, length in zip(EXPORT_HEADERS, lengths):
+        max_length = max(len(header), length or 0)
+        widths.append(min(max_length + 2, EXPORT_MAX_COLUMN_WIDTH))
+    return widths
+
+# 导出行：列与 EXPORT_HEADERS 一致，其他联系方式（不含与主要电话相同的
+# phone）在SQL中拼接为 "type: value; type: value"。按contact_id索引查找
+# 联系方式时按id顺序返回，拼接顺序与录入顺序一致
+EXPORT_ROWS_SQL = """
+SELECT c.id, c.name, c.phone, c.email, c.address,
+       CASE WHEN c.is_favorite = 1 THEN '是' ELSE '否' END,
+       coalesce((SELECT group_concat(m.method_type || ': ' || m.method_value, '; ')
+                 FROM contact_methods AS m
+                 WHERE m.contact_id = c.id
+                   AND NOT (m.method_type = 'phone' AND m.method_value = c.phone)), '无')
+FROM contacts AS c
+ORDER BY c.id"""
+
+def select_export_rows(cursor):
+    """执行导出查询，返回逐个联系人产出导出行的游标"""
+    return cursor.execute(EXPORT_ROWS_SQL)
+
+# 导出进度回调的间隔行数
+EXPORT_PROGRESS_INTERVAL = 1000
+
+def write_contacts_workbook(output, on_progress=None):
+    """把所有联系人以openpyxl只写模式逐行写入output
+    
+    Args:
+        output: 可写的文件路径或二进制文件对象
+        on_progress (callable): 每写入EXPORT_PROGRESS_INTERVAL行调用
+            on_progress(已写入行数, 联系人总数)
+    
+    Returns:
+        int: 写入的联系人数
+    
+    Raises:
+        sqlite3.Error: 数据库操作异常
+    """
+    # openpyxl导入较慢，只在第一次导入导出Excel时加载
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("联系人列表")
+    written = 0
+    
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        total = None
+        if on_progress is not None:
+            cursor.execute("SELECT count(*) FROM contacts")
+            total = cursor.fetchone()[0]
         
-        # 其他联系方式
-        methods = get_contact_methods(contact["id"])
-        other_methods = []
-        for method in methods:
-            if method["method_type"] != "phone" or method["method_value"] != contact["phone"]:
-                other_methods.append(f"{method['method_type']}: {method['method_value']}")
+        # 只写模式下列宽必须在写入第一行之前设置
+        widths = _estimate_export_column_widths(cursor)
+        for col_idx, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
         
-        ws[f"G{row_idx}"] = "; ".join(other_methods) if other_methods else "无"
+        ws.append(EXPORT_HEADERS)
+        for row in select_export_rows(cursor):
+            ws.append(row)
+            written += 1
+            if on_progress is not None and written % EXPORT_PROGRESS_INTERVAL == 0:
+                on_progress(written, total)
     
-    # 调整列宽
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column].width = adjusted_width
-    
-    # 将Excel文件保存到内存
-    output = io.BytesIO()
     wb.save(output)
-    output.seek(0)
+    if on_progress is not None:
+        on_progress(written, total)
+    return written
+
+def export_contacts_to_excel():
+    """将所有联系人导出为Excel文件
+    
+    使用openpyxl只写模式逐行写入临时文件，内存占用与联系人数量无关。
+    
+    Returns:
+        file: 已定位到开头的临时文件对象，读取完毕后由调用方关闭
+    """
+    output = tempfile.TemporaryFile()
+    
+    try:
+        write_contacts_workbook(output)
+        output.seek(0)
+    except BaseException:
+        output.close()
+        raise
     
     return output
 
-def import_contacts_from_excel(file_stream):
-    """从Excel文件导入联系人数据"""
-    try:
-        # 加载Excel文件
-        workbook = load_workbook(file_stream)
-        worksheet = workbook.active
+# 批量导入时每批写入的联系人数量
+IMPORT_BATCH_SIZE = 1000
+
+# 导入报告中最多保留的错误条数
+IMPORT_MAX_ERRORS = 1000
+
+def _cell_text(row, index):
+    """读取一行中指定列的文本，缺失或为空时返回空字符串"""
+    if len(row) <= index or row[index] is None:
+        return ''
+    return str(row[index]).strip()
+
+def parse_other_methods(value):
+    """解析 "type: value; type: value" 格式的其他联系方式
+    
+    Returns:
+        list: (method_type, method_value) 元组列表
+    """
+    methods = []
+    if not value or value == '无':
+        return methods
+    # 按分号分割多个联系方式
+    for method_pair in str(value).split(';'):
+        method_pair = method_pair.strip()
+        if ':' not in method_pair:
+            continue
+        method_type, method_value = method_pair.split(':', 1)
+        method_type = method_type.strip()
+        method_value = method_value.strip()
+        if method_type and method_value:
+            methods.append((method_type, method_value))
+    return methods
+
+def insert_contact_batch(cursor, batch):
+    """用executemany写入一批联系人及其联系方式（需在写事务中调用）
+    
+    在写事务内先取当前最大ID，再显式分配连续ID，这样联系方式无需
+    逐行读取lastrowid就能关联到联系人。
+    
+    Args:
+        cursor: 处于写事务中的游标
+        batch (list): (name, phone, email, address, is_favorite) 与
+            [(method_type, method_value), ...] 组成的二元组列表
+    
+    Returns:
+        tuple: (写入的联系人数, 写入的联系方式数)
+    """
+    cursor.execute(
+        """SELECT max(coalesce((SELECT max(id) FROM contacts), 0),
+                      coalesce((SELECT seq FROM sqlite_sequence
+                                WHERE name = 'contacts'), 0))"""
+    )
+    base_id = cursor.fetchone()[0]
+    
+    contact_rows = []
+    method_rows = []
+    for offset, (contact, methods) in enumerate(batch, 1):
+        contact_id = base_id + offset
+        contact_rows.append((contact_id,) + tuple(contact))
+        for method_type, method_value in methods:
+            # 其他联系方式不是主要联系方式
+            method_rows.append((contact_id, method_type, method_value, 0))
+    
+    # 先写联系方式再写联系人：写联系方式时联系人还不存在，全文索引触发器
+    # 不写索引行；写联系人时一次写入包含全部联系方式的索引行，而不是每条
+    # 联系方式都重建一次（未启用外键约束，先写子表不会报错）
+    cursor.executemany(
+        """INSERT INTO contact_methods (contact_id, method_type, method_value, is_primary)
+           VALUES (?, ?, ?, ?)""",
+        method_rows
+    )
+    cursor.executemany(
+        """INSERT INTO contacts (id, name, phone, email, address, is_favorite)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        contact_rows
+    )
+    return len(contact_rows), len(method_rows)
+
+def new_import_report():
+    """空的导入报告，字段见 import_contacts_from_excel"""
+    return {'imported': 0, 'updated': 0, 'unchanged': 0, 'methods': 0, 'skipped': 0,
+            'errors': []}
+
+def import_error_recorder(report):
+    """返回 record_error(行号, 错误信息)，把跳过的行记入导入报告"""
+    def record_error(row_number, message):
+        report['skipped'] += 1
+        if len(report['errors']) < IMPORT_MAX_ERRORS:
+            report['errors'].append({'row': row_number, 'error': message})
+    return record_error
+
+def iter_import_batches(rows, batch_size, start_row, record_error):
+    """逐行解析导出格式的行，按batch_size生成 (批次, 批次最后一行的行号)
+    
+    Args:
+        rows: 从第start_row行开始的行序列（Excel单元格值或CSV字段）
+        batch_size (int): 每批的联系人数量
+        start_row (int): rows中第一行的行号
+        record_error (callable): 跳过无效行时调用 record_error(行号, 错误信息)
+    """
+    batch = []
+    row_number = start_row - 1
+    
+    # 列顺序与导出一致：
+    # A列(0): ID - 导入时跳过，使用数据库自增ID
+    # B列(1): 姓名  C列(2): 主要电话  D列(3): 电子邮箱
+    # E列(4): 地址  F列(5): 是否收藏  G列(6): 其他联系方式
+    for row_number, row in enumerate(rows, start_row):
+        # 跳过空行（ID和姓名都为空）
+        if not row or (not row[0] and (len(row) < 2 or not row[1])):
+            continue
         
-        # 读取表头
-        headers = [cell.value for cell in worksheet[1]]
+        name = _cell_text(row, 1)
+        phone = _cell_text(row, 2)
+        if not name or not phone:
+            record_error(row_number, '姓名和电话为必填项')
+            continue
         
-        # 从第二行开始读取数据
-        for row in worksheet.iter_rows(min_row=2, values_only=True):
-            # 跳过空行（检查ID列或姓名列是否为空）
-            if not row[0] and not row[1]:  # ID和姓名都为空，跳过该行
-                continue
-            
-            # 根据导出的列顺序读取数据：
-            # A列(0): ID - 导入时跳过，使用数据库自增ID
-            # B列(1): 姓名
-            # C列(2): 主要电话
-            # D列(3): 电子邮箱
-            # E列(4): 地址
-            # F列(5): 是否收藏
-            # G列(6): 其他联系方式
-            
-            # 创建联系人基本信息
-            contact_data = {
-                'name': row[1] if len(row) > 1 and row[1] else '',
-                'phone': row[2] if len(row) > 2 and row[2] else '',
-                'email': row[3] if len(row) > 3 and row[3] else '',
-                'address': row[4] if len(row) > 4 and row[4] else '',
-                'is_favorite': 1 if len(row) > 5 and row[5] == '是' else 0
-            }
-            
-            # 验证必填字段
-            if not contact_data['name'] or not contact_data['phone']:
-                continue
-            
-            # 创建联系人
-            new_contact = create_contact(contact_data)
-            if not new_contact:
-                continue
-            contact_id = new_contact['id']
-            
-            # 读取其他联系方式（G列，索引6）
-            if len(row) > 6 and row[6] and row[6] != '无':
-                # 解析其他联系方式，格式为 "type: value; type: value"
-                other_methods_str = str(row[6])
-                if other_methods_str.strip():
-                    # 按分号分割多个联系方式
-                    method_pairs = other_methods_str.split(';')
-                    for method_pair in method_pairs:
-                        method_pair = method_pair.strip()
-                        if ':' in method_pair:
-                            parts = method_pair.split(':', 1)
-                            method_type = parts[0].strip()
-                            method_value = parts[1].strip() if len(parts) > 1 else ''
-                            
-                            if method_type and method_value:
-                                method_data = {
-                                    'method_type': method_type,
-                                    'method_value': method_value,
-                                    'is_primary': 0  # 其他联系方式不是主要联系方式
-                                }
-                                # 创建联系方式
-                                create_contact_method(contact_id, method_data)
+        contact = (
+            name,
+            phone,
+            _cell_text(row, 3),
+            _cell_text(row, 4),
+            1 if len(row) > 5 and row[5] == '是' else 0
+        )
+        methods = parse_other_methods(row[6] if len(row) > 6 else None)
+        batch.append((contact, methods))
         
-        return True
+        if len(batch) >= batch_size:
+            yield batch, row_number
+            batch = []
+    
+    if batch:
+        yield batch, row_number
+
+def count_workbook_rows(file_stream):
+    """读取工作表声明的数据行数（不含表头），无法确定时返回None"""
+    from openpyxl import load_workbook
+    
+    try:
+        workbook = load_workbook(file_stream, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+    except Exception:
+        return None
+    return max_row - 1 if max_row else None
+
+def import_workbook(file_stream, batch_size=IMPORT_BATCH_SIZE, start_row=2,
+                    report=None, on_batch=None, upsert=False):
+    """从Excel文件批量导入联系人，出错时抛出异常
+    
+    以只读模式流式读取工作表，每batch_size行用executemany写入一次。
+    未提供on_batch时全部行在同一个事务中提交；提供时每批单独提交，
+    并在同一事务内调用 on_batch(cursor, 批次最后一行的行号, report)
+    记录断点，可据此从 start_row 继续导入。
+    
+    Args:
+        file_stream: Excel文件路径或文件对象（.xlsx）
+        batch_size (int): 每批写入的联系人数量
+        start_row (int): 从该行开始读取（第1行为表头）
+        report (dict): 断点续传时已累计的导入报告
+        on_batch (callable): 每批提交前的回调
+        upsert (bool): 为True时与已有联系人重复的行合并到已有联系人
+            （见 merge_import_batch），报告中的 updated 为有字段或联系方式
+            被补齐的联系人数，unchanged 为重复但无需修改的联系人数
+    
+    Returns:
+        dict: 导入报告，见 import_contacts_from_excel
+    
+    Raises:
+        Exception: 文件无法解析或数据库写入失败
+    """
+    if report is None:
+        report = new_import_report()
+    
+    # 只读模式按需解析行，不把整个工作表载入内存
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_stream, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=start_row, values_only=True)
+        batches = iter_import_batches(rows, batch_size, start_row,
+                                      import_error_recorder(report))
+        write_import_batches(batches, report, on_batch=on_batch, upsert=upsert)
+    finally:
+        workbook.close()
+    
+    return report
+
+def write_import_batches(batches, report, on_batch=None, upsert=False):
+    """把解析好的批次写入数据库，计数累加到report
+    
+    未提供on_batch时全部批次在同一个事务中提交；提供时每批单独提交，
+    并在同一事务内调用 on_batch(cursor, 批次最后一行的行号, report)。
+    
+    Args:
+        batches: 依次产出 (insert_contact_batch格式的批次, 批次最后一行的行号)
+        report (dict): 导入报告
+        on_batch (callable): 每批提交前的回调
+        upsert (bool): 为True时重复的行合并到已有联系人
+    
+    Raises:
+        sqlite3.Error: 数据库写入失败
+    """
+    def write_batch(cursor, batch):
+        if upsert:
+            batch, updated_ids, unchanged_ids, merged_methods = merge_import_batch(cursor, batch)
+            report['updated'] = report.get('updated', 0) + len(updated_ids)
+            report['unchanged'] = report.get('unchanged', 0) + len(unchanged_ids)
+            report['methods'] += merged_methods
+        contacts_count, methods_count = insert_contact_batch(cursor, batch)
+        report['imported'] += contacts_count
+        report['methods'] += methods_count
+    
+    if on_batch is None:
+        with write_connection() as conn:
+            cursor = conn.cursor()
+            for batch, _ in batches:
+                write_batch(cursor, batch)
+    else:
+        for batch, last_row in batches:
+            with write_connection() as conn:
+                cursor = conn.cursor()
+                write_batch(cursor, batch)
+                on_batch(cursor, last_row, report)
+
+def import_contacts_from_excel(file_stream, batch_size=IMPORT_BATCH_SIZE, upsert=False):
+    """从Excel文件批量导入联系人数据
+    
+    全部行在同一个事务中提交，任何数据库错误都会整体回滚。
+    
+    Args:
+        file_stream: Excel文件对象（.xlsx）
+        batch_size (int): 每批写入的联系人数量
+        upsert (bool): 为True时重复的行合并到已有联系人而不是新增
+    
+    Returns:
+        dict: 导入报告，包含 imported（新增联系人数）、updated（合并
+        更新的已有联系人数）、unchanged（与已有联系人重复但没有新内容的
+        联系人数）、methods（导入联系方式数）、skipped（跳过
+        行数）和 errors（逐行错误列表，每项含 row 与 error）；文件无法
+        读取或写入失败时返回None
+    """
+    try:
+        return import_workbook(file_stream, batch_size=batch_size, upsert=upsert)
     except Exception as e:
         print(f"导入失败: {e}")
         import traceback
         traceback.print_exc()
-        return False
+        return None
 
 def delete_contact(contact_id):
     """删除联系人"""
-    conn = create_connection()
     success = False  # 标记是否删除成功
     
-    if conn is not None:
-        try:
+    try:
+        with write_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
-            conn.commit()  # 提交事务
             
             # 检查是否有记录被删除（rowcount > 0表示删除成功）
             success = cursor.rowcount > 0
-        except Error as e:
-            print(f"删除联系人错误: {e}")
-            conn.rollback()  # 出错时回滚
-        finally:
-            conn.close()  # 确保连接关闭
+    except Error as e:
+        print(f"删除联系人错误: {e}")
+    
+    return success
+
+# 单次批量请求允许的最大操作数
+BATCH_MAX_OPERATIONS = 500
+
+class BatchError(Exception):
+    """批量操作中的某一项失败，整批已回滚"""
+    
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+def _apply_operation(operation):
+    """执行批量请求中的一项操作
+    
+    Returns:
+        操作结果（联系人或联系方式字典，删除操作为True），失败时为None或False
+    
+    Raises:
+        ValueError: 操作格式不正确
+    """
+    if not isinstance(operation, dict):
+        raise ValueError('操作必须为对象')
+    op = operation.get('op')
+    target_id = operation.get('id')
+    data = operation.get('data') or {}
+    
+    if op == 'create':
+        _validate_contact_data(data)
+        return create_contact(data)
+    if op == 'update':
+        _validate_contact_data(data)
+        return update_contact(target_id, data)
+    if op == 'patch':
+        return patch_contact(target_id, data)
+    if op == 'delete':
+        return delete_contact(target_id)
+    if op == 'favorite':
+        return toggle_favorite(target_id)
+    if op == 'create_method':
+        _validate_method_data(data)
+        contact_id = operation.get('contact_id')
+        if get_contact_by_id(contact_id) is None:
+            return None
+        return create_contact_method(contact_id, data)
+    if op == 'update_method':
+        _validate_method_data(data)
+        return update_contact_method(target_id, data)
+    if op == 'delete_method':
+        return delete_contact_method(target_id)
+    raise ValueError(f'不支持的操作: {op}')
+
+def apply_batch(operations):
+    """在同一个事务中依次执行多项操作，任何一项失败则整批回滚
     
-    return success
\ No newline at end of file
+    Args:
+        operations (list): 操作列表，每项为 {"op": 操作, ...}：
+            create/update/patch 带 data，update/patch/delete/favorite 带 id
+            （联系人ID），create_method 带 contact_id 和 data，
+            update_method 带 id 和 data，delete_method 带 id（联系方式ID）
+    
+    Returns:
+        list: 与操作一一对应的结果（联系人或联系方式字典，删除操作为True）
+    
+    Raises:
+        BatchError: 某一项操作格式错误、目标不存在或执行失败
+        sqlite3.Error: 无法开启写事务
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError(None, 'operations必须为非空数组')
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise BatchError(None, f'单次最多执行{BATCH_MAX_OPERATIONS}项操作')
+    
+    results = []
+    with write_connection():
+        for index, operation in enumerate(operations):
+            try:
+                result = _apply_operation(operation)
+            except ValueError as e:
+                raise BatchError(index, str(e))
+            # 出错的操作已回滚到自己的保存点，这里终止整批，退出时回滚整个事务
+            if result is None or result is False:
+                raise BatchError(index, '目标不存在或执行失败')
+            results.append(result)
+    return results
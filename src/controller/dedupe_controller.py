@@ -0,0 +1,506 @@
+# 去重控制器 - 号码与邮箱规范化、按匹配键分块查重、合并重复联系人
+from config.database import (
+    PHONE_KEY_MIN_LENGTH,
+    PHONE_SEPARATORS,
+    get_connection,
+    write_connection,
+    phone_key_sql,
+    email_key_sql,
+    method_key_sql
+)
+from itertools import groupby
+from operator import itemgetter
+import string
+
+# 同一匹配键下的联系人超过该数量时不作为查重依据（如公司总机、共用邮箱）
+MAX_BLOCK_SIZE = 50
+
+# 每个写事务合并的重复组数量
+MERGE_BATCH_SIZE = 200
+
+# 查重报告中列出的重复组数量
+DEDUPE_SAMPLE_SIZE = 100
+
+# IN 查询每次绑定的最大参数个数
+LOOKUP_CHUNK_SIZE = 500
+
+# 合并时把重复联系人的主要号码、邮箱保留为联系方式所用的类型
+PHONE_METHOD_TYPE = '手机'
+EMAIL_METHOD_TYPE = '邮箱'
+
+# SQLite的lower()只转换ASCII字母，Python端保持一致
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def phone_key(value):
+    """号码匹配键（与 phone_key_sql 规则一致），不是号码时返回None"""
+    if value is None:
+        return None
+    digits = str(value)
+    for separator in PHONE_SEPARATORS:
+        digits = digits.replace(separator, '')
+    if len(digits) < PHONE_KEY_MIN_LENGTH or not (digits.isascii() and digits.isdigit()):
+        return None
+    if len(digits) == 13 and digits.startswith('86'):
+        digits = digits[2:]
+    elif len(digits) == 15 and digits.startswith('0086'):
+        digits = digits[4:]
+    return 'p:' + digits
+
+def email_key(value):
+    """邮箱匹配键（与 email_key_sql 规则一致），不是邮箱时返回None"""
+    if value is None:
+        return None
+    # SQLite的trim()只去掉空格
+    text = str(value).strip(' ')
+    if text.find('@') > 0:
+        return 'e:' + text.translate(_ASCII_LOWER)
+    return None
+
+def method_key(value):
+    """联系方式匹配键（与 method_key_sql 规则一致）"""
+    return email_key(value) or phone_key(value)
+
+def name_key(name):
+    """姓名比较键：去掉所有空白并忽略大小写"""
+    return ''.join(str(name or '').split()).casefold()
+
+def _value_identity(method_type, value):
+    """判断两条号码/邮箱/联系方式是否相同的标识
+    
+    号码和邮箱按匹配键比较，其他联系方式（如微信号）按类型和忽略
+    大小写的值比较。
+    """
+    return method_key(value) or (method_type, str(value).strip().casefold())
+
+def _chunks(values, size=LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _key_scan_sqls():
+    """按匹配键顺序扫描的查询，均由表达式索引提供顺序，无需排序"""
+    phone = phone_key_sql('phone')
+    email = email_key_sql('email')
+    method = method_key_sql('method_value')
+    return [
+        f"SELECT {phone} AS match_key, id FROM contacts "
+        "WHERE match_key IS NOT NULL ORDER BY match_key",
+        f"SELECT {email} AS match_key, id FROM contacts "
+        "WHERE match_key IS NOT NULL ORDER BY match_key",
+        f"SELECT {method} AS match_key, contact_id FROM contact_methods "
+        "WHERE match_key IS NOT NULL ORDER BY match_key",
+    ]
+
+def _load_name_keys(cursor, contact_ids):
+    """读取联系人的姓名比较键（联系方式指向已删除联系人的ID不在结果中）"""
+    names = {}
+    for chunk in _chunks(contact_ids):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT id, name FROM contacts WHERE id IN ({placeholders})", chunk
+        )
+        for contact_id, name in cursor:
+            names[contact_id] = name_key(name)
+    return names
+
+def _find(parent, node):
+    """并查集查找（带路径压缩）"""
+    root = node
+    while parent[root] != root:
+        root = parent[root]
+    while parent[node] != root:
+        parent[node], node = root, parent[node]
+    return root
+
+def _union(parent, a, b):
+    """合并两个集合，以较小的ID为根（即合并后保留的联系人）"""
+    parent.setdefault(a, a)
+    parent.setdefault(b, b)
+    root_a, root_b = _find(parent, a), _find(parent, b)
+    if root_a != root_b:
+        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+def find_duplicate_clusters(match_name=True, max_block_size=MAX_BLOCK_SIZE):
+    """查找重复联系人组
+    
+    分别按主要号码、邮箱和联系方式的匹配键顺序扫描表达式索引，共享
+    同一匹配键的联系人构成一个候选块，只在块内比较，不做两两比较；
+    块内姓名相同的联系人用并查集合并为重复组（不同匹配键把同一人的
+    多条记录串联起来）。扫描按索引顺序进行，耗时与行数成线性关系。
+    
+    Args:
+        match_name (bool): 是否要求姓名相同（False时共享匹配键即视为重复）
+        max_block_size (int): 超过该人数的匹配键视为共用号码，不参与查重
+    
+    Returns:
+        dict: clusters（按首个ID排序的重复组，每组为升序ID列表，第一个
+        为合并后保留的联系人）、blocks（候选块数）、oversized_keys
+        （被忽略的共用匹配键数）
+    
+    Raises:
+        sqlite3.Error: 查询失败
+    """
+    blocks = []
+    oversized_keys = 0
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for sql in _key_scan_sqls():
+            for _, rows in groupby(cursor.execute(sql), itemgetter(0)):
+                ids = {row[1] for row in rows}
+                if len(ids) < 2:
+                    continue
+                if len(ids) > max_block_size:
+                    oversized_keys += 1
+                    continue
+                blocks.append(ids)
+        candidate_ids = set().union(*blocks) if blocks else set()
+        names = _load_name_keys(cursor, candidate_ids)
+    
+    parent = {}
+    for ids in blocks:
+        groups = {}
+        for contact_id in ids:
+            if contact_id in names:
+                key = names[contact_id] if match_name else None
+                groups.setdefault(key, []).append(contact_id)
+        for group in groups.values():
+            for other in group[1:]:
+                _union(parent, group[0], other)
+    
+    clusters = {}
+    for contact_id in parent:
+        clusters.setdefault(_find(parent, contact_id), []).append(contact_id)
+    return {
+        'clusters': sorted(sorted(ids) for ids in clusters.values()),
+        'blocks': len(blocks),
+        'oversized_keys': oversized_keys,
+    }
+
+def _absorb(target, identities, contact, methods):
+    """把另一条记录并入target：补齐空缺字段，收集target还没有的号码、邮箱和联系方式
+    
+    Args:
+        target (list): [name, phone, email, address, is_favorite]，原地修改
+        identities (set): target已有的号码、邮箱和联系方式标识，原地更新
+        contact: 被并入记录的 (name, phone, email, address, is_favorite)
+        methods: 被并入记录的 [(method_type, method_value), ...]
+    
+    Returns:
+        list: 需要为target新增的 (method_type, method_value)
+    """
+    _, phone, email, address, is_favorite = contact
+    if not target[2] and email:
+        target[2] = email
+        identities.add(_value_identity(EMAIL_METHOD_TYPE, email))
+    if not target[3] and address:
+        target[3] = address
+    target[4] = max(target[4] or 0, is_favorite or 0)
+    
+    candidates = [(PHONE_METHOD_TYPE, phone)]
+    if email:
+        candidates.append((EMAIL_METHOD_TYPE, email))
+    candidates.extend(methods)
+    
+    added = []
+    for method_type, value in candidates:
+        if not value:
+            continue
+        identity = _value_identity(method_type, value)
+        if identity not in identities:
+            identities.add(identity)
+            added.append((method_type, value))
+    return added
+
+def _identities(contact, methods):
+    """联系人已有的号码、邮箱和联系方式标识"""
+    _, phone, email, _, _ = contact
+    identities = {_value_identity(PHONE_METHOD_TYPE, phone)}
+    if email:
+        identities.add(_value_identity(EMAIL_METHOD_TYPE, email))
+    identities.update(_value_identity(method_type, value) for method_type, value in methods)
+    return identities
+
+def _matching_groups(rows, methods):
+    """按当前数据重新分组：姓名相同且共享号码、邮箱或联系方式的匹配键
+    
+    Args:
+        rows (list): 组内联系人的 (id, name, phone, email, ...) 行
+        methods (list): 组内联系方式的 (id, contact_id, 类型, 值) 行
+    
+    Returns:
+        list: 至少两个联系人的组，每组为升序ID列表
+    """
+    keys = {row[0]: {phone_key(row[2]), email_key(row[3])} for row in rows}
+    for _, contact_id, _, value in methods:
+        keys[contact_id].add(method_key(value))
+    
+    parent = {}
+    owners = {}  # (姓名比较键, 匹配键) -> 最先出现的联系人ID
+    for contact_id, name, *_ in rows:
+        for key in keys[contact_id] - {None}:
+            owner = owners.setdefault((name_key(name), key), contact_id)
+            if owner != contact_id:
+                _union(parent, owner, contact_id)
+    
+    groups = {}
+    for contact_id in parent:
+        groups.setdefault(_find(parent, contact_id), []).append(contact_id)
+    return sorted(sorted(ids) for ids in groups.values())
+
+def _merge_cluster(cursor, contact_ids):
+    """把一组重复联系人合并到ID最小的联系人（需在写事务中调用）
+    
+    查重扫描之后联系人可能被改名或修改，先在写事务中按当前数据重新
+    确认仍然匹配，不再匹配的联系人不参与合并（组可能拆成几组分别
+    合并）。保留联系人的非空字段不变，空缺的邮箱、地址取自其他记录；
+    其他记录的联系方式改挂到保留联系人下（已有的相同号码/邮箱删除），
+    其主要号码和邮箱不同时保留为联系方式，最后删除其他记录。
+    
+    Returns:
+        list: 每个实际合并的组删除的联系人ID列表；没有仍然匹配的
+        联系人时为空
+    """
+    placeholders = ", ".join("?" * len(contact_ids))
+    rows = cursor.execute(
+        f"""SELECT id, name, phone, email, address, is_favorite FROM contacts
+            WHERE id IN ({placeholders}) ORDER BY id""",
+        list(contact_ids)
+    ).fetchall()
+    methods = cursor.execute(
+        f"""SELECT id, contact_id, method_type, method_value FROM contact_methods
+            WHERE contact_id IN ({placeholders}) ORDER BY id""",
+        list(contact_ids)
+    ).fetchall()
+    
+    removed_groups = []
+    for group in _matching_groups(rows, methods):
+        members = set(group)
+        removed_groups.append(_merge_group(
+            cursor,
+            [row for row in rows if row[0] in members],
+            [method for method in methods if method[1] in members]
+        ))
+    return removed_groups
+
+def _merge_group(cursor, rows, methods):
+    """把已确认重复的联系人合并到第一行，返回删除的联系人ID列表"""
+    survivor = rows[0][0]
+    removed = [row[0] for row in rows[1:]]
+    target = list(rows[0][1:])
+    original = list(target)
+    identities = _identities(target, [
+        (method_type, value) for _, contact_id, method_type, value in methods
+        if contact_id == survivor
+    ])
+    added = []
+    for row in rows[1:]:
+        added.extend(_absorb(target, identities, row[1:], []))
+    
+    moves = []
+    deletes = []
+    for method_id, contact_id, method_type, value in methods:
+        if contact_id == survivor:
+            continue
+        identity = _value_identity(method_type, value)
+        if identity in identities:
+            deletes.append((method_id,))
+        else:
+            identities.add(identity)
+            moves.append((survivor, method_id))
+    
+    if target != original:
+        cursor.execute(
+            "UPDATE contacts SET email = ?, address = ?, is_favorite = ? WHERE id = ?",
+            (target[2], target[3], target[4], survivor)
+        )
+    # 移过来的联系方式不再是主要联系方式，保留联系人原有的主要联系方式
+    cursor.executemany(
+        "UPDATE contact_methods SET contact_id = ?, is_primary = 0 WHERE id = ?", moves
+    )
+    cursor.executemany("DELETE FROM contact_methods WHERE id = ?", deletes)
+    cursor.executemany(
+        """INSERT INTO contact_methods (contact_id, method_type, method_value, is_primary)
+           VALUES (?, ?, ?, 0)""",
+        [(survivor, method_type, value) for method_type, value in added]
+    )
+    removed_placeholders = ", ".join("?" * len(removed))
+    cursor.execute(f"DELETE FROM contacts WHERE id IN ({removed_placeholders})", removed)
+    return removed
+
+def merge_duplicates(clusters, on_progress=None):
+    """合并查找到的重复组，每MERGE_BATCH_SIZE组提交一次
+    
+    Args:
+        clusters (list): find_duplicate_clusters 返回的重复组
+        on_progress (callable): 每批提交后调用 on_progress(已处理组数, 总组数)
+    
+    Returns:
+        dict: merged（合并的组数）和 removed（删除的重复联系人数）
+    
+    Raises:
+        sqlite3.Error: 写入失败（当前批次回滚，之前的批次已提交）
+    """
+    report = {'merged': 0, 'removed': 0}
+    for start in range(0, len(clusters), MERGE_BATCH_SIZE):
+        chunk = clusters[start:start + MERGE_BATCH_SIZE]
+        with write_connection() as conn:
+            cursor = conn.cursor()
+            for contact_ids in chunk:
+                for removed in _merge_cluster(cursor, contact_ids):
+                    report['merged'] += 1
+                    report['removed'] += len(removed)
+        if on_progress:
+            on_progress(start + len(chunk), len(clusters))
+    return report
+
+def dedupe_contacts(merge=False, on_progress=None):
+    """查找重复联系人，merge为True时一并合并
+    
+    Returns:
+        dict: clusters（重复组数）、duplicates（可删除的重复记录数）、
+        blocks、oversized_keys、sample（前DEDUPE_SAMPLE_SIZE个重复组），
+        以及合并时的 merged 和 removed
+    
+    Raises:
+        sqlite3.Error: 查询或写入失败
+    """
+    found = find_duplicate_clusters()
+    clusters = found['clusters']
+    report = {
+        'clusters': len(clusters),
+        'duplicates': sum(len(ids) - 1 for ids in clusters),
+        'blocks': found['blocks'],
+        'oversized_keys': found['oversized_keys'],
+        'sample': clusters[:DEDUPE_SAMPLE_SIZE],
+        'merged': 0,
+        'removed': 0,
+    }
+    if merge:
+        report.update(merge_duplicates(clusters, on_progress=on_progress))
+    return report
+
+def _lookup_candidates(cursor, keys):
+    """按匹配键查找已有联系人，返回 {匹配键: {联系人ID, ...}}"""
+    candidates = {}
+    phone_keys = [key for key in keys if key.startswith('p:')]
+    email_keys = [key for key in keys if key.startswith('e:')]
+    lookups = [
+        (phone_key_sql('phone'), 'id', 'contacts', phone_keys),
+        (email_key_sql('email'), 'id', 'contacts', email_keys),
+        (method_key_sql('method_value'), 'contact_id', 'contact_methods', keys),
+    ]
+    for expr, id_column, table, values in lookups:
+        for chunk in _chunks(values):
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT {expr}, {id_column} FROM {table} WHERE {expr} IN ({placeholders})",
+                chunk
+            )
+            for key, contact_id in cursor:
+                candidates.setdefault(key, set()).add(contact_id)
+    return candidates
+
+def _row_keys(contact, methods):
+    """导入行的匹配键"""
+    _, phone, email, _, _ = contact
+    keys = [phone_key(phone), email_key(email)]
+    keys.extend(method_key(value) for _, value in methods)
+    return [key for key in keys if key]
+
+def merge_import_batch(cursor, batch):
+    """合并导入：把与已有联系人（或本批之前的行）重复的行并入对方
+    
+    重复的判定与查重相同：共享号码、邮箱或联系方式的匹配键且姓名
+    相同。并入已有联系人时只补齐空缺字段并追加没有的号码和联系方式，
+    不覆盖已有数据。需在写事务中调用。
+    
+    Args:
+        cursor: 处于写事务中的游标
+        batch (list): insert_contact_batch 格式的导入行
+    
+    Returns:
+        tuple: (需要新增的行, 被更新的已有联系人ID列表, 重复但没有任何
+        修改的已有联系人ID列表, 追加的联系方式数)
+    """
+    row_keys = [_row_keys(contact, methods) for contact, methods in batch]
+    candidates = _lookup_candidates(cursor, {key for keys in row_keys for key in keys})
+    names = _load_name_keys(cursor, set().union(*candidates.values()) if candidates else ())
+    
+    new_rows = []
+    new_identities = []
+    pending = {}  # 匹配键 -> [(姓名比较键, new_rows下标)]
+    merges = {}  # 已有联系人ID -> [(contact, methods)]
+    for (contact, methods), keys in zip(batch, row_keys):
+        row_name = name_key(contact[0])
+        existing = sorted(
+            contact_id for key in keys for contact_id in candidates.get(key, ())
+            if names.get(contact_id) == row_name
+        )
+        if existing:
+            merges.setdefault(existing[0], []).append((contact, methods))
+            continue
+        
+        earlier = [index for key in keys for name, index in pending.get(key, ())
+                   if name == row_name]
+        if earlier:
+            index = min(earlier)
+            target, target_methods = new_rows[index]
+            target_methods.extend(_absorb(target, new_identities[index], contact, methods))
+            continue
+        
+        index = len(new_rows)
+        new_rows.append((list(contact), list(methods)))
+        new_identities.append(_identities(contact, methods))
+        for key in keys:
+            pending.setdefault(key, []).append((row_name, index))
+    
+    if not merges:
+        return new_rows, [], [], 0
+    
+    existing_rows = {}
+    existing_methods = {}
+    for chunk in _chunks(merges):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            f"""SELECT id, name, phone, email, address, is_favorite FROM contacts
+                WHERE id IN ({placeholders})""",
+            chunk
+        )
+        for row in cursor.fetchall():
+            existing_rows[row[0]] = list(row[1:])
+        cursor.execute(
+            f"""SELECT contact_id, method_type, method_value FROM contact_methods
+                WHERE contact_id IN ({placeholders})""",
+            chunk
+        )
+        for contact_id, method_type, value in cursor.fetchall():
+            existing_methods.setdefault(contact_id, []).append((method_type, value))
+    
+    updates = []
+    inserts = []
+    updated_ids = []
+    unchanged_ids = []
+    for contact_id, rows in merges.items():
+        target = existing_rows[contact_id]
+        original = list(target)
+        identities = _identities(target, existing_methods.get(contact_id, []))
+        inserted = len(inserts)
+        for contact, methods in rows:
+            for method_type, value in _absorb(target, identities, contact, methods):
+                inserts.append((contact_id, method_type, value))
+        if target != original:
+            updates.append((target[2], target[3], target[4], contact_id))
+        if target != original or len(inserts) > inserted:
+            updated_ids.append(contact_id)
+        else:
+            unchanged_ids.append(contact_id)
+    
+    cursor.executemany(
+        "UPDATE contacts SET email = ?, address = ?, is_favorite = ? WHERE id = ?", updates
+    )
+    cursor.executemany(
+        """INSERT INTO contact_methods (contact_id, method_type, method_value, is_primary)
+           VALUES (?, ?, ?, 0)""",
+        inserts
+    )
+    return new_rows, updated_ids, unchanged_ids, len(inserts)
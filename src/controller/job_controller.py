@@ -0,0 +1,412 @@
+# 后台任务控制器 - 在线程池中执行耗时的导入导出任务
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from sqlite3 import Error
+
+from config.database import get_connection, write_connection
+from controller.bulk_controller import (
+    FORMAT_EXTENSIONS,
+    count_file_rows,
+    first_data_row,
+    import_file,
+    write_export
+)
+from controller.contact_controller import (
+    count_workbook_rows,
+    import_workbook,
+    write_contacts_workbook
+)
+from controller.dedupe_controller import dedupe_contacts
+
+# 任务文件（上传的导入文件、导出结果）保存目录
+JOB_DIR = "jobs"
+
+# 同时执行的任务数
+JOB_WORKERS = 2
+
+# 任务超过该秒数没有更新（进度或心跳）即视为所在进程已崩溃，可被重新接管
+JOB_STALE_SECONDS = 300
+
+# 进程内排队中和执行中的任务刷新updated_at（心跳）的间隔秒数，须远小于 JOB_STALE_SECONDS
+JOB_HEARTBEAT_INTERVAL = 30
+
+# 未结束的任务状态
+ACTIVE_STATUSES = ('queued', 'running')
+
+# 接口返回任务信息时读取的列
+JOB_COLUMNS = (
+    "id, kind, status, processed, total, checkpoint, result_path, result, "
+    "error, created_at, started_at, updated_at, finished_at"
+)
+
+class JobOwnershipLost(Exception):
+    """任务已被其他进程接管，当前执行者应停止"""
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# 本进程已提交、尚未结束的任务：(任务ID, attempt) -> 提交时的上下文（心跳线程使用）
+_local_jobs = {}
+_local_jobs_lock = threading.Lock()
+
+def _get_executor():
+    """返回任务线程池（首次调用时创建，同时启动心跳线程）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=JOB_WORKERS, thread_name_prefix='job'
+                )
+                threading.Thread(target=_heartbeat_loop, name='job-heartbeat',
+                                 daemon=True).start()
+    return _executor
+
+def _submit(job_id, attempt):
+    """把任务提交到线程池，任务继承当前上下文（租户分片的连接池绑定）"""
+    executor = _get_executor()
+    with _local_jobs_lock:
+        # 上下文不能同时在两个线程中进入，心跳线程使用单独的一份
+        _local_jobs[(job_id, attempt)] = copy_context()
+    executor.submit(copy_context().run, _run_job, job_id, attempt)
+
+def _touch_job(job_id, attempt):
+    """刷新任务的updated_at，表明所在进程仍然存活"""
+    with write_connection() as conn:
+        conn.execute(
+            """UPDATE jobs SET updated_at = ?
+               WHERE id = ? AND attempt = ? AND status IN ('queued', 'running')""",
+            (time.time(), job_id, attempt)
+        )
+
+def _heartbeat_loop():
+    """定期为本进程的任务发送心跳
+    
+    进度长时间不更新的任务（如排在繁忙线程池后面的任务、逐组汇报
+    进度的合并查重）因此不会被误认为所在进程已崩溃而被重新接管。
+    """
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _local_jobs_lock:
+            jobs = list(_local_jobs.items())
+        for (job_id, attempt), context in jobs:
+            try:
+                context.run(_touch_job, job_id, attempt)
+            except Error as e:
+                print(f"任务 {job_id} 心跳错误: {e}")
+
+def _update_job(job_id, attempt, cursor=None, **fields):
+    """更新任务字段并刷新updated_at
+    
+    传入cursor时在调用方的事务内更新（用于与导入批次一起提交断点），
+    否则单独取一个连接提交。attempt不匹配说明任务已被接管。
+    
+    Raises:
+        JobOwnershipLost: 任务已被其他执行者接管
+    """
+    fields['updated_at'] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    sql = f"UPDATE jobs SET {assignments} WHERE id = ? AND attempt = ?"
+    params = list(fields.values()) + [job_id, attempt]
+    
+    if cursor is not None:
+        cursor.execute(sql, params)
+        rowcount = cursor.rowcount
+    else:
+        # 另取一个连接，避免并入当前线程正在进行的读查询（如流式导出）
+        with write_connection(separate=True) as conn:
+            rowcount = conn.execute(sql, params).rowcount
+    
+    if rowcount == 0:
+        raise JobOwnershipLost(job_id)
+
+def _job_to_dict(row):
+    """把jobs表的一行转换为接口返回的字典"""
+    (job_id, kind, status, processed, total, checkpoint, result_path,
+     result, error, created_at, started_at, updated_at, finished_at) = row
+    
+    elapsed = None
+    throughput = None
+    if started_at is not None:
+        elapsed = (finished_at or updated_at) - started_at
+        if elapsed > 0:
+            throughput = round(processed / elapsed, 1)
+    
+    progress = None
+    if total:
+        progress = round(min(processed / total, 1.0), 4)
+    
+    return {
+        'id': job_id,
+        'kind': kind,
+        'status': status,
+        'processed': processed,
+        'total': total,
+        'progress': progress,
+        'rows_per_second': throughput,
+        'checkpoint': checkpoint,
+        'has_result_file': bool(result_path) and status == 'succeeded',
+        'result': json.loads(result) if result else None,
+        'error': error,
+        'created_at': created_at,
+        'started_at': started_at,
+        'finished_at': finished_at,
+    }
+
+def _create_job(kind, input_path=None, params=None):
+    """写入一条排队中的任务并提交到线程池"""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with write_connection() as conn:
+        conn.execute(
+            """INSERT INTO jobs (id, kind, status, input_path, params, attempt,
+                                 created_at, updated_at)
+               VALUES (?, ?, 'queued', ?, ?, 0, ?, ?)""",
+            (job_id, kind, input_path, json.dumps(params) if params else None, now, now)
+        )
+    _submit(job_id, 0)
+    return job_id
+
+def submit_import_job(file_storage, upsert=False, file_format='xlsx'):
+    """保存上传文件并创建后台导入任务
+    
+    Args:
+        file_storage: 上传的文件（werkzeug FileStorage）
+        upsert (bool): 为True时重复的行合并到已有联系人
+        file_format (str): 'xlsx'、'csv' 或 'ndjson'（后两种可以gzip压缩）
+    
+    Returns:
+        str: 任务ID；数据库错误时返回None
+    """
+    os.makedirs(JOB_DIR, exist_ok=True)
+    input_path = os.path.join(
+        JOB_DIR, f"import_{uuid.uuid4().hex}{FORMAT_EXTENSIONS[file_format]}"
+    )
+    file_storage.save(input_path)
+    params = {}
+    if upsert:
+        params['upsert'] = True
+    if file_format != 'xlsx':
+        params['format'] = file_format
+    try:
+        return _create_job('import', input_path=input_path, params=params or None)
+    except Error as e:
+        print(f"创建导入任务错误: {e}")
+        os.remove(input_path)
+        return None
+
+def submit_export_job(file_format='xlsx', compressed=False):
+    """创建后台导出任务
+    
+    Args:
+        file_format (str): 'xlsx'、'csv' 或 'ndjson'
+        compressed (bool): 为True时结果文件为gzip（仅CSV和NDJSON）
+    
+    Returns:
+        str: 任务ID；数据库错误时返回None
+    """
+    params = None
+    if file_format != 'xlsx':
+        params = {'format': file_format, 'gzip': bool(compressed)}
+    try:
+        return _create_job('export', params=params)
+    except Error as e:
+        print(f"创建导出任务错误: {e}")
+        return None
+
+def submit_dedupe_job(merge=False):
+    """创建后台查重任务
+    
+    Args:
+        merge (bool): 为True时合并找到的重复联系人，否则只生成报告
+    
+    Returns:
+        str: 任务ID；数据库错误时返回None
+    """
+    try:
+        return _create_job('dedupe', params={'merge': bool(merge)})
+    except Error as e:
+        print(f"创建查重任务错误: {e}")
+        return None
+
+def _run_import(job_id, attempt, input_path, checkpoint, report, upsert=False,
+                file_format='xlsx'):
+    """执行导入任务，每批写入与断点记录在同一事务中提交"""
+    # 断点为最后提交的行号，首次执行时从第一条数据开始
+    header_rows = first_data_row(file_format) - 1
+    start_row = (checkpoint or header_rows) + 1
+    
+    def on_batch(cursor, last_row, report):
+        _update_job(job_id, attempt, cursor=cursor,
+                    checkpoint=last_row, processed=last_row - header_rows,
+                    result=json.dumps(report, ensure_ascii=False))
+    
+    if file_format == 'xlsx':
+        _update_job(job_id, attempt, total=count_workbook_rows(input_path))
+        report = import_workbook(input_path, start_row=start_row,
+                                 report=report, on_batch=on_batch, upsert=upsert)
+    else:
+        _update_job(job_id, attempt, total=count_file_rows(input_path, file_format))
+        report = import_file(input_path, file_format, start_row=start_row,
+                             report=report, on_batch=on_batch, upsert=upsert)
+    os.remove(input_path)
+    return report, None
+
+def _run_export(job_id, attempt, file_format='xlsx', compressed=False):
+    """执行导出任务（不可断点续传，接管后从头导出）"""
+    os.makedirs(JOB_DIR, exist_ok=True)
+    result_path = os.path.join(JOB_DIR, f"export_{job_id}{FORMAT_EXTENSIONS[file_format]}")
+    
+    def on_progress(written, total):
+        _update_job(job_id, attempt, processed=written, total=total)
+    
+    if file_format == 'xlsx':
+        written = write_contacts_workbook(result_path, on_progress=on_progress)
+    else:
+        if compressed:
+            result_path += '.gz'
+        written = write_export(result_path, file_format, compressed=compressed,
+                               on_progress=on_progress)
+    return {'exported': written}, result_path
+
+def _run_dedupe(job_id, attempt, merge):
+    """执行查重任务（接管后从头查找；已合并的组不会再被找到）"""
+    def on_progress(merged, total):
+        _update_job(job_id, attempt, processed=merged, total=total)
+    
+    return dedupe_contacts(merge=merge, on_progress=on_progress), None
+
+def _run_job(job_id, attempt):
+    """在线程池中执行任务"""
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                "SELECT kind, input_path, checkpoint, result, params FROM jobs "
+                "WHERE id = ? AND attempt = ?",
+                (job_id, attempt)
+            ).fetchone()
+        if row is None:
+            return
+        kind, input_path, checkpoint, result, params = row
+        params = json.loads(params) if params else {}
+        
+        _update_job(job_id, attempt, status='running')
+        with write_connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET started_at = coalesce(started_at, ?) WHERE id = ?",
+                (time.time(), job_id)
+            )
+        
+        if kind == 'import':
+            # 从上次提交的断点继续
+            previous_report = json.loads(result) if result else None
+            result, result_path = _run_import(
+                job_id, attempt, input_path, checkpoint, previous_report,
+                upsert=params.get('upsert', False),
+                file_format=params.get('format', 'xlsx')
+            )
+        elif kind == 'dedupe':
+            result, result_path = _run_dedupe(job_id, attempt, params.get('merge', False))
+        else:
+            result, result_path = _run_export(
+                job_id, attempt, file_format=params.get('format', 'xlsx'),
+                compressed=params.get('gzip', False)
+            )
+        
+        _update_job(job_id, attempt, status='succeeded',
+                    result=json.dumps(result, ensure_ascii=False),
+                    result_path=result_path, finished_at=time.time())
+    except JobOwnershipLost:
+        print(f"任务 {job_id} 已被其他进程接管")
+    except Exception as e:
+        print(f"任务 {job_id} 执行失败: {e}")
+        try:
+            _update_job(job_id, attempt, status='failed', error=str(e),
+                        finished_at=time.time())
+        except (Error, JobOwnershipLost):
+            pass
+    finally:
+        with _local_jobs_lock:
+            _local_jobs.pop((job_id, attempt), None)
+
+def resume_jobs(stale_seconds=JOB_STALE_SECONDS):
+    """接管长时间没有进度和心跳的未完成任务（所在进程已崩溃）
+    
+    通过递增attempt原子地取得任务所有权，导入任务从最后提交的批次
+    继续执行。
+    
+    Returns:
+        int: 重新提交的任务数
+    """
+    resumed = 0
+    try:
+        with write_connection() as conn:
+            rows = conn.execute(
+                """SELECT id, attempt FROM jobs
+                   WHERE status IN ('queued', 'running') AND updated_at < ?""",
+                (time.time() - stale_seconds,)
+            ).fetchall()
+            
+            claimed = []
+            for job_id, attempt in rows:
+                cursor = conn.execute(
+                    """UPDATE jobs SET attempt = attempt + 1, status = 'queued',
+                                       updated_at = ?
+                       WHERE id = ? AND attempt = ?""",
+                    (time.time(), job_id, attempt)
+                )
+                if cursor.rowcount:
+                    claimed.append((job_id, attempt + 1))
+        
+        for job_id, attempt in claimed:
+            _submit(job_id, attempt)
+            resumed += 1
+    except Error as e:
+        print(f"恢复任务错误: {e}")
+    
+    return resumed
+
+def get_job(job_id):
+    """查询任务状态、进度和吞吐量
+    
+    Returns:
+        dict: 任务信息，不存在时返回None
+    """
+    job = None
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row:
+            job = _job_to_dict(row)
+            updated_at = row[11]
+            # 顺便接管已停滞的任务（所在进程的心跳已停止）
+            if job['status'] in ACTIVE_STATUSES and \
+                    time.time() - updated_at > JOB_STALE_SECONDS:
+                resume_jobs()
+    except Error as e:
+        print(f"查询任务错误: {e}")
+    
+    return job
+
+def get_job_result_path(job_id):
+    """返回已完成任务的结果文件路径，没有结果文件时返回None"""
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                "SELECT result_path FROM jobs WHERE id = ? AND status = 'succeeded'",
+                (job_id,)
+            ).fetchone()
+    except Error as e:
+        print(f"查询任务结果错误: {e}")
+        return None
+    
+    if row and row[0] and os.path.exists(row[0]):
+        return row[0]
+    return None
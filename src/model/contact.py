@@ -2,6 +2,8 @@
 class Contact:
     """联系人模型，用于封装联系人数据"""
     
+    __slots__ = ('id', 'name', 'phone', 'email', 'address', 'is_favorite')
+    
     def __init__(self, name, phone, email=None, address=None, id=None, is_favorite=0):
         """
         初始化联系人对象
@@ -30,11 +32,25 @@ class Contact:
             'address': self.address,
             'is_favorite': self.is_favorite
         }
+    
+    @staticmethod
+    def row_to_dict(row):
+        """把contacts表的一行（SELECT *）直接转换为字典，不创建模型对象"""
+        return {
+            'id': row[0],
+            'name': row[1],
+            'phone': row[2],
+            'email': row[3],
+            'address': row[4],
+            'is_favorite': row[5]
+        }
 
 
 class ContactMethod:
     """联系方式模型，用于封装多种联系方式"""
     
+    __slots__ = ('id', 'contact_id', 'method_type', 'method_value', 'is_primary')
+    
     def __init__(self, contact_id, method_type, method_value, is_primary=0, id=None):
         """
         初始化联系方式对象
@@ -59,4 +75,15 @@ class ContactMethod:
             'method_type': self.method_type,
             'method_value': self.method_value,
             'is_primary': self.is_primary
-        }
\ No newline at end of file
+        }
+    
+    @staticmethod
+    def row_to_dict(row):
+        """把contact_methods表的一行（SELECT *）直接转换为字典，不创建模型对象"""
+        return {
+            'id': row[0],
+            'contact_id': row[1],
+            'method_type': row[2],
+            'method_value': row[3],
+            'is_primary': row[4]
+        }
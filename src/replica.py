@@ -0,0 +1,47 @@
+# 副本同步进程：从主库拉取变更日志，应用到当前目录下的数据库（contacts.db）
+#
+# 用法（在副本的工作目录中执行，与副本的应用进程使用同一个数据库文件）：
+#     python replica.py --primary http://10.0.0.1:5000
+#     python replica.py --primary /srv/primary/contacts.db   # 主库在同一台机器上
+#     python replica.py --primary http://10.0.0.1:5000 --once
+import argparse
+import signal
+import sys
+import threading
+from sqlite3 import Error
+
+from config.replication import (
+    FileLogSource,
+    HttpLogSource,
+    ReplicaTailer,
+    ReplicationError
+)
+
+parser = argparse.ArgumentParser(description='从主库同步联系人数据到本地副本')
+parser.add_argument('--primary', required=True,
+                    help='主库地址（http://...）或主库数据库文件路径')
+parser.add_argument('--once', action='store_true',
+                    help='追上主库后退出（默认持续同步）')
+args = parser.parse_args()
+
+if args.primary.startswith(('http://', 'https://')):
+    source = HttpLogSource(args.primary)
+else:
+    source = FileLogSource(args.primary)
+tailer = ReplicaTailer(source)
+
+if args.once:
+    try:
+        tailer.prepare()
+        print(f"已同步到日志位置 {tailer.catch_up()}")
+    except (Error, OSError, ValueError, KeyError, ReplicationError) as e:
+        print(f"复制错误: {e}")
+        sys.exit(1)
+    sys.exit(0)
+
+# 收到SIGTERM或Ctrl-C时处理完当前批次后退出
+stop_event = threading.Event()
+signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+print(f"开始从 {args.primary} 同步")
+tailer.run(stop_event)
@@ -1,41 +1,39 @@
-import sqlite3
-
-# 连接到数据库
-conn = sqlite3.connect('contacts.db')
-cursor = conn.cursor()
-
-# 检查contacts表是否存在is_favorite字段
-try:
-    cursor.execute("SELECT is_favorite FROM contacts LIMIT 1")
-    print("contacts表已包含is_favorite字段")
-except sqlite3.OperationalError:
-    print("contacts表缺少is_favorite字段，正在添加...")
-    cursor.execute("ALTER TABLE contacts ADD COLUMN is_favorite INTEGER DEFAULT 0")
-    conn.commit()
-    print("is_favorite字段添加成功")
-
-# 检查contact_methods表是否存在
-try:
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='contact_methods'")
-    if cursor.fetchone():
-        print("contact_methods表已存在")
-    else:
-        print("contact_methods表不存在，正在创建...")
-        cursor.execute('''
-            CREATE TABLE contact_methods (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                contact_id INTEGER NOT NULL,
-                method_type TEXT NOT NULL,
-                method_value TEXT NOT NULL,
-                is_primary INTEGER DEFAULT 0,
-                FOREIGN KEY (contact_id) REFERENCES contacts (id) ON DELETE CASCADE
-            )
-        ''')
-        conn.commit()
-        print("contact_methods表创建成功")
-except Exception as e:
-    print(f"检查或创建contact_methods表时出错: {e}")
-
-# 关闭连接
-conn.close()
-print("数据库检查和更新完成")
\ No newline at end of file
+# 数据库结构升级脚本：执行所有尚未应用的迁移，并检查关键查询的执行计划
+import sys
+
+from config.database import (
+    DATABASE_NAME,
+    SCHEMA_VERSION,
+    check_query_plans,
+    create_connection,
+    get_schema_version,
+    migrate,
+)
+from controller.contact_controller import prune_changes
+
+conn = create_connection()
+if conn is None:
+    sys.exit(1)
+
+try:
+    applied = migrate(conn)
+    if applied:
+        print(f"已升级到版本 {SCHEMA_VERSION}（应用迁移 {applied}）")
+    else:
+        print(f"{DATABASE_NAME} 已是最新版本 {get_schema_version(conn)}")
+
+    # 删除已被后续变更覆盖的变更日志
+    pruned = prune_changes()
+    if pruned:
+        print(f"已压缩变更日志 {pruned} 行")
+
+    # 检查关键查询是否命中索引
+    failures = check_query_plans(conn)
+    for sql, plan in failures:
+        print(f"未使用预期索引: {sql}\n  执行计划: {plan}")
+finally:
+    conn.close()
+
+if failures:
+    sys.exit(1)
+print("数据库检查和更新完成")
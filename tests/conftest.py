@@ -0,0 +1,66 @@
+# 测试配置 - 每个测试在单独的临时目录中使用全新的数据库
+#
+# 用法（项目根目录）：
+#     python -m pytest -q
+#
+# 各模块在导入时读取环境变量，因此在导入应用之前设置。
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+os.environ.setdefault('CONTACTS_SHARDING', '1')
+
+import pytest
+from flask.testing import FlaskClient
+
+import app as app_module
+from config import database
+from config.cache import get_cache
+from config.sharding import get_router
+from controller.job_controller import get_job
+
+# 等待后台任务结束的最长秒数
+JOB_TIMEOUT = 30
+
+class BufferedClient(FlaskClient):
+    """读完并关闭每个响应的测试客户端，响应占用的准入许可随即归还"""
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return super().open(*args, **kwargs)
+
+def _reset_state():
+    """关闭连接池并清空按文件名记录的状态，下一次访问时重新建库"""
+    if database._pool is not None:
+        database._pool.close()
+        database._pool = None
+    database._ready_databases.clear()
+    get_router().close_all()
+    get_cache().clear()
+    app_module._startup_done.clear()
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """切换到临时目录（数据库、分片和任务文件都在其中）"""
+    monkeypatch.chdir(tmp_path)
+    _reset_state()
+    yield tmp_path
+    _reset_state()
+
+@pytest.fixture
+def client():
+    """应用的测试客户端"""
+    app_module.app.test_client_class = BufferedClient
+    return app_module.app.test_client()
+
+def wait_for_job(job_id, timeout=JOB_TIMEOUT):
+    """等待后台任务结束，返回任务信息"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job['status'] not in ('queued', 'running') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
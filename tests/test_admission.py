@@ -0,0 +1,83 @@
+# 准入控制测试 - 并发与排队、按线程数收紧、许可随响应关闭归还
+import copy
+import threading
+import time
+
+from config import admission
+from config.admission import ConcurrencyLimiter, RateLimiter, classify
+
+def test_limiter_queues_then_rejects():
+    limiter = ConcurrencyLimiter(concurrency=1, queue=1, timeout=0.2)
+    assert limiter.acquire()
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+    waiter.start()
+    while limiter.stats()['waiting'] == 0:
+        time.sleep(0.005)
+    # 队列已满，直接拒绝
+    assert not limiter.acquire()
+
+    limiter.release()
+    waiter.join()
+    assert results == [True]
+    limiter.release()
+    stats = limiter.stats()
+    assert (stats['active'], stats['queue_full_total'], stats['queued_total']) == (0, 1, 1)
+
+def test_limiter_times_out():
+    limiter = ConcurrencyLimiter(concurrency=1, queue=1, timeout=0.01)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    assert limiter.stats()['timeouts_total'] == 1
+
+def test_rate_limiter_refills():
+    limiter = RateLimiter(rate=100.0, burst=1)
+    assert limiter.take('a') == 0
+    assert limiter.take('a') > 0
+    assert limiter.take('b') == 0
+    time.sleep(0.02)
+    assert limiter.take('a') == 0
+
+def test_classify_routes():
+    def environ(method, path, query=''):
+        return {'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query}
+
+    assert classify(environ('GET', '/api/contacts/export')) == 'bulk'
+    assert classify(environ('POST', '/api/contacts/import')) == 'bulk'
+    assert classify(environ('GET', '/api/contacts')) == 'stream'
+    assert classify(environ('GET', '/api/contacts', 'limit=10')) == 'interactive'
+    assert classify(environ('GET', '/api/contacts/favorites')) == 'stream'
+    assert classify(environ('GET', '/api/contacts/favorites', 'limit=50')) == 'interactive'
+    assert classify(environ('GET', '/metrics')) is None
+
+def test_limits_fit_the_thread_budget(monkeypatch):
+    settings = copy.deepcopy(admission._settings)
+    limiters = {
+        name: ConcurrencyLimiter(s['concurrency'], s['queue'], s['timeout'])
+        for name, s in settings.items()
+    }
+    monkeypatch.setattr(admission, '_settings', settings)
+    monkeypatch.setattr(admission, '_limiters', limiters)
+    settings['bulk'].update(concurrency=1, queue=4)
+    settings['stream'].update(concurrency=4, queue=8)
+    settings['interactive'].update(concurrency=32, queue=64)
+
+    admission.fit_to_threads(16)
+
+    held = sum(limiters[name].concurrency + limiters[name].queue
+               for name in admission.THREAD_BOUND_CLASSES)
+    assert held <= 8
+    assert all(limiters[name].concurrency >= 1 for name in admission.THREAD_BOUND_CLASSES)
+    interactive = limiters['interactive']
+    assert (interactive.concurrency, interactive.queue) == (8, 0)
+    assert held + interactive.concurrency + interactive.queue <= 16
+
+def test_permit_is_released_when_response_is_closed(client):
+    limiter = admission._limiters['bulk']
+    response = client.get('/api/contacts/export?format=csv', buffered=False)
+    assert response.status_code == 200
+    assert limiter.stats()['active'] == 1
+
+    response.close()
+    assert limiter.stats()['active'] == 0
@@ -0,0 +1,110 @@
+# 接口测试 - 分页参数、ETag条件请求、部分更新、批量操作与增量同步
+from controller.contact_controller import prune_changes
+
+def _create(client, name='Ann', phone='13800000000', **fields):
+    response = client.post('/api/contacts', json=dict(fields, name=name, phone=phone))
+    assert response.status_code == 201
+    return response.get_json()
+
+def test_list_rejects_non_positive_limit(client):
+    for limit in ('0', '-1', 'x'):
+        assert client.get(f'/api/contacts?limit={limit}').status_code == 400
+    assert client.get('/api/contacts?limit=1').status_code == 200
+
+def test_list_pages_with_cursor(client):
+    for i in range(3):
+        _create(client, name=f'n{i}', phone=f'1380000000{i}')
+    first = client.get('/api/contacts?limit=2')
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'/api/contacts?limit=2&after_id={cursor}')
+    assert [c['name'] for c in first.get_json() + second.get_json()] == ['n0', 'n1', 'n2']
+    assert 'X-Next-Cursor' not in second.headers
+
+def test_list_etag_changes_after_write(client):
+    _create(client)
+    response = client.get('/api/contacts?limit=10')
+    etag = response.headers['ETag']
+    assert client.get('/api/contacts?limit=10',
+                      headers={'If-None-Match': etag}).status_code == 304
+
+    _create(client, name='Bob', phone='13800000001')
+    response = client.get('/api/contacts?limit=10', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(response.get_json()) == 2
+
+def test_contact_etag_and_missing_contact(client):
+    contact = _create(client)
+    response = client.get(f"/api/contacts/{contact['id']}")
+    etag = response.headers['ETag']
+    assert client.get(f"/api/contacts/{contact['id']}",
+                      headers={'If-None-Match': etag}).status_code == 304
+
+    # 不存在的联系人即使带了匹配“没有变更记录”的ETag也返回404
+    for tag in ('"0"', '*'):
+        response = client.get('/api/contacts/999', headers={'If-None-Match': tag})
+        assert response.status_code == 404
+
+def test_patch_updates_only_given_fields_and_syncs_methods(client):
+    contact = _create(client, email='ann@example.com',
+                      methods=[{'method_type': 'wechat', 'method_value': 'ann'}])
+    response = client.patch(f"/api/contacts/{contact['id']}", json={
+        'address': 'Beijing',
+        'methods': [{'method_type': 'qq', 'method_value': '10001'}],
+    })
+    assert response.status_code == 200
+    patched = response.get_json()
+    assert patched['email'] == 'ann@example.com'
+    assert patched['address'] == 'Beijing'
+    assert [m['method_type'] for m in patched['methods']] == ['qq']
+
+    assert client.patch(f"/api/contacts/{contact['id']}",
+                        json={'name': ''}).status_code == 400
+    assert client.patch('/api/contacts/999', json={'address': 'x'}).status_code == 404
+
+def test_batch_rolls_back_on_failure(client):
+    contact = _create(client)
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'create', 'data': {'name': 'Bob', 'phone': '13800000001'}},
+        {'op': 'patch', 'id': contact['id'], 'data': {'address': 'Beijing'}},
+        {'op': 'delete', 'id': 999},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 2
+
+    contacts = client.get('/api/contacts?limit=10').get_json()
+    assert [(c['name'], c['address']) for c in contacts] == [('Ann', '')]
+
+def test_batch_applies_all_operations(client):
+    contact = _create(client)
+    response = client.post('/api/batch', json={'operations': [
+        {'op': 'create', 'data': {'name': 'Bob', 'phone': '13800000001'}},
+        {'op': 'create_method', 'contact_id': contact['id'],
+         'data': {'method_type': 'email', 'method_value': 'ann@example.com'}},
+        {'op': 'favorite', 'id': contact['id']},
+    ]})
+    assert response.status_code == 200
+    assert len(response.get_json()['results']) == 3
+    favorites = client.get('/api/contacts/favorites').get_json()
+    assert [c['name'] for c in favorites] == ['Ann']
+
+def test_changes_after_pruning_change_log(client):
+    ann = _create(client, name='Ann', phone='1')
+    bob = _create(client, name='Bob', phone='2')
+    since = client.get('/api/contacts/changes?since=0').get_json()['version']
+    for name in ('Ann2', 'Ann3'):
+        client.put(f"/api/contacts/{ann['id']}", json={'name': name, 'phone': '1'})
+    client.delete(f"/api/contacts/{bob['id']}")
+    etag = client.get(f"/api/contacts/{ann['id']}").headers['ETag']
+    before = [client.get(f'/api/contacts/changes?since={v}').get_json()
+              for v in (0, since)]
+
+    assert prune_changes() > 0
+    assert prune_changes() == 0
+    after = [client.get(f'/api/contacts/changes?since={v}').get_json()
+             for v in (0, since)]
+    assert after == before
+    assert after[1]['deleted'] == [bob['id']]
+    assert [c['name'] for c in after[1]['contacts']] == ['Ann3']
+    response = client.get(f"/api/contacts/{ann['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 304
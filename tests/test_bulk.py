@@ -0,0 +1,85 @@
+# CSV/NDJSON测试 - 导出文件（可gzip压缩）原样导入另一个分片、逐行报告无效数据
+import gzip
+import io
+import json
+
+import pytest
+
+from controller.bulk_controller import detect_format
+from controller.contact_controller import create_contact
+
+# 导入的目标分片（每个租户一个全新的数据库）
+COPY_HEADERS = {'X-Tenant-ID': 'copy'}
+
+def _create_contacts():
+    create_contact({'name': 'Ann', 'phone': '13800000000', 'email': 'ann@example.com',
+                    'address': '北京, "朝阳"', 'is_favorite': 1,
+                    'methods': [{'method_type': 'qq', 'method_value': '10001'},
+                                {'method_type': 'wechat', 'method_value': 'ann_x'}]})
+    create_contact({'name': '李雷', 'phone': '13900000000'})
+
+def _contacts(client, headers=None):
+    return client.get('/api/contacts?include=methods', headers=headers).get_json()
+
+def _import(client, data, filename, headers=None):
+    response = client.post('/api/contacts/import', headers=headers, data={
+        'file': (io.BytesIO(data), filename),
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+@pytest.mark.parametrize('file_format', ['csv', 'ndjson'])
+@pytest.mark.parametrize('compressed', [False, True])
+def test_export_round_trip(client, file_format, compressed):
+    _create_contacts()
+    response = client.get(f"/api/contacts/export?format={file_format}&gzip={int(compressed)}")
+    assert response.status_code == 200
+    data = response.get_data()
+    filename = response.headers['Content-Disposition'].split('filename=')[1]
+    assert filename == f"contacts_export.{file_format}" + ('.gz' if compressed else '')
+    if compressed:
+        assert response.mimetype == 'application/gzip'
+        assert gzip.decompress(data)
+
+    report = _import(client, data, filename, headers=COPY_HEADERS)
+    assert (report['imported'], report['errors']) == (2, [])
+
+    def without_method_ids(contacts):
+        for contact in contacts:
+            contact['methods'] = [(m['method_type'], m['method_value'])
+                                  for m in contact['methods']]
+        return contacts
+
+    assert without_method_ids(_contacts(client, COPY_HEADERS)) == \
+        without_method_ids(_contacts(client))
+
+def test_ndjson_export_lines(client):
+    _create_contacts()
+    lines = client.get('/api/contacts/export?format=ndjson').get_data(as_text=True).splitlines()
+    first = json.loads(lines[0])
+    assert first['methods'] == [['qq', '10001'], ['wechat', 'ann_x']]
+    assert [json.loads(line)['name'] for line in lines] == ['Ann', '李雷']
+
+def test_ndjson_import_reports_invalid_lines(client):
+    data = '\n'.join([
+        json.dumps({'name': 'Ann', 'phone': '1',
+                    'methods': [{'method_type': 'qq', 'method_value': '10001'}]}),
+        '{broken',
+        '[1, 2]',
+        '',
+        json.dumps({'name': 'Bob'}),
+    ]).encode('utf-8')
+
+    report = _import(client, gzip.compress(data), 'contacts.jsonl.gz')
+    assert report['imported'] == 1
+    assert [error['row'] for error in report['errors']] == [2, 3, 5]
+    contact, = _contacts(client)
+    assert [m['method_value'] for m in contact['methods']] == ['10001']
+
+def test_detect_format():
+    assert detect_format('a.CSV.gz') == 'csv'
+    assert detect_format('a.jsonl') == 'ndjson'
+    assert detect_format('a.xlsx') == 'xlsx'
+    assert detect_format('a.txt') is None
+    assert detect_format('a.txt', 'csv') == 'csv'
+    assert detect_format('a.csv', 'xml') is None
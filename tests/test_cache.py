@@ -0,0 +1,98 @@
+# 读缓存测试 - LRU淘汰与过期、共享缓存后端、按变更版本号分键
+import sqlite3
+import time
+
+from config import cache as cache_module
+from config.cache import LRUCache, SharedCacheBackend, get_cache
+from controller.contact_controller import (
+    create_contact,
+    get_contact_by_id,
+    get_contact_methods,
+    list_contacts
+)
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions_total'] == 1
+
+def test_lru_entries_expire():
+    cache = LRUCache(ttl=60)
+    cache.set('a', 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+class DictClient:
+    """按 get/set(key, value, ttl) 协议工作的内存客户端，模拟共享缓存"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        value, expires_at = self.entries.get(key, (None, 0))
+        return value if expires_at > time.monotonic() else None
+
+    def set(self, key, value, ttl):
+        self.entries[key] = (value.encode('utf-8'), time.monotonic() + ttl)
+
+def test_shared_backend_round_trips_json():
+    cache = SharedCacheBackend(DictClient(), ttl=60)
+    cache.set('a', {'name': '张三', 'ids': [1, 2]})
+    assert cache.get('a') == {'name': '张三', 'ids': [1, 2]}
+    cache.delete('a')
+    assert cache.get('a') is None
+    cache.set('b', 1, ttl=0)
+    assert cache.get('b') is None
+    cache.set('c', 1)
+    cache.clear()
+    assert cache.get('c') is None
+    assert (cache.stats()['hits_total'], cache.stats()['misses_total']) == (1, 3)
+
+def test_shared_backend_is_shared_between_processes(monkeypatch):
+    client = DictClient()
+    monkeypatch.setattr(cache_module, '_cache', SharedCacheBackend(client, ttl=60))
+    contact = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    assert get_contact_by_id(contact['id']) == contact
+    assert list_contacts(limit=10) == ([contact], None)
+
+    # 另一个进程的后端实例读到本进程写入的条目
+    monkeypatch.setattr(cache_module, '_cache', SharedCacheBackend(client, ttl=60))
+    assert get_contact_by_id(contact['id']) == contact
+    assert list_contacts(limit=10) == ([contact], None)
+    assert get_cache().stats()['hits_total'] == 2
+
+def test_reads_are_served_from_cache():
+    contact = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    get_contact_by_id(contact['id'])
+    hits = get_cache().stats()['hits_total']
+    assert get_contact_by_id(contact['id']) == contact
+    assert get_cache().stats()['hits_total'] == hits + 1
+
+def test_commit_from_another_process_is_visible_immediately():
+    contact = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    contact_id = contact['id']
+    for _ in range(2):
+        list_contacts(limit=10)
+        get_contact_by_id(contact_id)
+        get_contact_methods(contact_id)
+
+    # 另一个worker进程直接提交的修改（不经过本进程的缓存）
+    other = sqlite3.connect('contacts.db')
+    other.execute("UPDATE contacts SET name = 'Bob' WHERE id = ?", (contact_id,))
+    other.execute(
+        """INSERT INTO contact_methods (contact_id, method_type, method_value)
+           VALUES (?, 'email', 'bob@example.com')""",
+        (contact_id,)
+    )
+    other.commit()
+    other.close()
+
+    contacts, _ = list_contacts(limit=10)
+    assert [c['name'] for c in contacts] == ['Bob']
+    assert get_contact_by_id(contact_id)['name'] == 'Bob'
+    assert [m['method_value'] for m in get_contact_methods(contact_id)] == ['bob@example.com']
@@ -0,0 +1,70 @@
+# 响应压缩测试 - 小响应整体压缩、大文件边读边压缩、write输出
+import gzip
+
+import app as app_module
+from conftest import wait_for_job
+from config.compression import CompressionMiddleware
+from controller.contact_controller import create_contact
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+def _compression_middleware():
+    layer = app_module.app.wsgi_app
+    while not isinstance(layer, CompressionMiddleware):
+        layer = layer.wsgi_app
+    return layer
+
+def _create_contacts(count):
+    for i in range(count):
+        create_contact({'name': f'联系人{i}', 'phone': f'138{i:08d}',
+                        'email': f'user{i}@example.com'})
+
+def test_small_json_is_compressed_with_length(client):
+    _create_contacts(30)
+    plain = client.get('/api/contacts?limit=30')
+    response = client.get('/api/contacts?limit=30', headers=GZIP)
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert gzip.decompress(response.data) == plain.data
+    assert response.headers['ETag'] == 'W/' + plain.headers['ETag']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    cached = client.get('/api/contacts?limit=30',
+                        headers=dict(GZIP, **{'If-None-Match': response.headers['ETag']}))
+    assert cached.status_code == 304
+
+def test_tiny_response_is_not_compressed(client):
+    response = client.get('/api/contacts?limit=10', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+
+def test_large_job_result_is_streamed(client, monkeypatch):
+    _create_contacts(30)
+    job_id = client.get('/api/contacts/export?async=1&format=csv').get_json()['job_id']
+    assert wait_for_job(job_id)['status'] == 'succeeded'
+    url = f'/api/jobs/{job_id}/result'
+    plain = client.get(url)
+    assert int(plain.headers['Content-Length']) > 1024
+
+    monkeypatch.setattr(_compression_middleware(), 'buffer_max_size', 1024)
+    response = client.get(url, headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data) == plain.data
+
+def test_body_written_through_write_is_kept():
+    def legacy_app(environ, start_response):
+        write = start_response('200 OK', [('Content-Type', 'text/plain'),
+                                          ('Content-Length', '2000')])
+        write(b'a' * 1000)
+        return [b'b' * 1000]
+
+    middleware = CompressionMiddleware(legacy_app)
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['headers'] = dict(headers)
+
+    body = b''.join(middleware({'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip'},
+                               start_response))
+    assert captured['headers']['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == b'a' * 1000 + b'b' * 1000
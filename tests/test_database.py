@@ -0,0 +1,104 @@
+# 数据库测试 - 连接池、迁移、执行计划与写事务
+import sqlite3
+import threading
+
+import pytest
+
+from config.database import (
+    SCHEMA_VERSION,
+    ConnectionPool,
+    PoolTimeoutError,
+    check_query_plans,
+    create_connection,
+    ensure_schema,
+    get_connection,
+    get_schema_version,
+    migrate,
+    write_connection
+)
+from controller.contact_controller import create_contact
+
+def test_pool_reuses_connections_and_times_out():
+    pool = ConnectionPool('pool.db', size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    stats = pool.stats()
+    assert stats['opened_total'] == 1
+    assert stats['timeouts_total'] == 1
+    pool.close()
+
+def test_pool_nested_connection_reuses_outer():
+    pool = ConnectionPool('pool.db', size=2)
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+    assert pool.stats()['in_use'] == 0
+    pool.close()
+
+def test_single_writer_serializes_write_transactions():
+    ensure_schema()
+    order = []
+
+    def writer(name):
+        with write_connection() as conn:
+            order.append(f'{name}-begin')
+            conn.execute("INSERT INTO contacts (name, phone) VALUES (?, ?)", (name, '1'))
+            order.append(f'{name}-end')
+
+    threads = [threading.Thread(target=writer, args=(f'w{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 每个事务的开始与结束相邻，没有交错
+    assert all(order[i][:2] == order[i + 1][:2] for i in range(0, len(order), 2))
+    with get_connection() as conn:
+        assert conn.execute("SELECT count(*) FROM contacts").fetchone()[0] == 4
+
+def test_migrations_are_idempotent():
+    conn = create_connection('migrate.db')
+    assert len(migrate(conn)) == SCHEMA_VERSION
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    assert migrate(conn) == []
+    conn.close()
+
+def test_query_plans_use_indexes():
+    assert ensure_schema()
+    conn = sqlite3.connect('contacts.db')
+    try:
+        assert check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+def test_nested_write_failure_rolls_back_only_inner_block():
+    ensure_schema()
+    with write_connection() as conn:
+        conn.execute("INSERT INTO contacts (name, phone) VALUES ('outer', '1')")
+        with pytest.raises(sqlite3.IntegrityError):
+            with write_connection() as inner:
+                inner.execute("INSERT INTO contacts (name, phone) VALUES ('inner', '2')")
+                inner.execute("INSERT INTO contacts (id, name, phone) VALUES (1, 'dup', '3')")
+
+    with get_connection() as conn:
+        names = [row[0] for row in conn.execute("SELECT name FROM contacts")]
+    assert names == ['outer']
+
+def test_create_contact_with_invalid_method_leaves_no_orphans():
+    # 第二条联系方式缺少必填值，整个联系人连同已写入的联系方式一起回滚
+    result = create_contact({
+        'name': 'Ann',
+        'phone': '13800000000',
+        'methods': [
+            {'method_type': 'email', 'method_value': 'ann@example.com'},
+            {'method_type': 'email', 'method_value': None},
+        ],
+    })
+
+    assert result is None
+    with get_connection() as conn:
+        assert conn.execute("SELECT count(*) FROM contacts").fetchone()[0] == 0
+        assert conn.execute("SELECT count(*) FROM contact_methods").fetchone()[0] == 0
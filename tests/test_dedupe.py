@@ -0,0 +1,79 @@
+# 查重测试 - 规范化匹配、合并重复联系人与合并导入
+import io
+
+from controller.contact_controller import (
+    create_contact,
+    get_contact_by_id,
+    get_contact_methods,
+    update_contact
+)
+from controller.dedupe_controller import (
+    dedupe_contacts,
+    find_duplicate_clusters,
+    merge_duplicates
+)
+
+CSV_HEADER = "ID,姓名,主要电话,电子邮箱,地址,是否收藏,其他联系方式\n"
+
+def _import_csv(client, rows):
+    data = CSV_HEADER + "".join(f",{name},{phone},{email},,否,\n" for name, phone, email in rows)
+    response = client.post('/api/contacts/import?mode=upsert&format=csv', data={
+        'file': (io.BytesIO(data.encode('utf-8')), 'contacts.csv'),
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_dedupe_finds_and_merges_normalized_duplicates():
+    first = create_contact({'name': 'Ann', 'phone': '138-0000-0000'})
+    create_contact({'name': 'ann', 'phone': '+86 13800000000', 'email': 'ann@example.com'})
+    create_contact({'name': 'Bob', 'phone': '13800000000'})
+
+    report = dedupe_contacts()
+    assert report['clusters'] == 1
+    assert report['duplicates'] == 1
+    assert report['merged'] == 0
+
+    report = dedupe_contacts(merge=True)
+    assert (report['merged'], report['removed']) == (1, 1)
+    assert dedupe_contacts()['clusters'] == 0
+
+def test_merge_skips_contacts_changed_after_scan():
+    ann = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    renamed = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    edited = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    duplicate = create_contact({'name': 'Ann', 'phone': '13800000000'})
+    clusters = find_duplicate_clusters()['clusters']
+    assert clusters == [[ann['id'], renamed['id'], edited['id'], duplicate['id']]]
+
+    # 扫描之后、合并之前的修改
+    update_contact(renamed['id'], {'name': 'Bob', 'phone': '13800000000'})
+    update_contact(edited['id'], {'name': 'Ann', 'phone': '13900000000'})
+
+    assert merge_duplicates(clusters) == {'merged': 1, 'removed': 1}
+    assert get_contact_by_id(duplicate['id']) is None
+    for contact in (ann, renamed, edited):
+        assert get_contact_by_id(contact['id']) is not None
+
+def test_upsert_import_counts_only_changed_contacts(client):
+    client.post('/api/contacts', json={'name': 'Ann', 'phone': '13800000000',
+                                       'email': 'ann@example.com'})
+    client.post('/api/contacts', json={'name': 'Bob', 'phone': '13800000001'})
+
+    report = _import_csv(client, [
+        ('Ann', '13800000000', 'ann@example.com'),  # 没有新内容
+        ('Bob', '13800000001', 'bob@example.com'),  # 补齐邮箱
+        ('Cat', '13800000002', ''),
+    ])
+    assert (report['imported'], report['updated'], report['unchanged']) == (1, 1, 1)
+
+    report = _import_csv(client, [('Bob', '13800000001', 'bob@example.com')])
+    assert (report['imported'], report['updated'], report['unchanged']) == (0, 0, 1)
+
+def test_upsert_import_appends_new_numbers(client):
+    contact = create_contact({'name': 'Ann', 'phone': '13800000000',
+                              'email': 'ann@example.com'})
+
+    # 邮箱相同、号码不同：号码追加为联系方式，不新增联系人
+    report = _import_csv(client, [('Ann', '13900000000', 'ann@example.com')])
+    assert (report['imported'], report['updated'], report['methods']) == (0, 1, 1)
+    assert [m['method_value'] for m in get_contact_methods(contact['id'])] == ['13900000000']
@@ -0,0 +1,101 @@
+# Excel导入导出测试 - 只写模式流式导出、分批事务导入
+import io
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from config.database import get_connection
+from controller import contact_controller
+from controller.contact_controller import (
+    EXPORT_HEADERS,
+    create_contact,
+    get_contact_methods,
+    import_workbook,
+    write_contacts_workbook
+)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def _read_rows(data):
+    workbook = load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+def test_export_streams_workbook_with_length(client):
+    ann = create_contact({'name': 'Ann', 'phone': '13800000000', 'is_favorite': 1,
+                          'methods': [{'method_type': 'qq', 'method_value': '10001'},
+                                      {'method_type': '微信', 'method_value': 'ann'}]})
+    bob = create_contact({'name': 'Bob', 'phone': '13800000001'})
+
+    response = client.get('/api/contacts/export')
+    assert response.status_code == 200
+    assert response.mimetype == XLSX_MIMETYPE
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+    rows = _read_rows(response.data)
+    assert rows[0] == EXPORT_HEADERS
+    assert rows[1] == [ann['id'], 'Ann', '13800000000', None, None, '是',
+                       'qq: 10001; 微信: ann']
+    assert rows[2] == [bob['id'], 'Bob', '13800000001', None, None, '否', '无']
+
+def test_export_reports_progress():
+    for i in range(3):
+        create_contact({'name': f'n{i}', 'phone': f'1380000000{i}'})
+    progress = []
+    output = io.BytesIO()
+
+    assert write_contacts_workbook(output, on_progress=lambda *args: progress.append(args)) == 3
+    assert progress[-1] == (3, 3)
+    assert len(_read_rows(output.getvalue())) == 4
+
+def _workbook(rows):
+    workbook = Workbook()
+    workbook.active.append(EXPORT_HEADERS)
+    for row in rows:
+        workbook.active.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def _contact_names():
+    with get_connection() as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM contacts ORDER BY id")]
+
+def test_import_reports_skipped_rows(client):
+    data = _workbook([
+        [None, 'Ann', '13800000000', 'ann@example.com', None, '是', 'qq: 10001; 微信: ann'],
+        [None, 'NoPhone', None, None, None, '否', None],
+        [None, None, None, None, None, None, None],
+        [99, 'Bob', '13800000001', None, None, '否', '无'],
+    ])
+    response = client.post('/api/contacts/import', data={'file': (data, 'contacts.xlsx')})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['imported'], report['methods'], report['skipped']) == (2, 2, 1)
+    assert report['errors'] == [{'row': 3, 'error': '姓名和电话为必填项'}]
+
+    assert _contact_names() == ['Ann', 'Bob']
+    ann = client.get('/api/contacts?limit=1').get_json()[0]
+    assert ann['is_favorite'] == 1
+    assert [(m['method_type'], m['method_value']) for m in get_contact_methods(ann['id'])] == \
+        [('qq', '10001'), ('微信', 'ann')]
+
+def test_import_rolls_back_every_batch_on_failure(monkeypatch):
+    insert_batch = contact_controller.insert_contact_batch
+    calls = []
+
+    def fail_on_second_batch(cursor, batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise RuntimeError('磁盘已满')
+        return insert_batch(cursor, batch)
+
+    monkeypatch.setattr(contact_controller, 'insert_contact_batch', fail_on_second_batch)
+    data = _workbook([[None, f'n{i}', f'1380000000{i}'] for i in range(5)])
+    with pytest.raises(RuntimeError):
+        import_workbook(data, batch_size=2)
+    assert calls == [2, 2]
+    assert _contact_names() == []
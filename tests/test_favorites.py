@@ -0,0 +1,78 @@
+# 收藏测试 - 切换收藏、按收藏顺序分页与调整顺序
+import time
+
+from controller.contact_controller import create_contact
+
+def _favorite_ids(client, url='/api/contacts/favorites'):
+    return [c['id'] for c in client.get(url).get_json()]
+
+def _create_favorites(client, count):
+    ids = []
+    for i in range(count):
+        contact = create_contact({'name': f'n{i}', 'phone': str(i)})
+        assert client.put(f"/api/contacts/{contact['id']}/favorite").get_json()['is_favorite'] == 1
+        ids.append(contact['id'])
+    return ids
+
+def test_toggle_records_favorite_time(client):
+    contact = create_contact({'name': 'Ann', 'phone': '1'})
+    before = time.time()
+    client.put(f"/api/contacts/{contact['id']}/favorite")
+
+    favorite, = client.get('/api/contacts/favorites').get_json()
+    assert favorite['id'] == contact['id']
+    assert before <= favorite['favorited_at'] <= time.time()
+
+    assert client.put(f"/api/contacts/{contact['id']}/favorite").get_json()['is_favorite'] == 0
+    assert _favorite_ids(client) == []
+    assert client.put('/api/contacts/999/favorite').status_code == 404
+
+def test_favorites_are_paged_in_favorite_order(client):
+    ids = _create_favorites(client, 5)
+
+    pages = []
+    url = '/api/contacts/favorites?limit=2'
+    while url:
+        response = client.get(url)
+        pages.append([c['id'] for c in response.get_json()])
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/contacts/favorites?limit=2&after={cursor}' if cursor else None
+    assert pages == [ids[:2], ids[2:4], ids[4:]]
+
+    assert client.get('/api/contacts/favorites?after=nan').status_code == 400
+
+def test_move_favorite(client):
+    first, second, third = _create_favorites(client, 3)
+
+    response = client.put(f'/api/contacts/{third}/favorite/position', json={'before_id': first})
+    assert response.status_code == 200
+    assert _favorite_ids(client) == [third, first, second]
+
+    # 省略 before_id 移到末尾
+    client.put(f'/api/contacts/{third}/favorite/position', json={})
+    assert _favorite_ids(client) == [first, second, third]
+
+    # 取消后重新收藏的联系人排到末尾
+    client.put(f'/api/contacts/{first}/favorite')
+    client.put(f'/api/contacts/{first}/favorite')
+    assert _favorite_ids(client) == [second, third, first]
+
+def test_move_favorite_rejects_invalid_targets(client):
+    favorite, = _create_favorites(client, 1)
+    other = create_contact({'name': 'Bob', 'phone': '2'})
+
+    url = f'/api/contacts/{favorite}/favorite/position'
+    assert client.put(url, json={'before_id': 'x'}).status_code == 400
+    assert client.put(url, json={'before_id': other['id']}).status_code == 404
+    assert client.put(f"/api/contacts/{other['id']}/favorite/position", json={}).status_code == 404
+
+def test_repeated_moves_renumber_favorites(client):
+    first, second, third = _create_favorites(client, 3)
+
+    # 每次移动都把两个收藏之间的间隔减半，直到无法再取中间值
+    for _ in range(40):
+        client.put(f'/api/contacts/{third}/favorite/position', json={'before_id': second})
+        client.put(f'/api/contacts/{second}/favorite/position', json={'before_id': third})
+    assert _favorite_ids(client) == [first, second, third]
+    ranks = [c['favorite_rank'] for c in client.get('/api/contacts/favorites').get_json()]
+    assert ranks == sorted(set(ranks))
@@ -0,0 +1,79 @@
+# 后台任务测试 - 导出任务、崩溃后断点续传与心跳
+import json
+import os
+import time
+
+from conftest import wait_for_job
+from config.database import get_connection, write_connection
+from controller.contact_controller import create_contact
+from controller.job_controller import (
+    JOB_DIR,
+    JOB_STALE_SECONDS,
+    _touch_job,
+    get_job,
+    resume_jobs
+)
+
+CSV_HEADER = "ID,姓名,主要电话,电子邮箱,地址,是否收藏,其他联系方式\n"
+
+def _insert_job(job_id, kind, updated_at, **fields):
+    """写入一条由“已崩溃的进程”留下的未完成任务"""
+    columns = dict(fields, id=job_id, kind=kind, status='running', attempt=0,
+                   created_at=updated_at, updated_at=updated_at)
+    with write_connection() as conn:
+        conn.execute(
+            f"INSERT INTO jobs ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            list(columns.values())
+        )
+
+def _count_contacts():
+    with get_connection() as conn:
+        return conn.execute("SELECT count(*) FROM contacts").fetchone()[0]
+
+def test_export_job_writes_result_file(client):
+    create_contact({'name': 'Ann', 'phone': '13800000000'})
+    response = client.get('/api/contacts/export?async=1&format=csv')
+    assert response.status_code == 202
+
+    job = wait_for_job(response.get_json()['job_id'])
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {'exported': 1}
+    result = client.get(f"/api/jobs/{job['id']}/result")
+    assert result.status_code == 200
+    assert 'Ann' in result.get_data(as_text=True)
+
+def test_stale_import_resumes_from_checkpoint():
+    os.makedirs(JOB_DIR, exist_ok=True)
+    input_path = os.path.join(JOB_DIR, 'import_resume.csv')
+    with open(input_path, 'w', encoding='utf-8') as f:
+        f.write(CSV_HEADER)
+        for i in range(4):
+            f.write(f",n{i},1380000000{i},,,否,\n")
+
+    # 前两行已与断点一起提交，进程随后崩溃
+    for i in range(2):
+        create_contact({'name': f'n{i}', 'phone': f'1380000000{i}'})
+    report = {'imported': 2, 'updated': 0, 'methods': 0, 'skipped': 0, 'errors': []}
+    _insert_job('resume', 'import', time.time() - JOB_STALE_SECONDS - 1,
+                input_path=input_path, params=json.dumps({'format': 'csv'}),
+                checkpoint=3, result=json.dumps(report))
+
+    assert resume_jobs() == 1
+    job = wait_for_job('resume')
+    assert job['status'] == 'succeeded'
+    assert job['result']['imported'] == 4
+    assert _count_contacts() == 4
+    with get_connection() as conn:
+        assert conn.execute("SELECT attempt FROM jobs WHERE id = 'resume'").fetchone()[0] == 1
+
+def test_live_job_is_not_reclaimed():
+    _insert_job('live', 'export', time.time() - JOB_STALE_SECONDS - 1,
+                params=json.dumps({'format': 'csv', 'gzip': False}))
+    # 所在进程仍在发送心跳
+    _touch_job('live', 0)
+
+    assert get_job('live')['status'] == 'running'
+    assert resume_jobs() == 0
+    with get_connection() as conn:
+        assert conn.execute("SELECT attempt FROM jobs WHERE id = 'live'").fetchone()[0] == 0
@@ -0,0 +1,51 @@
+# 监控指标测试 - /metrics 输出、按请求统计SQL、流式正文与抽样分析
+import os
+import sys
+import threading
+
+from config import metrics
+
+ROUTE = '/api/contacts'
+
+def _queries(route):
+    """返回路由的请求数和执行的SQL总条数"""
+    _, total, count = metrics._request_queries.snapshot().get((route,), ([], 0, 0))
+    return count, total
+
+def test_metrics_endpoint_reports_requests(client):
+    client.post('/api/contacts', json={'name': 'Ann', 'phone': '1'})
+    client.get('/api/contacts/1')
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert ('contacts_http_requests_total{route="/api/contacts/<int:contact_id>",'
+            'method="GET",status="200"}') in text
+    assert 'contacts_http_request_duration_seconds_bucket' in text
+    assert 'contacts_db_pool_' in text
+    assert 'contacts_cache_' in text
+
+def test_streamed_body_is_measured_on_another_thread(client):
+    client.post('/api/contacts', json={'name': 'Ann', 'phone': '1'})
+    before = _queries(ROUTE)
+
+    response = client.get(ROUTE, buffered=False)
+    # 应用调用返回后，请求的指标不留在处理请求的线程上
+    assert getattr(metrics._local, 'stats', None) is None
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.extend(response.response))
+    reader.start()
+    reader.join()
+    response.close()
+
+    assert b''.join(chunks).startswith(b'[')
+    count, total = _queries(ROUTE)
+    assert count == before[0] + 1
+    assert total > before[1]
+    assert metrics._requests_in_flight.snapshot()[(ROUTE,)] == 0
+
+def test_sampled_request_is_profiled(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'PROFILE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    assert client.get('/api/contacts?limit=10').status_code == 200
+
+    assert sys.getprofile() is None
+    assert [name for name in os.listdir(tmp_path / 'profiles') if name.endswith('.prof')]
@@ -0,0 +1,74 @@
+# 主从复制测试 - 副本按变更日志追上主库，追上后不读到缓存中的旧数据
+import sqlite3
+
+import pytest
+
+from config.database import ConnectionPool, bind_pool, ensure_schema
+from config.replication import FileLogSource, ReplicaTailer, get_log_position
+from controller.contact_controller import (
+    create_contact,
+    delete_contact,
+    get_contact_by_id
+)
+
+# 主库文件（副本使用测试目录中的默认数据库）
+PRIMARY_DB = 'primary.db'
+
+@pytest.fixture
+def primary():
+    """返回在主库上执行控制器函数的 run(func, *args)"""
+    ensure_schema(PRIMARY_DB)
+    pool = ConnectionPool(PRIMARY_DB)
+
+    def run(func, *args):
+        bind_pool(pool)
+        try:
+            return func(*args)
+        finally:
+            bind_pool(None)
+
+    yield run
+    pool.close()
+
+@pytest.fixture
+def tailer():
+    """初始化副本并返回同步器"""
+    tailer = ReplicaTailer(FileLogSource(PRIMARY_DB))
+    tailer.prepare()
+    return tailer
+
+def test_replica_catches_up_with_primary(primary, tailer):
+    ann = primary(create_contact, {'name': 'Ann', 'phone': '1',
+                                   'methods': [{'method_type': 'qq', 'method_value': '10001'}]})
+    bob = primary(create_contact, {'name': 'Bob', 'phone': '2'})
+    position = tailer.catch_up()
+    assert position == primary(get_log_position)
+    assert get_log_position() == position
+    assert get_contact_by_id(ann['id'])['name'] == 'Ann'
+
+    primary(delete_contact, bob['id'])
+    tailer.catch_up()
+    assert get_contact_by_id(bob['id']) is None
+
+def test_replica_read_after_catch_up_skips_warm_cache(primary, tailer, client):
+    contact = primary(create_contact, {'name': 'Ann', 'phone': '1'})
+    tailer.catch_up()
+    url = f"/api/contacts/{contact['id']}"
+    for _ in range(2):
+        response = client.get(url)
+        etag = response.headers['ETag']
+        client.get('/api/contacts?limit=10')
+    assert response.get_json()['name'] == 'Ann'
+
+    # 主库在另一个进程中提交修改，副本进程的缓存不会收到任何通知
+    conn = sqlite3.connect(PRIMARY_DB)
+    conn.execute("UPDATE contacts SET name = 'Bob' WHERE id = ?", (contact['id'],))
+    conn.commit()
+    conn.close()
+    tailer.catch_up()
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'Bob'
+    assert response.headers['ETag'] != etag
+    assert [c['name'] for c in client.get('/api/contacts?limit=10').get_json()] == ['Bob']
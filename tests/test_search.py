@@ -0,0 +1,36 @@
+# 全文搜索测试 - trigram子串匹配、短词逐行匹配与号码尾号
+from controller.contact_controller import create_contact, search_contacts
+
+def _names(q):
+    return [contact['name'] for contact in search_contacts(q)]
+
+def test_search_matches_middle_of_chinese_name():
+    create_contact({'name': '张三', 'phone': '13800000001'})
+    create_contact({'name': '李小明', 'phone': '13800000002'})
+    create_contact({'name': '王五', 'phone': '13800000003', 'address': '三里屯'})
+
+    # 姓名命中的排在地址命中之前
+    assert _names('三') == ['张三', '王五']
+    assert _names('小') == ['李小明']
+    assert _names('小明') == ['李小明']
+    assert _names('李小明') == ['李小明']
+    assert _names('赵') == []
+
+def test_search_matches_phone_suffix_and_methods():
+    create_contact({'name': 'Ann', 'phone': '138-0000-1234', 'email': 'ann@example.com',
+                    'methods': [{'method_type': 'qq', 'method_value': '987654'}]})
+    create_contact({'name': 'Bob', 'phone': '13900005678'})
+
+    assert _names('1234') == ['Ann']
+    assert sorted(_names('0000')) == ['Ann', 'Bob']
+    assert _names('7654') == ['Ann']
+    assert _names('example') == ['Ann']
+
+def test_search_combines_long_and_short_tokens():
+    create_contact({'name': 'Ann Lee', 'phone': '13800000001'})
+    create_contact({'name': 'Ann Wu', 'phone': '13800000002'})
+
+    assert _names('an') == ['Ann Lee', 'Ann Wu']
+    assert _names('ANN wu') == ['Ann Wu']
+    assert _names('lee 01') == ['Ann Lee']
+    assert _names('  ') == []
@@ -0,0 +1,125 @@
+# ASGI桥接测试 - 请求往返、流式正文分块发送、生命周期事件与关闭
+import asyncio
+import copy
+import json
+
+import pytest
+
+import app as app_module
+from config import admission, database
+from config.admission import ConcurrencyLimiter
+from config.server import AsgiBridge
+from controller import contact_controller
+
+@pytest.fixture
+def bridge(monkeypatch):
+    """两个线程的桥接器，它对准入限额的调整只在本测试内有效"""
+    settings = copy.deepcopy(admission._settings)
+    limiters = {
+        name: ConcurrencyLimiter(s['concurrency'], s['queue'], s['timeout'])
+        for name, s in settings.items()
+    }
+    monkeypatch.setattr(admission, '_settings', settings)
+    monkeypatch.setattr(admission, '_limiters', limiters)
+    bridge = AsgiBridge(app_module.app, threads=2)
+    yield bridge
+    bridge.executor.shutdown(wait=True)
+
+def _inbox(*messages):
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    return queue.get
+
+async def _request(bridge, method, path, query=b'', body=b'', headers=()):
+    """发送一个请求（正文分两块），返回状态码、响应头和各正文消息"""
+    half = len(body) // 2
+    receive = _inbox(
+        {'type': 'http.request', 'body': body[:half], 'more_body': True},
+        {'type': 'http.request', 'body': body[half:], 'more_body': False},
+    )
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'query_string': query, 'headers': list(headers)}
+    await asyncio.wait_for(bridge(scope, receive, send), 10)
+    start, bodies = sent[0], sent[1:]
+    assert start['type'] == 'http.response.start'
+    assert bodies[-1]['more_body'] is False
+    return start['status'], dict(start['headers']), [m['body'] for m in bodies]
+
+def test_request_round_trip(bridge):
+    body = json.dumps({'name': 'Ann', 'phone': '13800000000'}).encode('utf-8')
+
+    async def main():
+        created = await _request(bridge, 'POST', '/api/contacts', body=body,
+                                 headers=[(b'content-type', b'application/json')])
+        listed = await _request(bridge, 'GET', '/api/contacts', query=b'limit=10')
+        return created, listed
+
+    created, listed = asyncio.run(main())
+    assert created[0] == 201
+    status, headers, chunks = listed
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert [c['name'] for c in json.loads(b''.join(chunks))] == ['Ann']
+
+def test_streamed_body_is_sent_in_chunks(bridge, monkeypatch):
+    monkeypatch.setattr(contact_controller, 'STREAM_FETCH_SIZE', 1)
+    for i in range(3):
+        contact_controller.create_contact({'name': f'n{i}', 'phone': str(i)})
+
+    status, _, chunks = asyncio.run(_request(bridge, 'GET', '/api/contacts'))
+    assert status == 200
+    # 每批一条消息，另有结束消息
+    assert len([c for c in chunks if c]) >= 4
+    assert [c['name'] for c in json.loads(b''.join(chunks))] == ['n0', 'n1', 'n2']
+
+def test_lifespan_shutdown_waits_for_requests(bridge):
+    events = []
+
+    async def main():
+        receive = asyncio.Queue()
+        receive.put_nowait({'type': 'lifespan.startup'})
+
+        async def send_event(message):
+            events.append(message['type'])
+
+        lifespan = asyncio.create_task(bridge({'type': 'lifespan'}, receive.get, send_event))
+
+        # 客户端接收慢，关闭开始时请求仍在发送响应
+        async def slow_send(message):
+            await asyncio.sleep(0.05)
+            events.append(message['type'])
+
+        request = asyncio.create_task(bridge(
+            {'type': 'http', 'method': 'GET', 'path': '/api/contacts',
+             'query_string': b'limit=1', 'headers': []},
+            _inbox({'type': 'http.request', 'body': b'', 'more_body': False}),
+            slow_send,
+        ))
+        await asyncio.sleep(0.02)
+        receive.put_nowait({'type': 'lifespan.shutdown'})
+        await asyncio.wait_for(asyncio.gather(lifespan, request), 10)
+
+    asyncio.run(main())
+    assert events[0] == 'lifespan.startup.complete'
+    assert events[-1] == 'lifespan.shutdown.complete'
+    assert events.count('http.response.body') >= 1
+    # 请求结束后才关闭连接，不留下打开的连接
+    assert database._pool.stats()['open'] == 0
+
+def test_shutdown_without_requests_does_not_create_database(bridge, workdir):
+    receive = _inbox({'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'})
+    events = []
+
+    async def send(message):
+        events.append(message['type'])
+
+    asyncio.run(bridge({'type': 'lifespan'}, receive, send))
+    assert events == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert database._pool is None
+    assert not (workdir / 'contacts.db').exists()
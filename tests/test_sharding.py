@@ -0,0 +1,64 @@
+# 多租户分片测试 - 按 X-Tenant-ID 隔离数据、缓存与分片文件，分片连接池的淘汰
+import os
+import threading
+
+import pytest
+
+from config import database
+from config.database import PoolTimeoutError
+from config.sharding import ShardRouter
+
+def _headers(tenant):
+    return {'X-Tenant-ID': tenant}
+
+def test_tenants_use_separate_shards(client):
+    client.post('/api/contacts', json={'name': 'Ann', 'phone': '1'}, headers=_headers('acme'))
+    client.post('/api/contacts', json={'name': 'Bob', 'phone': '2'}, headers=_headers('beta'))
+
+    assert os.path.exists(os.path.join('shards', 'acme.db'))
+    assert os.path.exists(os.path.join('shards', 'beta.db'))
+    assert client.get('/api/contacts?limit=10').get_json() == []
+    # 两个分片中ID相同的联系人不会在读缓存中互相命中
+    for tenant, name in (('acme', 'Ann'), ('beta', 'Bob'), ('acme', 'Ann')):
+        response = client.get('/api/contacts/1', headers=_headers(tenant))
+        assert response.get_json()['name'] == name
+
+def test_invalid_tenant_is_rejected(client):
+    for tenant in ('../etc', 'a' * 65, '-x'):
+        assert client.get('/api/contacts', headers=_headers(tenant)).status_code == 400
+
+def test_reopened_shard_keeps_a_single_writer():
+    router = ShardRouter(max_open=1)
+    old_pool = router.get_pool('acme')
+    router.get_pool('beta')
+    new_pool = router.get_pool('acme')
+    assert new_pool is not old_pool
+
+    # 请求仍在使用被淘汰的旧连接池写入时，新连接池的写入要排队
+    writing, done = threading.Event(), threading.Event()
+
+    def write_with_old_pool():
+        with old_pool.write_connection():
+            writing.set()
+            done.wait()
+
+    writer = threading.Thread(target=write_with_old_pool)
+    writer.start()
+    writing.wait()
+    new_pool.timeout = 0.05
+    try:
+        with pytest.raises(PoolTimeoutError):
+            with new_pool.write_connection(separate=True):
+                pass
+    finally:
+        done.set()
+        writer.join()
+        router.close_all()
+
+def test_ready_databases_are_bounded(monkeypatch):
+    monkeypatch.setattr(database, 'READY_DATABASES_MAX', 2)
+    router = ShardRouter()
+    for tenant in ('a1', 'a2', 'a3'):
+        router.get_pool(tenant)
+    assert len(database._ready_databases) == 2
+    router.close_all()
@@ -0,0 +1,46 @@
+# 启动测试 - 导入和创建应用不访问数据库、不加载openpyxl，启动任务每个数据库一次
+import json
+import subprocess
+import sys
+
+import app as app_module
+from conftest import ROOT_DIR
+from config import database
+
+# 在新进程中导入应用，输出导入后的状态
+_PROBE = """
+import json, os, sys
+sys.path.insert(0, os.path.join({root!r}, 'src'))
+import app
+print(json.dumps({{
+    'openpyxl': 'openpyxl' in sys.modules,
+    'pool': sys.modules['config.database']._pool is not None,
+}}))
+"""
+
+def test_import_is_lazy(workdir):
+    completed = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(root=ROOT_DIR)],
+        cwd=workdir, capture_output=True, text=True, check=True
+    )
+    state = json.loads(completed.stdout.splitlines()[-1])
+    assert state == {'openpyxl': False, 'pool': False}
+    assert list(workdir.iterdir()) == []
+
+def test_create_app_does_not_open_database(workdir):
+    app_module.create_app()
+    assert database._pool is None
+    assert not (workdir / 'contacts.db').exists()
+
+def test_startup_tasks_run_once_per_database(client, monkeypatch, workdir):
+    calls = []
+    monkeypatch.setattr(app_module, 'resume_jobs', lambda: calls.append(1))
+
+    for _ in range(2):
+        assert client.get('/api/contacts?limit=1').status_code == 200
+    assert (workdir / 'contacts.db').exists()
+    assert calls == [1]
+
+    # 另一个租户分片单独执行一次
+    client.get('/api/contacts?limit=1', headers={'X-Tenant-ID': 'acme'})
+    assert calls == [1, 1]
@@ -0,0 +1,61 @@
+# 流式列表测试 - 分批输出JSON数组与NDJSON、归并联系方式、提前关闭归还连接
+import json
+
+from config.database import get_pool
+from controller import contact_controller
+from controller.contact_controller import create_contact
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+def _create_contacts(count):
+    contacts = []
+    for i in range(count):
+        # 只有偶数号联系人有联系方式
+        methods = [{'method_type': 'qq', 'method_value': f'1000{i}'}] if i % 2 == 0 else []
+        contacts.append(create_contact({'name': f'n{i}', 'phone': f'1380000000{i}',
+                                        'methods': methods}))
+    return contacts
+
+def test_unpaged_list_is_streamed_in_batches(client, monkeypatch):
+    monkeypatch.setattr(contact_controller, 'STREAM_FETCH_SIZE', 2)
+    _create_contacts(5)
+
+    response = client.get('/api/contacts?include=methods', buffered=False)
+    assert 'Content-Length' not in response.headers
+    assert 'Accept' in response.headers['Vary']
+    chunks = list(response.response)
+    response.close()
+    # '['、3批联系人、']'
+    assert len(chunks) == 5
+
+    contacts = json.loads(b''.join(chunks))
+    assert [c['name'] for c in contacts] == [f'n{i}' for i in range(5)]
+    assert [[m['method_value'] for m in c['methods']] for c in contacts] == \
+        [['10000'], [], ['10002'], [], ['10004']]
+
+def test_filtered_stream_skips_other_contacts_methods(client):
+    _create_contacts(5)
+    contacts = client.get('/api/contacts?include=methods&after_id=3').get_json()
+    assert [(c['name'], len(c['methods'])) for c in contacts] == [('n3', 0), ('n4', 1)]
+
+def test_ndjson_lists(client):
+    _create_contacts(3)
+    for url in ('/api/contacts', '/api/contacts?limit=2'):
+        response = client.get(url, headers=NDJSON)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        names = [json.loads(line)['name'] for line in lines]
+        assert names == ['n0', 'n1', 'n2'][:len(names)]
+        assert len(names) == (3 if url == '/api/contacts' else 2)
+
+def test_closing_stream_early_returns_connection(client, monkeypatch):
+    monkeypatch.setattr(contact_controller, 'STREAM_FETCH_SIZE', 1)
+    _create_contacts(3)
+    response = client.get('/api/contacts', buffered=False)
+    chunks = iter(response.response)
+    next(chunks)
+    next(chunks)
+    assert get_pool().stats()['in_use'] == 1
+
+    response.close()
+    assert get_pool().stats()['in_use'] == 0